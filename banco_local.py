@@ -0,0 +1,816 @@
+# Standard Library
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from enum import Enum
+import heapq
+import json
+import queue
+import sqlite3
+import threading
+import uuid
+
+# Banco de Dados
+from firestore_adiado import excecoes, firestore
+
+
+_AUSENTE = object()  # Campo inexistente (diferente de um campo com valor None)
+LIMITE_ESCRITAS_BATCH = 500  # Como no Firestore (o mesmo saldos.LIMITE_BATCH)
+
+
+## ---> VALORES, ORDENAÇÃO E FILTROS <--- ##
+def _agora():
+    return datetime.now(timezone.utc)
+
+
+def _normalizar(valor):
+    """Deixa o valor como o Firestore devolveria (datetimes sempre com fuso)"""
+    if isinstance(valor, datetime) and valor.tzinfo is None:
+        return valor.replace(tzinfo=timezone.utc)
+    if isinstance(valor, dict):
+        return {chave: _normalizar(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar(item) for item in valor]
+    return valor
+
+
+def _copiar(valor):
+    # Cópia só de dicts/listas: o resto é imutável
+    if isinstance(valor, dict):
+        return {chave: _copiar(item) for chave, item in valor.items()}
+    if isinstance(valor, list):
+        return [_copiar(item) for item in valor]
+    return valor
+
+
+def chave_valor(valor):
+    """Chave comparável que segue a ordem de tipos do Firestore"""
+    if valor is None:
+        return (0, 0)
+    if isinstance(valor, bool):
+        return (1, valor)
+    if isinstance(valor, (int, float)):
+        return (2, valor)
+    if isinstance(valor, datetime):
+        return (3, _normalizar(valor).timestamp())
+    if isinstance(valor, str):
+        return (4, valor)
+    if isinstance(valor, bytes):
+        return (5, valor)
+    if isinstance(valor, (list, tuple)):
+        return (8, tuple(chave_valor(item) for item in valor))
+    if isinstance(valor, dict):
+        return (9, tuple(sorted((chave, chave_valor(item)) for chave, item in valor.items())))
+    return (10, str(valor))
+
+
+def _obter(dados, caminho):
+    atual = dados
+    for parte in caminho.split('.'):
+        if not isinstance(atual, dict) or parte not in atual:
+            return _AUSENTE
+        atual = atual[parte]
+    return atual
+
+
+def _corresponde(dados, campo, operador, valor):
+    atual = _obter(dados, campo)
+    if atual is _AUSENTE:
+        return False
+
+    chave = chave_valor(atual)
+    if operador == '==':
+        return chave == chave_valor(valor)
+    if operador == '!=':
+        return chave != chave_valor(valor)
+    if operador == 'in':
+        return any(chave == chave_valor(item) for item in valor)
+    if operador == 'not-in':
+        return all(chave != chave_valor(item) for item in valor)
+    if operador == 'array_contains':
+        return isinstance(atual, list) and any(chave_valor(item) == chave_valor(valor) for item in atual)
+    if operador == 'array_contains_any':
+        alvos = {chave_valor(item) for item in valor}
+        return isinstance(atual, list) and any(chave_valor(item) in alvos for item in atual)
+
+    # Comparações de intervalo só valem entre valores do mesmo tipo
+    referencia = chave_valor(valor)
+    if chave[0] != referencia[0]:
+        return False
+    if operador == '<':
+        return chave < referencia
+    if operador == '<=':
+        return chave <= referencia
+    if operador == '>':
+        return chave > referencia
+    if operador == '>=':
+        return chave >= referencia
+    raise ValueError(f"Operador não suportado: {operador}")
+
+
+class _Ordem:
+    """Chave de ordenação de um documento para uma lista de order_by"""
+    __slots__ = ('valores', 'direcoes')
+
+    def __init__(self, valores, direcoes):
+        self.valores = valores
+        self.direcoes = direcoes
+
+    def __lt__(self, outra):
+        for valor, outro, descendente in zip(self.valores, outra.valores, self.direcoes):
+            if valor != outro:
+                return (valor > outro) if descendente else (valor < outro)
+        return False
+
+    def __eq__(self, outra):
+        return self.valores == outra.valores
+
+
+## ---> DOCUMENTOS <--- ##
+class TipoAlteracao(Enum):
+    """Mesmos nomes do ChangeType do Firestore (change.type.name)"""
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class AlteracaoLocal:
+    def __init__(self, tipo, documento, old_index, new_index):
+        self.type = tipo
+        self.document = documento
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+class InstantaneoLocal:
+    """Equivalente ao DocumentSnapshot"""
+
+    def __init__(self, referencia, dados, campos=None):
+        self.reference = referencia
+        self._dados = dados
+        self._campos = campos
+        self.read_time = _agora()
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._dados is not None
+
+    def to_dict(self):
+        if self._dados is None:
+            return None
+        if self._campos is None:
+            return _copiar(self._dados)
+        return {campo: _copiar(self._dados[campo]) for campo in self._campos if campo in self._dados}
+
+    def get(self, campo):
+        valor = _obter(self._dados or {}, campo)
+        if valor is _AUSENTE:
+            raise KeyError(campo)
+        return _copiar(valor)
+
+
+class DocumentoLocal:
+    """Equivalente ao DocumentReference"""
+
+    def __init__(self, banco, colecao, id_documento):
+        self._banco = banco
+        self._colecao = colecao
+        self.id = id_documento
+
+    @property
+    def path(self):
+        return f"{self._colecao}/{self.id}"
+
+    @property
+    def parent(self):
+        return self._banco.collection(self._colecao)
+
+    def __eq__(self, outro):
+        return isinstance(outro, DocumentoLocal) and outro.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, field_paths=None, transaction=None):
+        return self._banco._ler(self, field_paths)
+
+    def _escrever(self, metodo, *args, **kwargs):
+        batch = self._banco.batch()
+        getattr(batch, metodo)(self, *args, **kwargs)
+        return batch.commit()[0]
+
+    def set(self, dados, merge=False):
+        return self._escrever('set', dados, merge=merge)
+
+    def create(self, dados):
+        return self._escrever('create', dados)
+
+    def update(self, dados):
+        return self._escrever('update', dados)
+
+    def delete(self):
+        return self._escrever('delete')
+
+
+## ---> CONSULTAS <--- ##
+class ResultadoAgregacao:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+        self.read_time = _agora()
+
+
+class AgregacaoLocal:
+    """Equivalente à AggregationQuery (sum/count)"""
+
+    def __init__(self, consulta, funcao, campo, alias):
+        self._consulta = consulta
+        self._funcao = funcao
+        self._campo = campo
+        self._alias = alias
+
+    def get(self, transaction=None):
+        banco = self._consulta._banco
+        with banco._lock:
+            itens = banco._executar(self._consulta)
+            # Agregações cobram uma leitura a cada 1000 entradas de índice
+            banco.leituras += max(1, (len(itens) + 999) // 1000)
+
+        if self._funcao == 'count':
+            valor = len(itens)
+        else:
+            valor = 0
+            for _, _, dados in itens:
+                numero = _obter(dados, self._campo)
+                if isinstance(numero, (int, float)) and not isinstance(numero, bool):
+                    valor += numero
+        return [[ResultadoAgregacao(self._alias, valor)]]
+
+
+class ConsultaLocal:
+    """Equivalente à Query: cada método devolve uma nova consulta"""
+
+    def __init__(self, banco, colecao, filtros=(), ordem=(), limite=None, cursor=None, campos=None):
+        self._banco = banco
+        self._colecao = colecao
+        self._filtros = tuple(filtros)
+        self._ordem = tuple(ordem)
+        self._limite = limite
+        self._cursor = cursor
+        self._campos = campos
+
+    def _copia(self, **alteracoes):
+        atributos = {
+            'filtros': self._filtros, 'ordem': self._ordem, 'limite': self._limite,
+            'cursor': self._cursor, 'campos': self._campos
+        }
+        atributos.update(alteracoes)
+        return ConsultaLocal(self._banco, self._colecao, **atributos)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copia(filtros=self._filtros + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        descendente = direction == firestore.Query.DESCENDING
+        return self._copia(ordem=self._ordem + ((field_path, descendente),))
+
+    def limit(self, count):
+        return self._copia(limite=count)
+
+    def start_after(self, documento):
+        return self._copia(cursor=documento)
+
+    def select(self, field_paths):
+        return self._copia(campos=tuple(field_paths))
+
+    def sum(self, field_ref, alias=None):
+        return AgregacaoLocal(self, 'sum', field_ref, alias)
+
+    def count(self, alias=None):
+        return AgregacaoLocal(self, 'count', None, alias)
+
+    def stream(self, transaction=None):
+        return iter(self.get())
+
+    def get(self, transaction=None):
+        return self._banco._consultar(self)
+
+    def on_snapshot(self, callback):
+        return self._banco._ouvir(self, callback)
+
+    # --- Avaliação ---
+    def _aceita(self, dados):
+        return all(_corresponde(dados, *filtro) for filtro in self._filtros)
+
+    def _chave(self, id_documento, dados):
+        """_Ordem do documento, ou None se faltar algum campo do order_by"""
+        valores, direcoes = [], []
+        for campo, descendente in self._ordem:
+            valor = _obter(dados, campo)
+            if valor is _AUSENTE:
+                return None
+            valores.append(chave_valor(valor))
+            direcoes.append(descendente)
+        # Desempate pelo ID, na direção do último order_by (como no Firestore)
+        valores.append(id_documento)
+        direcoes.append(direcoes[-1] if direcoes else False)
+        return _Ordem(tuple(valores), tuple(direcoes))
+
+    def _chave_cursor(self):
+        if self._cursor is None:
+            return None
+        if isinstance(self._cursor, InstantaneoLocal):
+            return self._chave(self._cursor.id, self._cursor._dados or {})
+        return self._chave(self._cursor.get('id', ''), self._cursor)
+
+
+class ColecaoLocal(ConsultaLocal):
+    """Equivalente à CollectionReference"""
+
+    def __init__(self, banco, nome):
+        super().__init__(banco, nome)
+        self.id = nome
+
+    def document(self, document_id=None):
+        return DocumentoLocal(self._banco, self._colecao, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, dados):
+        referencia = self.document()
+        return referencia.set(dados).update_time, referencia
+
+
+## ---> ESCRITAS <--- ##
+class ResultadoEscrita:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class BatchLocal:
+    """Equivalente ao WriteBatch: tudo ou nada, aplicado no commit()"""
+
+    def __init__(self, banco):
+        self._banco = banco
+        self._escritas = []
+
+    def __len__(self):
+        return len(self._escritas)
+
+    def set(self, referencia, dados, merge=False):
+        self._escritas.append(('set', referencia, dados, merge))
+        return self
+
+    def create(self, referencia, dados):
+        self._escritas.append(('create', referencia, dados, False))
+        return self
+
+    def update(self, referencia, dados):
+        self._escritas.append(('update', referencia, dados, True))
+        return self
+
+    def delete(self, referencia):
+        self._escritas.append(('delete', referencia, None, False))
+        return self
+
+    def commit(self):
+        escritas, self._escritas = self._escritas, []
+        if len(escritas) > LIMITE_ESCRITAS_BATCH:
+            # O Firestore recusa o commit inteiro; aqui o erro aparece já nos testes locais
+            raise excecoes.InvalidArgument(
+                f"Batch com {len(escritas)} escritas (máximo {LIMITE_ESCRITAS_BATCH})")
+        return self._banco._aplicar(escritas)
+
+
+def _aplicar_campos(base, dados, caminhos, agora):
+    """Aplica dados (com Increment/ArrayUnion/...) sobre uma cópia de base"""
+    resultado = _copiar(base)
+    for chave, valor in dados.items():
+        partes = chave.split('.') if caminhos else [chave]
+        alvo = resultado
+        for parte in partes[:-1]:
+            if not isinstance(alvo.get(parte), dict):
+                alvo[parte] = {}
+            alvo = alvo[parte]
+        campo = partes[-1]
+        atual = alvo.get(campo)
+
+        if valor is firestore.DELETE_FIELD:
+            alvo.pop(campo, None)
+        elif valor is firestore.SERVER_TIMESTAMP:
+            alvo[campo] = agora
+        elif isinstance(valor, firestore.Increment):
+            numerico = isinstance(atual, (int, float)) and not isinstance(atual, bool)
+            alvo[campo] = (atual if numerico else 0) + valor.value
+        elif isinstance(valor, firestore.ArrayUnion):
+            lista = list(atual) if isinstance(atual, list) else []
+            for item in valor.values:
+                if all(chave_valor(item) != chave_valor(existente) for existente in lista):
+                    lista.append(_normalizar(item))
+            alvo[campo] = lista
+        elif isinstance(valor, firestore.ArrayRemove):
+            removidos = {chave_valor(item) for item in valor.values}
+            lista = atual if isinstance(atual, list) else []
+            alvo[campo] = [item for item in lista if chave_valor(item) not in removidos]
+        elif isinstance(valor, dict) and not caminhos:
+            # set(merge=True) mescla mapas aninhados (que também podem ter Increment etc.)
+            alvo[campo] = _aplicar_campos(atual if isinstance(atual, dict) else {}, valor, False, agora)
+        else:
+            alvo[campo] = _normalizar(_copiar(valor))
+    return resultado
+
+
+## ---> LISTENERS <--- ##
+class _Ouvinte:
+    """Estado de um on_snapshot: resultado atual da consulta, em ordem"""
+
+    def __init__(self, banco, consulta, callback):
+        self.banco = banco
+        self.consulta = consulta
+        self.callback = callback
+        self.ativo = True
+        self.chaves = []   # _Ordem de cada documento do resultado, em ordem
+        self.dados = {}    # id -> dados
+
+    def unsubscribe(self):
+        self.ativo = False
+        self.banco._parar_de_ouvir(self)
+
+    def carregar(self, itens):
+        self.chaves = [chave for chave, _, _ in itens]
+        self.dados = {id_documento: dados for _, id_documento, dados in itens}
+
+    def instantaneos(self):
+        return [self.banco._instantaneo(self.consulta, ordem.valores[-1], self.dados[ordem.valores[-1]])
+                for ordem in self.chaves]
+
+    def atualizar(self, alterados):
+        """Aplica {id: dados_novos ou None}; retorna as AlteracaoLocal geradas"""
+        consulta = self.consulta
+        antes = dict(self.dados)
+        indices_antigos = {id_documento: self._indice(id_documento)
+                           for id_documento in alterados if id_documento in antes}
+        janela_cheia = consulta._limite is not None and len(self.chaves) >= consulta._limite
+
+        for id_documento in indices_antigos:
+            self._remover(id_documento)
+
+        cursor = consulta._chave_cursor()
+        for id_documento, dados in alterados.items():
+            if dados is None or not consulta._aceita(dados):
+                continue
+            chave = consulta._chave(id_documento, dados)
+            if chave is None or (cursor is not None and not cursor < chave):
+                continue
+            insort(self.chaves, chave)
+            self.dados[id_documento] = dados
+
+        if consulta._limite is not None:
+            if len(self.chaves) < consulta._limite and janela_cheia:
+                # Saiu alguém de uma janela cheia: relê para completar
+                self.carregar(self.banco._executar(consulta))
+            for chave in self.chaves[consulta._limite:]:
+                del self.dados[chave.valores[-1]]
+            del self.chaves[consulta._limite:]
+
+        # Alterados primeiro; depois quem entrou/saiu da janela de um limit()
+        ids = list(alterados) + [
+            id_documento for id_documento in set(antes) ^ set(self.dados)
+            if id_documento not in alterados
+        ]
+        alteracoes = []
+        for id_documento in ids:
+            if id_documento in antes and id_documento in self.dados:
+                if id_documento not in alterados:
+                    continue
+                tipo = TipoAlteracao.MODIFIED
+            elif id_documento in self.dados:
+                tipo = TipoAlteracao.ADDED
+            elif id_documento in antes:
+                tipo = TipoAlteracao.REMOVED
+            else:
+                continue
+
+            depois = id_documento in self.dados
+            dados = self.dados[id_documento] if depois else antes[id_documento]
+            alteracoes.append(AlteracaoLocal(
+                tipo, self.banco._instantaneo(consulta, id_documento, dados),
+                indices_antigos.get(id_documento, -1),
+                self._indice(id_documento) if depois else -1))
+        return alteracoes
+
+    def _indice(self, id_documento):
+        dados = self.dados[id_documento]
+        chave = self.consulta._chave(id_documento, dados)
+        return bisect_left(self.chaves, chave)
+
+    def _remover(self, id_documento):
+        posicao = self._indice(id_documento)
+        del self.chaves[posicao]
+        del self.dados[id_documento]
+
+
+## ---> BANCO <--- ##
+class BancoLocal:
+    """Banco em processo com a mesma interface do cliente do Firestore
+
+    Implementa collection/document/where/order_by/limit/start_after/select,
+    stream/get, batch, sum/count e on_snapshot sobre dicionários em memória.
+    Com 'caminho' os documentos também são gravados num arquivo SQLite e
+    recarregados ao abrir, o que permite usar o app sem projeto no Firebase.
+    Os callbacks de on_snapshot rodam numa thread própria, como no Firestore.
+    'leituras' e 'escritas' contam documentos como o Firestore cobraria.
+    """
+
+    def __init__(self, caminho=None):
+        self._lock = threading.RLock()
+        self._colecoes = {}   # nome -> {id: dados}
+        self._indices = {}    # (colecao, campo) -> {chave_valor: set(ids)}
+        self._ordenacoes = {} # (colecao, order_bys) -> (consulta, [_Ordem] em ordem)
+        self._ouvintes = {}   # colecao -> [_Ouvinte]
+        self._fila = queue.Queue()
+        self._thread = None
+        self._conn = None
+        self.leituras = 0
+        self.escritas = 0
+        if caminho:
+            self._abrir(caminho)
+
+    # --- Interface do cliente do Firestore ---
+    def collection(self, nome):
+        return ColecaoLocal(self, nome)
+
+    def batch(self):
+        return BatchLocal(self)
+
+    def close(self):
+        self._fila.put(None)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # --- Persistência (opcional) ---
+    def _abrir(self, caminho):
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documentos (
+                colecao TEXT NOT NULL,
+                id TEXT NOT NULL,
+                dados TEXT NOT NULL,
+                PRIMARY KEY (colecao, id)
+            )
+        """)
+        for colecao, id_documento, dados in self._conn.execute(
+                "SELECT colecao, id, dados FROM documentos"):
+            self._colecoes.setdefault(colecao, {})[id_documento] = json.loads(dados, object_hook=_decodificar)
+
+    def _persistir(self, gravados):
+        if self._conn is None:
+            return
+        self._conn.execute("BEGIN")
+        try:
+            for (colecao, id_documento), dados in gravados.items():
+                if dados is None:
+                    self._conn.execute(
+                        "DELETE FROM documentos WHERE colecao = ? AND id = ?", (colecao, id_documento))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO documentos (colecao, id, dados) VALUES (?, ?, ?)",
+                        (colecao, id_documento, json.dumps(dados, default=_codificar)))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    # --- Leitura ---
+    def _instantaneo(self, consulta, id_documento, dados):
+        referencia = DocumentoLocal(self, consulta._colecao, id_documento)
+        return InstantaneoLocal(referencia, dados, consulta._campos)
+
+    def _ler(self, referencia, campos=None):
+        with self._lock:
+            self.leituras += 1
+            dados = self._colecoes.get(referencia._colecao, {}).get(referencia.id)
+        return InstantaneoLocal(referencia, dados, tuple(campos) if campos else None)
+
+    def _ids_por_valor(self, colecao, campo, valor):
+        """IDs com campo == valor, por um índice criado no primeiro uso"""
+        indice = self._indices.get((colecao, campo))
+        if indice is None:
+            indice = {}
+            for id_documento, dados in self._colecoes.get(colecao, {}).items():
+                atual = _obter(dados, campo)
+                if atual is not _AUSENTE:
+                    indice.setdefault(chave_valor(atual), set()).add(id_documento)
+            self._indices[(colecao, campo)] = indice
+        return indice.get(chave_valor(valor), set())
+
+    def _ordenacao(self, consulta):
+        """Chaves da coleção já na ordem dos order_by da consulta, criadas no primeiro uso"""
+        chave_indice = (consulta._colecao, consulta._ordem)
+        if chave_indice not in self._ordenacoes:
+            modelo = ConsultaLocal(self, consulta._colecao, ordem=consulta._ordem)
+            chaves = []
+            for id_documento, dados in self._colecoes.get(consulta._colecao, {}).items():
+                chave = modelo._chave(id_documento, dados)
+                if chave is not None:
+                    chaves.append(chave)
+            chaves.sort()
+            self._ordenacoes[chave_indice] = (modelo, chaves)
+        return self._ordenacoes[chave_indice][1]
+
+    def _executar(self, consulta):
+        """Avalia a consulta e retorna [(chave, id, dados)] em ordem (com o lock)"""
+        documentos = self._colecoes.get(consulta._colecao, {})
+
+        candidatos = None
+        for campo, operador, valor in consulta._filtros:
+            if operador == '==':
+                ids = self._ids_por_valor(consulta._colecao, campo, valor)
+                candidatos = set(ids) if candidatos is None else candidatos & ids
+
+        if candidatos is None and consulta._ordem:
+            # Percorre o índice ordenado a partir do cursor até completar o limit()
+            chaves = self._ordenacao(consulta)
+            cursor = consulta._chave_cursor()
+            inicio = bisect_right(chaves, cursor) if cursor is not None else 0
+            resultado = []
+            for posicao in range(inicio, len(chaves)):
+                id_documento = chaves[posicao].valores[-1]
+                dados = documentos[id_documento]
+                if consulta._aceita(dados):
+                    resultado.append((chaves[posicao], id_documento, dados))
+                    if consulta._limite is not None and len(resultado) >= consulta._limite:
+                        break
+            return resultado
+
+        if candidatos is None:
+            itens = documentos.items()
+        else:
+            itens = ((id_documento, documentos[id_documento]) for id_documento in candidatos)
+
+        cursor = consulta._chave_cursor()
+        resultado = []
+        for id_documento, dados in itens:
+            if not consulta._aceita(dados):
+                continue
+            chave = consulta._chave(id_documento, dados)
+            if chave is None or (cursor is not None and not cursor < chave):
+                continue
+            resultado.append((chave, id_documento, dados))
+
+        if consulta._limite is not None and consulta._limite < len(resultado):
+            return heapq.nsmallest(consulta._limite, resultado, key=lambda item: item[0])
+        resultado.sort(key=lambda item: item[0])
+        return resultado
+
+    def _consultar(self, consulta):
+        with self._lock:
+            itens = self._executar(consulta)
+            self.leituras += max(1, len(itens))  # Consulta vazia também conta uma leitura
+        return [self._instantaneo(consulta, id_documento, dados) for _, id_documento, dados in itens]
+
+    # --- Escrita ---
+    def _aplicar(self, escritas):
+        agora = _agora()
+        with self._lock:
+            # Valida tudo antes de alterar qualquer documento
+            novos = {}
+            for operacao, referencia, dados, merge in escritas:
+                chave = (referencia._colecao, referencia.id)
+                atual = novos[chave] if chave in novos else \
+                    self._colecoes.get(referencia._colecao, {}).get(referencia.id)
+
+                if operacao == 'create' and atual is not None:
+                    raise excecoes.AlreadyExists(f"Documento já existe: {referencia.path}")
+                if operacao == 'update' and atual is None:
+                    raise excecoes.NotFound(f"Documento não encontrado: {referencia.path}")
+
+                if operacao == 'delete':
+                    novos[chave] = None
+                elif merge:
+                    novos[chave] = _aplicar_campos(atual or {}, dados, operacao == 'update', agora)
+                else:
+                    novos[chave] = _aplicar_campos({}, dados, False, agora)
+
+            self._persistir(novos)
+            self.escritas += len(escritas)
+
+            alterados = {}
+            for (colecao, id_documento), dados in novos.items():
+                documentos = self._colecoes.setdefault(colecao, {})
+                antigo = documentos.get(id_documento)
+                if dados is None:
+                    documentos.pop(id_documento, None)
+                else:
+                    documentos[id_documento] = dados
+                self._reindexar(colecao, id_documento, antigo, dados)
+                alterados.setdefault(colecao, {})[id_documento] = dados
+
+            self._notificar(alterados)
+        return [ResultadoEscrita(agora) for _ in escritas]
+
+    def _reindexar(self, colecao, id_documento, antigo, novo):
+        for (colecao_indice, _), (modelo, chaves) in self._ordenacoes.items():
+            if colecao_indice != colecao:
+                continue
+            if antigo is not None:
+                chave = modelo._chave(id_documento, antigo)
+                if chave is not None:
+                    posicao = bisect_left(chaves, chave)
+                    if posicao < len(chaves) and chaves[posicao] == chave:
+                        del chaves[posicao]
+            if novo is not None:
+                chave = modelo._chave(id_documento, novo)
+                if chave is not None:
+                    insort(chaves, chave)
+
+        for (colecao_indice, campo), indice in self._indices.items():
+            if colecao_indice != colecao:
+                continue
+            for dados, operacao in ((antigo, 'remover'), (novo, 'adicionar')):
+                if dados is None:
+                    continue
+                valor = _obter(dados, campo)
+                if valor is _AUSENTE:
+                    continue
+                chave = chave_valor(valor)
+                if operacao == 'adicionar':
+                    indice.setdefault(chave, set()).add(id_documento)
+                else:
+                    ids = indice.get(chave)
+                    if ids is not None:
+                        ids.discard(id_documento)
+                        if not ids:
+                            del indice[chave]
+
+    # --- Listeners ---
+    def _ouvir(self, consulta, callback):
+        ouvinte = _Ouvinte(self, consulta, callback)
+        with self._lock:
+            ouvinte.carregar(self._executar(consulta))
+            self._ouvintes.setdefault(consulta._colecao, []).append(ouvinte)
+            # Primeiro snapshot: tudo como ADDED
+            documentos = ouvinte.instantaneos()
+            self.leituras += max(1, len(documentos))
+            alteracoes = [AlteracaoLocal(TipoAlteracao.ADDED, doc, -1, indice)
+                          for indice, doc in enumerate(documentos)]
+            self._entregar(ouvinte, documentos, alteracoes)
+        return ouvinte
+
+    def _parar_de_ouvir(self, ouvinte):
+        with self._lock:
+            ouvintes = self._ouvintes.get(ouvinte.consulta._colecao, [])
+            if ouvinte in ouvintes:
+                ouvintes.remove(ouvinte)
+
+    def _notificar(self, alterados):
+        # Chamado com o lock: calcula os deltas de cada listener afetado
+        for colecao, documentos in alterados.items():
+            for ouvinte in self._ouvintes.get(colecao, []):
+                alteracoes = ouvinte.atualizar(documentos)
+                if alteracoes:
+                    self.leituras += len(alteracoes)
+                    self._entregar(ouvinte, ouvinte.instantaneos(), alteracoes)
+
+    def _entregar(self, ouvinte, documentos, alteracoes):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._despachar, name='banco-local-listeners', daemon=True)
+            self._thread.start()
+        self._fila.put((ouvinte, documentos, alteracoes, _agora()))
+
+    def _despachar(self):
+        while True:
+            item = self._fila.get()
+            if item is None:
+                return
+            ouvinte, documentos, alteracoes, read_time = item
+            if not ouvinte.ativo:
+                continue
+            try:
+                ouvinte.callback(documentos, alteracoes, read_time)
+            except Exception as e:
+                print(f"Erro em listener do banco local: {e}")
+
+
+## ---> SERIALIZAÇÃO (SQLITE) <--- ##
+def _codificar(valor):
+    if isinstance(valor, datetime):
+        return {'__data__': valor.isoformat()}
+    if isinstance(valor, bytes):
+        return {'__bytes__': valor.hex()}
+    raise TypeError(f"Tipo não suportado no banco local: {type(valor).__name__}")
+
+
+def _decodificar(objeto):
+    if '__data__' in objeto and len(objeto) == 1:
+        return datetime.fromisoformat(objeto['__data__'])
+    if '__bytes__' in objeto and len(objeto) == 1:
+        return bytes.fromhex(objeto['__bytes__'])
+    return objeto
@@ -0,0 +1,360 @@
+# Standard Library
+import argparse
+from datetime import date, datetime, timedelta
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Sem janela e sem ler a linha de comando: o benchmark não abre a interface
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+# Banco de Dados
+from banco_local import BancoLocal
+from catalogo import COLECAO_CLIENTES, documento_cliente
+from client_manager import ClientManager
+from consultas import ConjuntoRegistros, filtrar_registros, registro_de_documento
+from diario_local import totais_cliente
+from firebase_manager import FirebaseManager
+import perfilador
+import saldos
+
+
+TAMANHOS_PADRAO = [10_000, 100_000]
+MOVIMENTOS_POR_BATCH = saldos.LIMITE_BATCH // saldos.ESCRITAS_POR_MOVIMENTO
+
+
+## ---> DADOS SINTÉTICOS <--- ##
+def gerar_dados(db, registros, clientes, pallets_por_cliente, semente=42):
+    """Popula o banco com clientes, pallets e um histórico de movimentos
+
+    Retorna {cliente: {'id': cliente_id, 'pallet_ids': {pallet: pallet_id}}}.
+    As datas se espalham pelo último ano e cerca de um terço dos movimentos
+    são saídas.
+    """
+    aleatorio = random.Random(semente)
+    catalogo = {
+        f"Cliente {i:05d}": {
+            'id': f"c{i:05d}",
+            'pallet_ids': {f"PBR-{i:05d}-{j:02d}": f"p{i:05d}{j:02d}" for j in range(pallets_por_cliente)}
+        }
+        for i in range(clientes)
+    }
+
+    batch = db.batch()
+    for indice, (cliente, dados) in enumerate(catalogo.items(), 1):
+        documento = documento_cliente(cliente, 'benchmark')
+        documento['pallets'] = {pallet_id: pallet for pallet, pallet_id in dados['pallet_ids'].items()}
+        batch.set(db.collection(COLECAO_CLIENTES).document(dados['id']), documento)
+        if indice % saldos.LIMITE_BATCH == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+    nomes = list(catalogo)
+    hoje = date.today()
+    for inicio in range(0, registros, MOVIMENTOS_POR_BATCH):
+        batch = db.batch()
+        for _ in range(inicio, min(inicio + MOVIMENTOS_POR_BATCH, registros)):
+            cliente = aleatorio.choice(nomes)
+            quantidade = aleatorio.randint(1, 40)
+            if aleatorio.random() < 0.33:
+                quantidade = -quantidade
+            data = (hoje - timedelta(days=aleatorio.randrange(365))).strftime(saldos.FORMATO_DATA)
+            dados = catalogo[cliente]
+            saldos.adicionar_movimento(
+                db, batch, dados['id'], aleatorio.choice(list(dados['pallet_ids'].values())),
+                quantidade, data)
+        batch.commit()
+    return catalogo
+
+
+## ---> MEDIÇÃO <--- ##
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo (valores já ordenados)"""
+    if not valores:
+        return 0.0
+    posicao = max(0, min(len(valores) - 1, round(p / 100 * len(valores) + 0.5) - 1))
+    return valores[posicao]
+
+
+def medir(operacao, funcao, db, repeticoes):
+    """Executa funcao() 'repeticoes' vezes e resume latência, leituras e memória"""
+    tempos = []
+    leituras_antes = db.leituras
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    leituras = (db.leituras - leituras_antes) / repeticoes
+
+    # Memória medida numa execução à parte: o tracemalloc distorce o tempo
+    tracemalloc.start()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tempos.sort()
+    return {
+        'operacao': operacao,
+        'repeticoes': repeticoes,
+        'p50_ms': round(percentil(tempos, 50), 3),
+        'p90_ms': round(percentil(tempos, 90), 3),
+        'p99_ms': round(percentil(tempos, 99), 3),
+        'max_ms': round(tempos[-1], 3),
+        'leituras_por_execucao': round(leituras, 1),
+        'pico_memoria_kb': round(pico / 1024, 1)
+    }
+
+
+def _iniciar_client_manager(total_clientes, tempo_limite=120):
+    """Cria um ClientManager sem cache e espera o primeiro snapshot completo"""
+    if os.path.exists(ClientManager.CAMINHO_CACHE):
+        os.remove(ClientManager.CAMINHO_CACHE)
+
+    client_manager = ClientManager()
+    limite = time.perf_counter() + tempo_limite
+    while len(client_manager._clientes_servidor) < total_clientes:
+        if time.perf_counter() > limite:
+            raise TimeoutError("O listener de clientes não entregou o primeiro snapshot")
+        time.sleep(0.0005)
+    client_manager.encerrar()
+    return client_manager
+
+
+def executar(registros, clientes, pallets_por_cliente, repeticoes, semente=42):
+    """Gera a base e mede cada caminho de dados; retorna a lista de resultados"""
+    db = BancoLocal()
+    FirebaseManager.usar_banco(db)
+    aleatorio = random.Random(semente)
+
+    inicio = time.perf_counter()
+    catalogo = gerar_dados(db, registros, clientes, pallets_por_cliente, semente)
+    print(f"  base gerada em {time.perf_counter() - inicio:.1f}s")
+
+    nomes = list(catalogo)
+    pares = [
+        (dados['id'], pallet_id) for dados in catalogo.values() for pallet_id in dados['pallet_ids'].values()
+    ]
+    client_manager = _iniciar_client_manager(len(catalogo))
+    client_manager.carregar_clientes()  # Tabela de nomes para o histórico
+
+    historico = [
+        registro_de_documento(doc, client_manager.nomes)
+        for doc in db.collection(saldos.COLECAO_REGISTROS).stream()
+    ]
+    conjunto = ConjuntoRegistros()
+    conjunto.carregar(historico)
+    termos = [nome[-4:] for nome in aleatorio.sample(nomes, min(len(nomes), 10))]
+
+    def obter_totais_cliente():
+        dados = catalogo[aleatorio.choice(nomes)]
+        totais_cliente(db, dados['id'], list(dados['pallet_ids'].values()))
+
+    operacoes = [
+        ('ClientManager.__init__ (primeiro snapshot)',
+         lambda: _iniciar_client_manager(len(catalogo)), max(1, repeticoes // 5)),
+        ('ClientManager.carregar_clientes', client_manager.carregar_clientes, repeticoes),
+        ('TelaSaida.obter_totais_cliente', obter_totais_cliente, repeticoes),
+        ('TelaConsulta.calcular_totais (saldos)', lambda: saldos.calcular_totais(db, pares), repeticoes),
+        ('TelaConsulta.calcular_totais (agregação)',
+         lambda: saldos.somar_por_agregacao(db, pares), max(1, repeticoes // 5)),
+        ('saldos.somar_registros (varredura completa)',
+         lambda: saldos.somar_registros(db), max(1, repeticoes // 10)),
+        ('consultas.filtrar_registros (linear)',
+         lambda: filtrar_registros(historico, aleatorio.choice(termos)), repeticoes),
+        ('ConjuntoRegistros.carregar (colunas)',
+         lambda: ConjuntoRegistros().carregar(historico), max(1, repeticoes // 10)),
+        ('ConjuntoRegistros.filtrar (colunar)',
+         lambda: conjunto.filtrar(aleatorio.choice(termos)), repeticoes),
+        ('ConjuntoRegistros.somar (agrupamento)',
+         lambda: conjunto.somar(aleatorio.choice(termos)), repeticoes),
+    ]
+
+    resultados = []
+    for operacao, funcao, vezes in operacoes:
+        resultado = medir(operacao, funcao, db, vezes)
+        resultado['registros'] = registros
+        resultados.append(resultado)
+        print(f"  {operacao:<48} p50={resultado['p50_ms']:>10.3f}ms "
+              f"p99={resultado['p99_ms']:>10.3f}ms leituras={resultado['leituras_por_execucao']:>9} "
+              f"memória={resultado['pico_memoria_kb']:>10.1f}KB")
+
+    db.close()
+    return resultados
+
+
+## ---> ABERTURA DO APP <--- ##
+def medir_primeiro_quadro(repeticoes, tempo_limite=60):
+    """Abre o app 'repeticoes' vezes (banco em memória) e mede o tempo até o primeiro quadro
+
+    Cada execução é um processo novo, então os imports contam. Retorna None
+    (com aviso) se o app não abrir, por exemplo numa máquina sem tela.
+    """
+    caminho_main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    ambiente = dict(os.environ, PALLET_BANCO='memoria', KIVY_NO_ARGS='1')
+    ambiente[perfilador.VARIAVEL_PRIMEIRO_QUADRO] = '1'
+    tempos = []
+    for _ in range(repeticoes):
+        try:
+            saida = subprocess.run([sys.executable, caminho_main], env=ambiente, capture_output=True,
+                                   text=True, timeout=tempo_limite).stdout
+        except subprocess.TimeoutExpired:
+            saida = ''
+        linha = next((linha for linha in saida.splitlines()
+                      if linha.startswith(perfilador.MARCA_PRIMEIRO_QUADRO)), None)
+        if linha is None:
+            print("⚠️ O app não chegou ao primeiro quadro (sem tela?); abertura não medida.")
+            return None
+        tempos.append(float(linha[len(perfilador.MARCA_PRIMEIRO_QUADRO):]))
+
+    tempos.sort()
+    return {
+        'operacao': 'PalletApp (abertura até o primeiro quadro)',
+        'registros': 0,
+        'repeticoes': repeticoes,
+        'p50_ms': round(percentil(tempos, 50), 3),
+        'p90_ms': round(percentil(tempos, 90), 3),
+        'p99_ms': round(percentil(tempos, 99), 3),
+        'max_ms': round(tempos[-1], 3)
+    }
+
+
+# Camada de dados que main.py importa antes do primeiro quadro (sem o Kivy)
+MODULOS_ABERTURA = ('diario_local', 'firebase_manager', 'consultas', 'reconciliacao', 'saldos')
+
+
+def medir_imports(repeticoes, tempo_limite=60):
+    """Mede, em processos novos, o import de MODULOS_ABERTURA (não precisa de tela)
+
+    O SDK do Firebase (pilha gRPC) deve ficar para a thread de conexão: se
+    ele for carregado por esses imports, a abertura do app volta a esperá-lo.
+    """
+    codigo = (
+        "import sys, time\n"
+        "inicio = time.perf_counter()\n"
+        f"import {', '.join(MODULOS_ABERTURA)}\n"
+        "print((time.perf_counter() - inicio) * 1000, 'firebase_admin' in sys.modules)"
+    )
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    ambiente = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [pasta, os.environ.get('PYTHONPATH')])))
+    tempos = []
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, '-c', codigo], env=ambiente, capture_output=True,
+                               text=True, timeout=tempo_limite)
+        if saida.returncode != 0:
+            print(f"⚠️ Imports não medidos: {saida.stderr.strip().splitlines()[-1:]}")
+            return None
+        tempo, sdk = saida.stdout.split()
+        if sdk == 'True':
+            print("⚠️ O SDK do Firebase é importado antes do primeiro quadro.")
+        tempos.append(float(tempo))
+
+    tempos.sort()
+    return {
+        'operacao': 'Imports da camada de dados (abertura)',
+        'registros': 0,
+        'repeticoes': repeticoes,
+        'p50_ms': round(percentil(tempos, 50), 3),
+        'p90_ms': round(percentil(tempos, 90), 3),
+        'p99_ms': round(percentil(tempos, 99), 3),
+        'max_ms': round(tempos[-1], 3)
+    }
+
+
+## ---> COMPARAÇÃO ENTRE VERSÕES <--- ##
+def comparar(atuais, anteriores, tolerancia):
+    """Imprime a variação do p50 por operação; retorna as regressões acima da tolerância"""
+    referencia = {(r['operacao'], r['registros']): r for r in anteriores}
+    regressoes = []
+    for resultado in atuais:
+        antigo = referencia.get((resultado['operacao'], resultado['registros']))
+        if not antigo or not antigo['p50_ms']:
+            continue
+        variacao = (resultado['p50_ms'] - antigo['p50_ms']) / antigo['p50_ms'] * 100
+        marca = "⚠️" if variacao > tolerancia else "  "
+        print(f"{marca} {resultado['operacao']:<48} {resultado['registros']:>9} "
+              f"{antigo['p50_ms']:>10.3f}ms -> {resultado['p50_ms']:>10.3f}ms ({variacao:+.1f}%)")
+        if variacao > tolerancia:
+            regressoes.append(resultado)
+    return regressoes
+
+
+def _versao():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mede os caminhos de dados do app sobre o banco local, com dados sintéticos")
+    parser.add_argument('--registros', type=int, nargs='+', default=TAMANHOS_PADRAO,
+                        help="Tamanhos do histórico a medir (ex.: 10000 100000 1000000)")
+    parser.add_argument('--clientes', type=int, default=200)
+    parser.add_argument('--pallets', type=int, default=10, help="Pallets por cliente")
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--abertura', type=int, default=5,
+                        help="Aberturas do app medidas até o primeiro quadro (0 = não medir)")
+    parser.add_argument('--saida', default='benchmark.json', help="Arquivo JSON com os resultados")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para comparar")
+    parser.add_argument('--tolerancia', type=float, default=20.0,
+                        help="Aumento do p50 (em %%) considerado regressão")
+    args = parser.parse_args()
+
+    comparacao = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            comparacao = json.load(arquivo)['resultados']
+
+    resultados = []
+    diretorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as diretorio:
+        # Diário local e cache de clientes ficam isolados numa pasta temporária
+        os.chdir(diretorio)
+        try:
+            for registros in args.registros:
+                print(f"▶ {registros} registros, {args.clientes} clientes x {args.pallets} pallets")
+                resultados += executar(
+                    registros, args.clientes, args.pallets, args.repeticoes, args.semente)
+            if args.abertura:
+                # Na pasta temporária: o app abre sem cache nem diário de execuções anteriores
+                print(f"▶ abertura do app ({args.abertura}x)")
+                for resultado in (medir_imports(args.abertura), medir_primeiro_quadro(args.abertura)):
+                    if resultado:
+                        resultados.append(resultado)
+                        print(f"  {resultado['operacao']:<48} p50={resultado['p50_ms']:>10.3f}ms "
+                              f"p99={resultado['p99_ms']:>10.3f}ms")
+        finally:
+            os.chdir(diretorio_original)
+
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump({
+            'criado_em': datetime.now().isoformat(timespec='seconds'),
+            'versao': _versao(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'parametros': vars(args),
+            'resultados': resultados
+        }, arquivo, ensure_ascii=False, indent=2)
+    print(f"✅ Resultados salvos em '{args.saida}'.")
+
+    if comparacao is not None:
+        regressoes = comparar(resultados, comparacao, args.tolerancia)
+        if regressoes:
+            print(f"❌ {len(regressoes)} operação(ões) acima da tolerância de {args.tolerancia}%.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+# Standard Library
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+import uuid
+
+# Banco de Dados
+from firebase_manager import FirebaseManager
+from firestore_adiado import FieldFilter, excecoes, firestore
+import saldos
+
+
+COLECAO_CLIENTES = 'clientes'
+COLECAO_NOMES = 'nomes_clientes'
+LOTES_PARALELOS = 4  # Batches gravados ao mesmo tempo na migração
+ESCRITAS_POR_CLIENTE = 2  # Documento do cliente + reserva do nome
+
+
+def novo_id(prefixo):
+    """ID imutável de cliente ('c') ou pallet ('p')
+
+    Começa com letra para poder ser usado em caminhos de campo
+    (ex.: 'pallets.<id>') sem precisar de escape.
+    """
+    return f"{prefixo}{uuid.uuid4().hex}"
+
+
+# Documento de cliente: clientes/{id} = {
+#     'nome': str, 'criado_por': str,
+#     'pallets': {pallet_id: nome},     # Pallets ativos
+#     'arquivados': {pallet_id: nome},  # Pallets removidos (nomes do histórico)
+#     'removido': bool                  # Cliente excluído (mantido pelo histórico)
+# }
+# Registros e saldos guardam só 'cliente_id' e 'pallet_id': renomear altera
+# um único documento e os totais continuam ligados ao mesmo pallet.
+def documento_cliente(nome, criado_por):
+    return {'nome': nome, 'criado_por': criado_por, 'pallets': {}, 'arquivados': {}}
+
+
+## ---> RESERVA DE NOMES <--- ##
+# nomes_clientes/{chave_nome(nome)} = {'cliente_id': str, 'nome': str}
+# Criada com create() no mesmo batch do cliente (falha se o nome já tem
+# dono), trocada na renomeação e liberada na remoção: dois aparelhos nunca
+# deixam dois clientes ativos com o mesmo nome.
+def chave_nome(nome):
+    """ID da reserva: ignora maiúsculas e espaços repetidos ('n_' evita IDs reservados)"""
+    return 'n_' + quote(' '.join(nome.split()).casefold(), safe='')
+
+
+def reservar_nome(db, batch, nome, cliente_id):
+    batch.create(db.collection(COLECAO_NOMES).document(chave_nome(nome)),
+                 {'cliente_id': cliente_id, 'nome': nome})
+
+
+def liberar_nome(db, batch, nome):
+    batch.delete(db.collection(COLECAO_NOMES).document(chave_nome(nome)))
+
+
+def dono_do_nome(db, nome):
+    """ID do cliente que reservou o nome (None se está livre)"""
+    doc = db.collection(COLECAO_NOMES).document(chave_nome(nome)).get()
+    return doc.to_dict()['cliente_id'] if doc.exists else None
+
+
+def criar_cliente(db, nome, criado_por, cliente_id=None):
+    """Cria o cliente reservando o nome; retorna (cliente_id, criado)
+
+    Se o nome já tem dono, nada é gravado e o ID retornado é o dele.
+    """
+    cliente_id = cliente_id or novo_id('c')
+    batch = db.batch()
+    batch.create(db.collection(COLECAO_CLIENTES).document(cliente_id), documento_cliente(nome, criado_por))
+    reservar_nome(db, batch, nome, cliente_id)
+    try:
+        batch.commit()
+    except excecoes.AlreadyExists:
+        dono = dono_do_nome(db, nome)
+        if dono is None:
+            raise
+        return dono, False
+    return cliente_id, True
+
+
+def criar_clientes(db, clientes, criado_por):
+    """Cria {cliente_id: nome} num único batch; retorna {cliente_id: (ID final, criado)}
+
+    Se algum nome já tem dono o batch inteiro é recusado: cada cliente é
+    então criado à parte com criar_cliente() e os de nome ocupado recebem o
+    ID do dono. No máximo saldos.LIMITE_BATCH // ESCRITAS_POR_CLIENTE clientes.
+    """
+    batch = db.batch()
+    for cliente_id, nome in clientes.items():
+        batch.create(db.collection(COLECAO_CLIENTES).document(cliente_id), documento_cliente(nome, criado_por))
+        reservar_nome(db, batch, nome, cliente_id)
+    try:
+        batch.commit()
+    except excecoes.AlreadyExists:
+        return {cliente_id: criar_cliente(db, nome, criado_por, cliente_id) for cliente_id, nome in clientes.items()}
+    return {cliente_id: (cliente_id, True) for cliente_id in clientes}
+
+
+def reservar_nomes(db):
+    """Cria as reservas que faltam para os clientes ativos (bases anteriores às reservas)
+
+    Retorna (reservas criadas, [(nome, [IDs])] de nomes repetidos). Nomes
+    repetidos ficam com o primeiro cliente e precisam ser renomeados à mão.
+    """
+    por_chave = {}
+    for doc in db.collection(COLECAO_CLIENTES).stream():
+        dados = doc.to_dict()
+        if 'nome' in dados and not dados.get('removido'):
+            por_chave.setdefault(chave_nome(dados['nome']), []).append((dados['nome'], doc.id))
+
+    existentes = {doc.id for doc in db.collection(COLECAO_NOMES).select([]).stream()}
+    faltando = [(chave, clientes[0]) for chave, clientes in sorted(por_chave.items()) if chave not in existentes]
+    nomes_ref = db.collection(COLECAO_NOMES)
+    for inicio in range(0, len(faltando), saldos.LIMITE_BATCH):
+        batch = db.batch()
+        for chave, (nome, cliente_id) in faltando[inicio:inicio + saldos.LIMITE_BATCH]:
+            batch.set(nomes_ref.document(chave), {'cliente_id': cliente_id, 'nome': nome})
+        batch.commit()
+
+    repetidos = [(clientes[0][0], [cliente_id for _, cliente_id in clientes])
+                 for clientes in por_chave.values() if len(clientes) > 1]
+    return len(faltando), repetidos
+
+
+## ---> MIGRAÇÃO DA BASE POR NOMES <--- ##
+class _Catalogo:
+    """Nomes da base antiga -> IDs novos, durante a migração"""
+
+    def __init__(self):
+        self.por_nome = {}   # nome antigo do cliente -> entrada
+        self.pendentes = {}  # id -> entrada com alterações ainda não gravadas
+
+    def carregar(self, id_cliente, dados):
+        """Cliente convertido numa execução anterior (migração retomada)"""
+        pallets = dict(dados.get('arquivados', {}), **dados.get('pallets', {}))
+        self.por_nome[dados['migrado_de']] = {
+            'id': id_cliente,
+            'dados': dados,
+            'pallets': {nome: id_pallet for id_pallet, nome in pallets.items()}
+        }
+
+    def cliente(self, nome, legado=None):
+        entrada = self.por_nome.get(nome)
+        if entrada is None:
+            dados = documento_cliente(nome, (legado or {}).get('criado_por', ''))
+            dados['migrado_de'] = nome
+            if legado is None:
+                dados['removido'] = True  # Só aparece no histórico: cliente já excluído
+            entrada = {'id': novo_id('c'), 'dados': dados, 'pallets': {}}
+            self.por_nome[nome] = entrada
+            self.pendentes[entrada['id']] = entrada
+        elif legado is not None and entrada['dados'].get('removido'):
+            entrada['dados'].pop('removido')
+            self.pendentes[entrada['id']] = entrada
+
+        for pallet in (legado or {}).get('pallets', []):
+            self.pallet(nome, pallet, ativo=True)
+        return entrada
+
+    def apelido(self, nome_antigo, nome_novo):
+        """Renomeação interrompida: os dois nomes viram o mesmo cliente"""
+        self.por_nome[nome_antigo] = self.cliente(nome_novo)
+
+    def pallet(self, nome_cliente, nome_pallet, ativo=False):
+        """(cliente_id, pallet_id) de um par de nomes, criando o que faltar
+
+        Pallets que só aparecem no histórico (removidos ou renomeados na base
+        antiga) entram como arquivados, para o histórico manter o nome.
+        """
+        entrada = self.cliente(nome_cliente) if nome_cliente not in self.por_nome \
+            else self.por_nome[nome_cliente]
+        id_pallet = entrada['pallets'].get(nome_pallet)
+        if id_pallet is None:
+            id_pallet = novo_id('p')
+            entrada['pallets'][nome_pallet] = id_pallet
+            entrada['dados']['pallets' if ativo else 'arquivados'][id_pallet] = nome_pallet
+            self.pendentes[entrada['id']] = entrada
+        return entrada['id'], id_pallet
+
+    def gravar(self, db):
+        clientes_ref = db.collection(COLECAO_CLIENTES)
+        entradas = list(self.pendentes.values())
+        for inicio in range(0, len(entradas), saldos.LIMITE_BATCH):
+            batch = db.batch()
+            for entrada in entradas[inicio:inicio + saldos.LIMITE_BATCH]:
+                batch.set(clientes_ref.document(entrada['id']), entrada['dados'])
+            batch.commit()
+        self.pendentes = {}
+
+
+def _converter_em_lotes(db, query, catalogo, escrever, por_documento, paralelos):
+    """Converte, em rodadas de batches paralelos, os documentos que ainda têm 'cliente'
+
+    Cada rodada relê a consulta: os documentos convertidos perdem o campo e
+    saem dela, então a conversão pode ser interrompida e retomada.
+    """
+    tamanho_lote = saldos.LIMITE_BATCH // por_documento
+    query = query.limit(tamanho_lote * paralelos)
+    convertidos = 0
+
+    def gravar(lote):
+        batch = db.batch()
+        for doc, dados, ids in lote:
+            escrever(batch, doc, dados, ids)
+        batch.commit()
+
+    with ThreadPoolExecutor(max_workers=paralelos, thread_name_prefix='migracao') as executor:
+        while True:
+            itens = []
+            for doc in query.stream():
+                dados = doc.to_dict()
+                itens.append((doc, dados, catalogo.pallet(dados.get('cliente', ''), dados.get('pallet', ''))))
+            if not itens:
+                return convertidos
+
+            # Nomes novos vão para o catálogo antes dos documentos que os usam
+            catalogo.gravar(db)
+            lotes = [itens[inicio:inicio + tamanho_lote] for inicio in range(0, len(itens), tamanho_lote)]
+            list(executor.map(gravar, lotes))  # Propaga o erro de qualquer batch
+            convertidos += len(itens)
+            print(f"  {convertidos} documento(s) convertido(s)...")
+
+
+def migrar_ids(db, paralelos=LOTES_PARALELOS):
+    """Converte a base que referencia clientes e pallets por nome para IDs
+
+    1. Cria um documento por cliente com ID novo (pallets com IDs próprios).
+    2. Troca 'cliente'/'pallet' por 'cliente_id'/'pallet_id' nos registros.
+    3. Move os saldos para o ID determinístico do par de IDs.
+    4. Apaga os documentos de cliente antigos (ID = nome).
+
+    Pode ser interrompida e rodada de novo. Renomeações pela base antiga que
+    ficaram pela metade viram um único cliente. Retorna as contagens.
+    """
+    clientes_ref = db.collection(COLECAO_CLIENTES)
+    catalogo = _Catalogo()
+    legados = []
+    for doc in clientes_ref.stream():
+        dados = doc.to_dict()
+        if 'nome' not in dados:
+            legados.append((doc.id, dados))
+        elif 'migrado_de' in dados:
+            catalogo.carregar(doc.id, dados)
+
+    for nome, dados in legados:
+        if not dados.get('renomeando_para'):
+            catalogo.cliente(nome, dados)
+    for nome, dados in legados:
+        if dados.get('renomeando_para'):
+            catalogo.apelido(nome, dados['renomeando_para'])
+    catalogo.gravar(db)
+
+    def escrever_registro(batch, doc, dados, ids):
+        batch.update(doc.reference, {
+            'cliente_id': ids[0],
+            'pallet_id': ids[1],
+            'cliente': firestore.DELETE_FIELD,
+            'pallet': firestore.DELETE_FIELD
+        })
+
+    saldos_ref = db.collection(saldos.COLECAO_SALDOS)
+
+    def escrever_saldo(batch, doc, dados, ids):
+        # Incremento + exclusão no mesmo batch: repetir nunca soma duas vezes
+        batch.set(saldos_ref.document(saldos.id_saldo(*ids)), {
+            'cliente_id': ids[0],
+            'pallet_id': ids[1],
+            'saldo': firestore.Increment(dados.get('saldo', 0)),
+            'atualizado_em': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        batch.delete(doc.reference)
+
+    com_nome = FieldFilter('cliente', '>=', '')  # Só documentos que ainda têm o campo
+    print("▶ Registros")
+    registros = _converter_em_lotes(
+        db, db.collection(saldos.COLECAO_REGISTROS).where(filter=com_nome).select(['cliente', 'pallet']),
+        catalogo, escrever_registro, 1, paralelos)
+    print("▶ Saldos")
+    saldos_movidos = _converter_em_lotes(
+        db, saldos_ref.where(filter=com_nome), catalogo, escrever_saldo, 2, paralelos)
+
+    for inicio in range(0, len(legados), saldos.LIMITE_BATCH):
+        batch = db.batch()
+        for nome, _ in legados[inicio:inicio + saldos.LIMITE_BATCH]:
+            batch.delete(clientes_ref.document(nome))
+        batch.commit()
+    reservar_nomes(db)
+
+    return {
+        'clientes': len({entrada['id'] for entrada in catalogo.por_nome.values()}),
+        'registros': registros,
+        'saldos': saldos_movidos
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra a base de clientes/pallets por nome para IDs")
+    parser.add_argument('comando', choices=['migrar-ids', 'reservar-nomes'],
+                        help="'reservar-nomes' cria as reservas de nome das bases já migradas")
+    parser.add_argument('--paralelos', type=int, default=LOTES_PARALELOS,
+                        help="Batches gravados ao mesmo tempo")
+    args = parser.parse_args()
+
+    db = FirebaseManager.get_instance().db
+    if args.comando == 'reservar-nomes':
+        criadas, repetidos = reservar_nomes(db)
+        for nome, ids in repetidos:
+            print(f"⚠️ Nome repetido: '{nome}' ({', '.join(ids)}); renomeie um deles no app.")
+        print(f"✅ {criadas} reserva(s) de nome criada(s).")
+        return
+
+    contagens = migrar_ids(db, args.paralelos)
+    print(f"✅ {contagens['clientes']} cliente(s), {contagens['registros']} registro(s) e "
+          f"{contagens['saldos']} saldo(s) migrados.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+# Standard Library
+from contextlib import contextmanager
+import json
+import os
+import threading
+
+# Third-party
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.properties import DictProperty
+
+# Banco de Dados
+from diario_local import DiarioLocal, Sincronizador
+from firebase_manager import FirebaseManager
+import catalogo
+
+
+class AlteracoesClientes:
+    """O que mudou entre duas publicações da lista de clientes (argumento de on_clientes)"""
+
+    def __init__(self):
+        self.adicionados = []  # Clientes novos
+        self.removidos = []  # Clientes que saíram
+        self.renomeados = {}  # {nome antigo: nome novo}
+        self.pallets_adicionados = {}  # {cliente: [pallets]} (nome atual do cliente)
+        self.pallets_removidos = {}
+        self.pallets_renomeados = {}  # {cliente: {nome antigo: nome novo}}
+
+    def __bool__(self):
+        return bool(self.nomes_alterados or self.pallets_adicionados
+                    or self.pallets_removidos or self.pallets_renomeados)
+
+    def __repr__(self):
+        return (f"AlteracoesClientes(adicionados={self.adicionados}, removidos={self.removidos}, "
+                f"renomeados={self.renomeados}, pallets_adicionados={self.pallets_adicionados}, "
+                f"pallets_removidos={self.pallets_removidos}, "
+                f"pallets_renomeados={self.pallets_renomeados})")
+
+    @property
+    def nomes_alterados(self):
+        """True se a lista de nomes (valores dos spinners) mudou"""
+        return bool(self.adicionados or self.removidos or self.renomeados)
+
+    def afeta(self, cliente):
+        """True se o cliente (pelo nome atual ou antigo) ou seus pallets mudaram"""
+        return (cliente in self.adicionados or cliente in self.removidos
+                or cliente in self.renomeados or cliente in self.renomeados.values()
+                or cliente in self.pallets_adicionados or cliente in self.pallets_removidos
+                or cliente in self.pallets_renomeados)
+
+
+def diferenca_clientes(antigos, novos):
+    """Compara duas versões de {cliente: {'id': ..., 'pallet_ids': {pallet: id}, ...}}
+
+    Clientes e pallets são pareados pelo ID, então uma troca de nome aparece
+    como renomeação e não como remoção + adição.
+    """
+    alteracoes = AlteracoesClientes()
+    antigos_por_id = {dados['id']: cliente for cliente, dados in antigos.items()}
+    novos_por_id = {dados['id']: cliente for cliente, dados in novos.items()}
+
+    alteracoes.removidos = [cliente for id_cliente, cliente in antigos_por_id.items()
+                            if id_cliente not in novos_por_id]
+    alteracoes.adicionados = [cliente for id_cliente, cliente in novos_por_id.items()
+                              if id_cliente not in antigos_por_id]
+
+    for id_cliente, novo in novos_por_id.items():
+        antigo = antigos_por_id.get(id_cliente)
+        if antigo is None:
+            continue
+        if antigo != novo:
+            alteracoes.renomeados[antigo] = novo
+
+        pallets_antes = {pallet_id: pallet for pallet, pallet_id in antigos[antigo]['pallet_ids'].items()}
+        pallets_depois = {pallet_id: pallet for pallet, pallet_id in novos[novo]['pallet_ids'].items()}
+        if pallets_antes == pallets_depois:
+            continue
+        incluidos = [pallets_depois[i] for i in pallets_depois if i not in pallets_antes]
+        excluidos = [pallets_antes[i] for i in pallets_antes if i not in pallets_depois]
+        renomeados = {pallets_antes[i]: pallets_depois[i] for i in pallets_depois
+                      if i in pallets_antes and pallets_antes[i] != pallets_depois[i]}
+        if incluidos:
+            alteracoes.pallets_adicionados[novo] = sorted(incluidos)
+        if excluidos:
+            alteracoes.pallets_removidos[novo] = sorted(excluidos)
+        if renomeados:
+            alteracoes.pallets_renomeados[novo] = renomeados
+
+    return alteracoes
+
+
+class ClientManager(EventDispatcher):
+    clientes = DictProperty({})
+    __events__ = ('on_clientes',)
+    CAMINHO_CACHE = 'cache_clientes.json'  # Última lista do servidor, para abrir rápido
+
+    def __init__(self, conectar=True):
+        """conectar=False: só o cache e o diário local; o listener fica para conectar()"""
+        super().__init__()
+        try:
+            self.listener = None
+            self.diario = DiarioLocal.get_instance()
+            self._lock = threading.Lock()
+            # Conferência de nome + gravação no diário sem intercalar com outra
+            # edição (o executor roda as edições em paralelo)
+            self._lock_edicao = threading.Lock()
+            self._nomes = {}  # {cliente_id: (nome, {pallet_id: nome})}, inclusive removidos
+            self._clientes_servidor = self._ler_cache()  # Espelho local do Firestore, por ID
+            self.clientes = self.carregar_clientes()  # Mostra o cache já no primeiro frame
+
+            # Publicações pedidas no mesmo frame (ou na mesma transação) viram uma só
+            self._publicar = Clock.create_trigger(self._publicar_clientes)
+            self._ao_publicar = []  # Callbacks ao_concluir da próxima publicação
+            self._transacoes = 0
+            self._publicacao_adiada = False
+
+            if conectar:
+                self.conectar()
+
+        except Exception as e:
+            print(f"Falha ao criar ClientManager: {str(e)}")
+            raise
+
+    def conectar(self):
+        """Liga o listener de clientes (espera o banco ficar pronto)"""
+        self.firebase = FirebaseManager.get_instance()
+        self.db = self.firebase.db
+        # Um único listener mantém o espelho atualizado aplicando os deltas
+        self.listener = self.db.collection(catalogo.COLECAO_CLIENTES).on_snapshot(self._ao_alterar_clientes)
+
+    @property
+    def user_id(self):
+        return FirebaseManager.get_user_id()  # Não espera a conexão
+
+    def carregar_clientes(self):
+        """Carrega todos os clientes (visíveis para todos)
+
+        Não acessa a rede: parte do espelho local mantido pelo listener e
+        aplica por cima as edições ainda pendentes no diário local.
+        """
+        return self._visao_local()
+
+    @staticmethod
+    def _cliente_de_documento(dados):
+        return {
+            'nome': dados['nome'],
+            'criado_por': dados.get('criado_por', ''),
+            'pallets': dict(dados.get('pallets', {})),
+            'arquivados': dict(dados.get('arquivados', {})),
+            'removido': bool(dados.get('removido'))
+        }
+
+    def _ao_alterar_clientes(self, snapshot, changes, read_time):
+        # Roda na thread do listener: aplica só os documentos alterados
+        with self._lock:
+            for change in changes:
+                dados = change.document.to_dict() if change.type.name != 'REMOVED' else None
+                # Documentos sem 'nome' são da base antiga, ainda não migrada
+                if dados is None or 'nome' not in dados:
+                    self._clientes_servidor.pop(change.document.id, None)
+                else:
+                    self._clientes_servidor[change.document.id] = self._cliente_de_documento(dados)
+            copia = dict(self._clientes_servidor)
+
+        self._salvar_cache(copia)
+        self.atualizar_lista_clientes()
+
+    def _ler_cache(self):
+        try:
+            with open(self.CAMINHO_CACHE, encoding='utf-8') as arquivo:
+                clientes = json.load(arquivo)
+            # Cache gravado antes dos IDs: o listener recarrega tudo
+            if not all(isinstance(dados, dict) and 'nome' in dados for dados in clientes.values()):
+                return {}
+            return clientes
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Cache de clientes ignorado: {e}")
+            return {}
+
+    def _salvar_cache(self, clientes):
+        try:
+            temporario = self.CAMINHO_CACHE + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as arquivo:
+                json.dump(clientes, arquivo, ensure_ascii=False)
+            os.replace(temporario, self.CAMINHO_CACHE)  # Troca atômica
+        except Exception as e:
+            print(f"Erro ao salvar cache de clientes: {e}")
+
+    def _visao_local(self):
+        """Clientes do servidor + edições pendentes no diário local
+
+        Retorna {nome: {'id', 'pallets': [nomes], 'pallet_ids': {nome: id},
+        'criado_por'}}, só com os clientes ativos. Também atualiza a tabela
+        usada por nomes().
+        """
+        with self._lock:
+            clientes = dict(self._clientes_servidor)
+        clientes = self.diario.sobrepor_clientes(clientes)
+
+        self._nomes = {
+            cliente_id: (dados['nome'], dict(dados.get('arquivados', {}), **dados['pallets']))
+            for cliente_id, dados in clientes.items()
+        }
+        return {
+            dados['nome']: {
+                'id': cliente_id,
+                'pallets': sorted(dados['pallets'].values()),  # Ordem alfabética
+                'pallet_ids': {nome: pallet_id for pallet_id, nome in dados['pallets'].items()},
+                'criado_por': dados.get('criado_por', '')
+            }
+            for cliente_id, dados in clientes.items() if not dados.get('removido')
+        }
+
+    def nomes(self, cliente_id, pallet_id):
+        """(cliente, pallet) com os nomes atuais de um par de IDs
+
+        Resolve também clientes removidos e pallets arquivados, para o
+        histórico; IDs desconhecidos voltam como estão.
+        """
+        nome_cliente, pallets = self._nomes.get(cliente_id, (cliente_id, {}))
+        return nome_cliente, pallets.get(pallet_id, pallet_id)
+
+    def _registrar_no_diario(self, tipo, **dados):
+        """Grava a edição localmente, atualiza a lista e agenda o envio"""
+        self.diario.registrar(tipo, dados)
+        self.atualizar_lista_clientes()
+        Sincronizador.get_instance().acordar()
+
+    def adicionar_cliente(self, nome_cliente):
+        """Adiciona novo cliente visível para todos"""
+        try:
+            with self._lock_edicao:
+                # Mesma regra da reserva de nomes no servidor (maiúsculas e espaços não contam)
+                chave = catalogo.chave_nome(nome_cliente)
+                if any(catalogo.chave_nome(nome) == chave for nome in self._visao_local()):
+                    return False
+
+                self._registrar_no_diario(
+                    'adicionar_cliente', cliente_id=catalogo.novo_id('c'),
+                    nome=nome_cliente, criado_por=self.user_id)
+            return True
+
+        except Exception as e:
+            print(f"Erro ao adicionar cliente: {e}")
+            return False
+
+    def adicionar_pallet(self, cliente, pallet):
+        """Qualquer usuário pode adicionar pallet a cliente existente"""
+        try:
+            with self._lock_edicao:
+                dados = self._visao_local().get(cliente)
+                if dados is None:
+                    return False
+                if pallet not in dados['pallet_ids']:
+                    self._registrar_no_diario(
+                        'adicionar_pallet', cliente_id=dados['id'],
+                        pallet_id=catalogo.novo_id('p'), nome=pallet)
+            return True
+        except Exception as e:
+            print(f"Erro ao adicionar pallet: {e}")
+            return False
+
+    def editar_cliente(self, cliente_antigo, cliente_novo):
+        """Renomeia o cliente (apenas criador pode editar)
+
+        Registros e saldos guardam o ID do cliente, então só o documento do
+        cliente muda: funciona offline, como as demais edições.
+        """
+        try:
+            with self._lock_edicao:
+                clientes = self._visao_local()
+                dados = clientes.get(cliente_antigo)
+                if dados is None:
+                    print("Cliente antigo não encontrado!")
+                    return False
+                if dados['criado_por'] != self.user_id:
+                    print("Apenas o criador pode editar este cliente!")
+                    return False
+                chave = catalogo.chave_nome(cliente_novo)
+                if any(catalogo.chave_nome(nome) == chave for nome in clientes if nome != cliente_antigo):
+                    print("Já existe um cliente com este novo nome!")
+                    return False
+
+                self._registrar_no_diario('renomear_cliente', cliente_id=dados['id'], nome=cliente_novo)
+            return True
+
+        except Exception as e:
+            print(f"Erro ao editar cliente: {e}")
+            return False
+
+    def renomear_pallet(self, cliente, pallet_antigo, pallet_novo):
+        """Renomeia o pallet mantendo o histórico (apenas criador do cliente pode editar)"""
+        try:
+            with self._lock_edicao:
+                dados = self._visao_local().get(cliente, {})
+
+                if dados.get('criado_por') != self.user_id:
+                    print("Apenas o criador pode editar pallets!")
+                    return False
+                if pallet_antigo not in dados['pallet_ids']:
+                    print("Pallet antigo não encontrado!")
+                    return False
+                if pallet_novo in dados['pallet_ids']:
+                    print("Já existe um pallet com este novo nome!")
+                    return False
+
+                self._registrar_no_diario(
+                    'renomear_pallet', cliente_id=dados['id'],
+                    pallet_id=dados['pallet_ids'][pallet_antigo], nome=pallet_novo)
+            return True
+
+        except Exception as e:
+            print(f"Erro ao renomear pallet: {e}")
+            return False
+
+    def remover_cliente(self, cliente):
+        """Remove cliente (apenas criador pode remover)
+
+        O documento fica marcado como removido para o histórico manter o nome.
+        """
+        try:
+            with self._lock_edicao:
+                dados = self._visao_local().get(cliente, {})
+
+                if dados.get('criado_por') != self.user_id:
+                    print("Apenas o criador pode remover este cliente!")
+                    return False
+
+                self._registrar_no_diario('remover_cliente', cliente_id=dados['id'])
+            return True
+
+        except Exception as e:
+            print(f"Erro ao remover cliente: {e}")
+            return False
+
+    def remover_pallet(self, cliente, pallet):
+        """Remove pallet (apenas criador do cliente pode remover)"""
+        try:
+            with self._lock_edicao:
+                dados = self._visao_local().get(cliente, {})
+
+                if dados.get('criado_por') != self.user_id:
+                    print("Apenas o criador pode remover pallets!")
+                    return False
+                if pallet not in dados['pallet_ids']:
+                    return True
+
+                self._registrar_no_diario(
+                    'remover_pallet', cliente_id=dados['id'],
+                    pallet_id=dados['pallet_ids'][pallet], nome=pallet)
+            return True
+
+        except Exception as e:
+            print(f"Erro ao remover pallet: {e}")
+            return False
+
+    def atualizar_lista_clientes(self, ao_concluir=None):
+        """Republica a lista local de clientes e notifica a interface
+
+        Não relê o Firestore (o listener mantém o espelho em dia). Pode ser
+        chamado de qualquer thread; a atribuição de 'clientes' e o callback
+        ao_concluir acontecem na thread principal. Vários pedidos no mesmo
+        frame, ou dentro de uma transacao(), geram uma única publicação.
+        """
+        with self._lock:
+            if ao_concluir:
+                self._ao_publicar.append(ao_concluir)
+            if self._transacoes:
+                self._publicacao_adiada = True
+                return
+        self._publicar()
+
+    @contextmanager
+    def transacao(self):
+        """Agrupa várias edições numa única notificação on_clientes
+
+            with client_manager.transacao():
+                client_manager.adicionar_cliente(cliente)
+                client_manager.adicionar_pallet(cliente, pallet)
+        """
+        with self._lock:
+            self._transacoes += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._transacoes -= 1
+                publicar = not self._transacoes and self._publicacao_adiada
+                if publicar:
+                    self._publicacao_adiada = False
+            if publicar:
+                self._publicar()
+
+    def _publicar_clientes(self, dt):
+        with self._lock:
+            callbacks, self._ao_publicar = self._ao_publicar, []
+
+        novos = self.carregar_clientes()
+        alteracoes = diferenca_clientes(self.clientes, novos)
+        if alteracoes:
+            # Só há notificação quando algo mudou de fato
+            self.clientes = novos
+            self.dispatch('on_clientes', alteracoes)
+
+        for ao_concluir in callbacks:
+            ao_concluir()
+
+    def encerrar(self):
+        if self.listener:
+            self.listener.unsubscribe()
+
+    def on_clientes(self, alteracoes):
+        """Handler para evento de atualização (recebe um AlteracoesClientes)"""
+        pass
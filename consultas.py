@@ -0,0 +1,374 @@
+# Standard Library
+from array import array
+from datetime import date, datetime, time, timedelta, timezone
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # Opcional: sem numpy as colunas são percorridas em Python
+    np = None
+
+
+TIPO_ENTRADA = "ENTRADA"
+TIPO_SAIDA = "SAÍDA"
+
+
+def registro_de_documento(doc, nomes=None):
+    """Converte um documento de 'registros' no dicionário usado pela consulta
+
+    nomes(cliente_id, pallet_id) -> (cliente, pallet) resolve os nomes atuais
+    (ex.: ClientManager.nomes); sem ele os IDs aparecem no lugar dos nomes.
+    """
+    dados = doc.to_dict()
+    quantidade = int(dados.get('quantidade', 0))
+    cliente_id, pallet_id = dados.get('cliente_id', ''), dados.get('pallet_id', '')
+    cliente, pallet = nomes(cliente_id, pallet_id) if nomes else (cliente_id, pallet_id)
+    return {
+        'id': doc.id,
+        'cliente': cliente,
+        'pallet': pallet,
+        'cliente_id': cliente_id,
+        'pallet_id': pallet_id,
+        'quantidade': quantidade,
+        'tipo': TIPO_ENTRADA if quantidade >= 0 else TIPO_SAIDA,
+        'data': dados.get('data', ''),
+        'data_registro': dados.get('data_registro'),
+        'timestamp': dados.get('timestamp')
+    }
+
+
+def chave_ordem(registro):
+    """Chave de ordenação crescente que deixa os registros mais novos primeiro"""
+    timestamp = registro.get('timestamp')
+    # Timestamp ainda pendente no servidor conta como o mais novo
+    ordem = -timestamp.timestamp() if timestamp else float('-inf')
+    return (ordem, registro['id'])
+
+
+def filtrar_registros(registros, filtro):
+    """Varredura linear: registros com o filtro em algum campo (sem índice)"""
+    if not filtro:
+        return registros
+
+    filtro_lower = filtro.lower()
+    return [r for r in registros if
+            filtro_lower in r['cliente'].lower() or
+            filtro_lower in r['pallet'].lower() or
+            filtro_lower in r['data'].lower() or
+            filtro_lower in str(r['quantidade']).lower() or
+            filtro_lower in r['tipo'].lower()
+        ]
+
+
+## ---> REGISTROS RESIDENTES DA CONSULTA (COLUNAR) <--- ##
+_EPOCA = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSSEGUNDO = timedelta(microseconds=1)
+_PENDENTE = 2 ** 63 - 1  # Timestamp ainda pendente no servidor: o mais novo
+
+
+class _Dicionario:
+    """Codifica valores repetidos (nomes, datas) como inteiros"""
+
+    def __init__(self):
+        self.valores = []
+        self._codigos = {}
+
+    def __len__(self):
+        return len(self.valores)
+
+    def codigo(self, valor):
+        codigo = self._codigos.get(valor)
+        if codigo is None:
+            codigo = self._codigos[valor] = len(self.valores)
+            self.valores.append(valor)
+        return codigo
+
+    def contendo(self, filtro, texto=lambda valor: valor):
+        """Para cada código, se texto(valor) contém o filtro (avaliado uma vez por valor distinto)"""
+        return [filtro in texto(valor).lower() for valor in self.valores]
+
+
+class ConjuntoRegistros:
+    """Registros carregados na consulta, guardados em colunas
+
+    Cliente, pallet e o texto da data viram códigos de dicionário; o dia
+    (date.toordinal), a quantidade e o timestamp ficam em arrays tipados.
+    Busca e totais avaliam o filtro uma vez por valor distinto e expandem o
+    resultado pelos códigos, vetorizado com numpy quando instalado.
+    Alterações do listener apagam a linha antiga e acrescentam a nova no fim.
+    """
+    COMPACTAR_A_PARTIR = 1000  # Linhas apagadas toleradas antes de reescrever as colunas
+
+    def __init__(self):
+        self.clientes = _Dicionario()  # (cliente_id, cliente)
+        self.pallets = _Dicionario()   # (pallet_id, pallet)
+        self.pares = _Dicionario()     # (código do cliente, código do pallet)
+        self.datas = _Dicionario()     # Texto 'dd/mm/aaaa' como digitado
+        self.quantidades = _Dicionario()  # Quantidades distintas (para a busca por texto)
+        self.ids = []
+        self.por_id = {}               # id -> linha
+        self.cliente = array('i')
+        self.pallet = array('i')
+        self.par = array('i')
+        self.data = array('i')
+        self.dia = array('i')          # data_registro em dias; -1 se ausente
+        self.quantidade = array('q')
+        self.codigo_quantidade = array('i')
+        self.timestamp = array('q')    # Microssegundos desde 1970 (_PENDENTE se ainda sem valor)
+        self.vivo = array('b')
+        self._dias = {}                # Cache: dia -> data_registro (datetime)
+        self._apagadas = 0
+        self._ordem = None             # Cache: linhas do mais novo para o mais antigo
+        self._novas = []               # Linhas acrescentadas depois do cache de ordem
+        self._ordem_valida = False
+
+    def __len__(self):
+        return len(self.por_id)
+
+    def carregar(self, registros):
+        """Substitui todo o conjunto (carga inicial)"""
+        self.__init__()
+        for registro in registros:
+            linha = self.por_id.get(registro['id'])
+            if linha is not None:
+                self._apagar(linha)
+            self._acrescentar(registro)
+
+    def aplicar(self, alteracoes):
+        """Aplica [(tipo, registro)] com tipo ADDED/MODIFIED/REMOVED
+
+        Retorna a lista de pares (antigo, novo) efetivamente alterados; um dos
+        lados é None quando o registro entrou ou saiu do conjunto.
+        """
+        aplicadas = []
+        for tipo, registro in alteracoes:
+            antigo = None
+            linha = self.por_id.get(registro['id'])
+            if linha is not None:
+                antigo = self._registro(linha)
+                self._apagar(linha)
+
+            novo = None
+            if tipo != 'REMOVED':
+                novo = registro
+                self._acrescentar(novo)
+
+            if antigo is not None or novo is not None:
+                aplicadas.append((antigo, novo))
+
+        if self._apagadas > max(self.COMPACTAR_A_PARTIR, len(self.por_id)):
+            self.carregar(self.ordenados())
+        return aplicadas
+
+    def _acrescentar(self, registro):
+        self.por_id[registro['id']] = len(self.ids)
+        self.ids.append(registro['id'])
+        cliente = self.clientes.codigo((registro.get('cliente_id', ''), registro['cliente']))
+        pallet = self.pallets.codigo((registro.get('pallet_id', ''), registro['pallet']))
+        self.cliente.append(cliente)
+        self.pallet.append(pallet)
+        self.par.append(self.pares.codigo((cliente, pallet)))
+        self.data.append(self.datas.codigo(registro['data']))
+        data_registro = registro.get('data_registro')
+        self.dia.append(data_registro.toordinal() if data_registro else -1)
+        self.quantidade.append(registro['quantidade'])
+        self.codigo_quantidade.append(self.quantidades.codigo(registro['quantidade']))
+        timestamp = registro.get('timestamp')
+        self.timestamp.append((timestamp - _EPOCA) // _MICROSSEGUNDO if timestamp else _PENDENTE)
+        self.vivo.append(1)
+        self._novas.append(len(self.ids) - 1)
+        self._ordem_valida = False
+
+    def _apagar(self, linha):
+        del self.por_id[self.ids[linha]]
+        self.vivo[linha] = 0
+        self._apagadas += 1
+        self._ordem_valida = False
+
+    def _registro(self, linha):
+        """Reconstrói o dicionário de registro_de_documento() de uma linha"""
+        cliente_id, cliente = self.clientes.valores[self.cliente[linha]]
+        pallet_id, pallet = self.pallets.valores[self.pallet[linha]]
+        quantidade = self.quantidade[linha]
+        dia = self.dia[linha]
+        data_registro = self._dias.get(dia)
+        if data_registro is None and dia >= 0:
+            data_registro = self._dias[dia] = datetime.combine(date.fromordinal(dia), time(), timezone.utc)
+        timestamp = self.timestamp[linha]
+        return {
+            'id': self.ids[linha],
+            'cliente': cliente,
+            'pallet': pallet,
+            'cliente_id': cliente_id,
+            'pallet_id': pallet_id,
+            'quantidade': quantidade,
+            'tipo': TIPO_ENTRADA if quantidade >= 0 else TIPO_SAIDA,
+            'data': self.datas.valores[self.data[linha]],
+            'data_registro': data_registro,
+            'timestamp': _EPOCA + timestamp * _MICROSSEGUNDO if timestamp != _PENDENTE else None
+        }
+
+    def _chave(self, linha):
+        return (-self.timestamp[linha], self.ids[linha])
+
+    def _linhas_ordenadas(self):
+        """Linhas vivas na ordem de chave_ordem() (mais novas primeiro)"""
+        if self._ordem_valida:
+            return self._ordem
+
+        if np is None:
+            self._ordem = sorted((linha for linha, vivo in enumerate(self.vivo) if vivo), key=self._chave)
+        elif self._ordem is None or len(self._novas) > self.COMPACTAR_A_PARTIR:
+            timestamps = np.frombuffer(self.timestamp, dtype=np.int64)
+            vivas = np.flatnonzero(np.frombuffer(self.vivo, dtype=np.int8))
+            ordem = vivas[np.argsort(-timestamps[vivas], kind='stable')]
+            # Empates (movimentos gravados no mesmo batch) são desfeitos pelo ID
+            empates = np.flatnonzero(np.diff(timestamps[ordem]) == 0)  # Posição i empata com i + 1
+            if len(empates):
+                quebras = np.flatnonzero(np.diff(empates) != 1)
+                inicios = np.concatenate(([empates[0]], empates[quebras + 1]))
+                fins = np.concatenate((empates[quebras], [empates[-1]])) + 1
+                for inicio, fim in zip(inicios.tolist(), fins.tolist()):
+                    ordem[inicio:fim + 1] = sorted(ordem[inicio:fim + 1].tolist(), key=self.ids.__getitem__)
+            self._ordem = ordem
+        else:
+            # Poucas linhas novas: entram por busca binária na ordem já calculada
+            vivo = np.frombuffer(self.vivo, dtype=np.int8)
+            ordem = self._ordem[vivo[self._ordem] == 1]
+            novas = sorted((linha for linha in self._novas if self.vivo[linha]), key=self._chave)
+            chaves = -np.frombuffer(self.timestamp, dtype=np.int64)[ordem]
+            posicoes = np.searchsorted(chaves, [-self.timestamp[linha] for linha in novas]).tolist()
+            for indice, linha in enumerate(novas):
+                posicao = posicoes[indice]
+                while posicao < len(ordem) and self._chave(int(ordem[posicao])) < self._chave(linha):
+                    posicao += 1  # Mesmo timestamp: desempata pelo ID
+                posicoes[indice] = posicao
+            self._ordem = np.insert(ordem, posicoes, novas)
+
+        self._novas = []
+        self._ordem_valida = True
+        return self._ordem
+
+    def _mascara(self, filtro):
+        """Por linha, se algum campo exibido contém o filtro; None = sem filtro"""
+        filtro = filtro.strip().lower()
+        if not filtro:
+            return None
+
+        por_cliente = self.clientes.contendo(filtro, lambda valor: valor[1])
+        por_pallet = self.pallets.contendo(filtro, lambda valor: valor[1])
+        por_data = self.datas.contendo(filtro)
+        por_quantidade = self.quantidades.contendo(filtro, str)
+        entrada, saida = filtro in TIPO_ENTRADA.lower(), filtro in TIPO_SAIDA.lower()
+
+        if np is None:
+            return [
+                por_cliente[cliente] or por_pallet[pallet] or por_data[data]
+                or por_quantidade[codigo] or (entrada if quantidade >= 0 else saida)
+                for cliente, pallet, data, codigo, quantidade in zip(
+                    self.cliente, self.pallet, self.data, self.codigo_quantidade, self.quantidade)
+            ]
+
+        quantidades = np.frombuffer(self.quantidade, dtype=np.int64)
+        mascara = np.array(por_cliente, dtype=bool)[np.frombuffer(self.cliente, dtype=np.int32)]
+        mascara |= np.array(por_pallet, dtype=bool)[np.frombuffer(self.pallet, dtype=np.int32)]
+        mascara |= np.array(por_data, dtype=bool)[np.frombuffer(self.data, dtype=np.int32)]
+        mascara |= np.array(por_quantidade, dtype=bool)[np.frombuffer(self.codigo_quantidade, dtype=np.int32)]
+        if entrada:
+            mascara |= quantidades >= 0
+        if saida:
+            mascara |= quantidades < 0
+        return mascara
+
+    def ordenados(self):
+        """Registros do mais novo para o mais antigo"""
+        return self.filtrar("")
+
+    def filtrar(self, filtro):
+        ordem = self._linhas_ordenadas()
+        mascara = self._mascara(filtro)
+        if mascara is not None:
+            ordem = ordem[mascara[ordem]] if np is not None else [linha for linha in ordem if mascara[linha]]
+        return [self._registro(linha) for linha in (ordem.tolist() if np is not None else ordem)]
+
+    def corresponde(self, registro, filtro):
+        return bool(filtrar_registros([registro], filtro.strip()))
+
+    def somar(self, filtro=""):
+        """{(cliente, pallet): soma das quantidades} das linhas que passam no filtro"""
+        mascara = self._mascara(filtro)
+        somas = [0] * len(self.pares)
+        contagens = [0] * len(self.pares)
+        if np is None:
+            for linha, (par, quantidade) in enumerate(zip(self.par, self.quantidade)):
+                if self.vivo[linha] and (mascara is None or mascara[linha]):
+                    somas[par] += quantidade
+                    contagens[par] += 1
+        else:
+            linhas = np.frombuffer(self.vivo, dtype=np.int8).astype(bool)
+            if mascara is not None:
+                linhas &= mascara
+            pares = np.frombuffer(self.par, dtype=np.int32)[linhas]
+            quantidades = np.frombuffer(self.quantidade, dtype=np.int64)[linhas]
+            # Somas em float64: exatas enquanto o total de um par ficar abaixo de 2**53
+            somas = np.bincount(pares, weights=quantidades, minlength=len(self.pares)).astype(np.int64).tolist()
+            contagens = np.bincount(pares, minlength=len(self.pares)).tolist()
+
+        totais = {}
+        for (cliente, pallet), soma, contagem in zip(self.pares.valores, somas, contagens):
+            if contagem:
+                chave = (self.clientes.valores[cliente][1], self.pallets.valores[pallet][1])
+                totais[chave] = totais.get(chave, 0) + soma
+        return totais
+
+    @property
+    def totais(self):
+        """(cliente, pallet) -> soma das quantidades de todos os registros"""
+        return self.somar()
+
+
+## ---> PAGINAÇÃO DO HISTÓRICO <--- ##
+class PaginadorRegistros:
+    """Lê uma consulta ordenada em páginas, usando o último documento como cursor
+
+    proxima_pagina() faz I/O bloqueante e deve rodar fora da thread da
+    interface; só uma página é lida por vez.
+    """
+    TAMANHO_PAGINA = 50
+
+    def __init__(self, query, tamanho_pagina=TAMANHO_PAGINA, nomes=None):
+        self.query = query  # Já ordenada (ex.: timestamp decrescente)
+        self.tamanho_pagina = tamanho_pagina
+        self.nomes = nomes  # Ver registro_de_documento
+        self.ultimo_doc = None
+        self.esgotado = False
+        self.semeado = False
+        self._lock = threading.Lock()
+
+    def semear(self, docs):
+        """Usa a primeira página já lida (ex.: pelo listener) como ponto de partida"""
+        with self._lock:
+            if self.semeado:
+                return
+            self.semeado = True
+            docs = list(docs)
+            if docs:
+                self.ultimo_doc = docs[-1]
+            self.esgotado = len(docs) < self.tamanho_pagina
+
+    def proxima_pagina(self):
+        """Lê a próxima página e devolve os registros convertidos"""
+        with self._lock:
+            if self.esgotado:
+                return []
+
+            query = self.query.limit(self.tamanho_pagina)
+            if self.ultimo_doc is not None:
+                query = query.start_after(self.ultimo_doc)
+            docs = list(query.stream())
+
+            self.semeado = True
+            if docs:
+                self.ultimo_doc = docs[-1]
+            self.esgotado = len(docs) < self.tamanho_pagina
+        return [registro_de_documento(doc, self.nomes) for doc in docs]
@@ -0,0 +1,612 @@
+# Standard Library
+import argparse
+from datetime import datetime, timedelta
+import json
+import sqlite3
+import threading
+import uuid
+
+# Banco de Dados
+from firebase_manager import FirebaseManager
+from firestore_adiado import FieldFilter, excecoes, firestore
+import catalogo
+import saldos
+
+
+CAMINHO_DIARIO = 'diario_local.db'
+
+
+def erros_de_conexao():
+    """Falhas de rede/servidor: o grupo não tem culpa, a rodada para e tenta depois"""
+    return (
+        excecoes.Aborted, excecoes.DeadlineExceeded, excecoes.InternalServerError,
+        excecoes.ResourceExhausted, excecoes.RetryError, excecoes.ServiceUnavailable, OSError
+    )
+
+
+class OperacaoAdiada(RuntimeError):
+    """Operação que ainda não pode ser enviada; fica na fila sem contar como falha"""
+
+
+class FilaAlterada(RuntimeError):
+    """Operações pendentes foram reescritas durante o envio: a fila precisa ser relida"""
+
+
+## ---> DIÁRIO LOCAL (SQLITE) <--- ##
+class DiarioLocal:
+    """Diário local, só de inclusão, de todas as gravações do aplicativo
+
+    Entradas/saídas e edições de clientes/pallets são gravadas aqui primeiro
+    (commit local imediato) e enviadas depois ao Firestore pelo
+    Sincronizador. Cada operação tem um ID gerado no próprio aparelho, que
+    também vira o ID do documento no Firestore para evitar duplicidade.
+    Operações do mesmo 'grupo' (ex.: um formulário) são enviadas juntas.
+    As colunas 'cliente' e 'pallet' guardam os IDs do catálogo. Um grupo que
+    o servidor recusa repetidamente fica em quarentena ('falhou_em'): sai da
+    fila e das visões locais até ser reenviado com reenviar_falhas().
+    """
+    _instance = None
+
+    def __init__(self, caminho=CAMINHO_DIARIO):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS operacoes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                grupo TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                dados TEXT NOT NULL,
+                cliente TEXT,
+                pallet TEXT,
+                quantidade INTEGER,
+                criado_em TEXT NOT NULL,
+                enviado_em TEXT,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                erro TEXT,
+                falhou_em TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_operacoes_pendentes
+                ON operacoes (enviado_em, cliente);
+            CREATE INDEX IF NOT EXISTS idx_operacoes_grupo
+                ON operacoes (grupo);
+            CREATE TABLE IF NOT EXISTS saldos_conhecidos (
+                cliente TEXT NOT NULL,
+                pallet TEXT NOT NULL,
+                saldo INTEGER NOT NULL,
+                PRIMARY KEY (cliente, pallet)
+            );
+        """)
+        # Diários criados antes da quarentena
+        colunas = {linha['name'] for linha in self.conn.execute("PRAGMA table_info(operacoes)")}
+        for coluna, tipo in (('tentativas', 'INTEGER NOT NULL DEFAULT 0'), ('erro', 'TEXT'), ('falhou_em', 'TEXT')):
+            if coluna not in colunas:
+                self.conn.execute(f"ALTER TABLE operacoes ADD COLUMN {coluna} {tipo}")
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = DiarioLocal()
+        return cls._instance
+
+    # --- Gravação ---
+    def registrar(self, tipo, dados, grupo=None):
+        """Grava uma operação e retorna o seu ID"""
+        return self.registrar_varias([(tipo, dados)], grupo)[0]
+
+    def registrar_varias(self, operacoes, grupo=None):
+        """Grava [(tipo, dados)] numa única transação local e no mesmo grupo"""
+        grupo = grupo or uuid.uuid4().hex
+        agora = datetime.now().isoformat()
+        ids = []
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for tipo, dados in operacoes:
+                    id_operacao = uuid.uuid4().hex
+                    self.conn.execute(
+                        "INSERT INTO operacoes (id, grupo, tipo, dados, cliente, pallet, quantidade, criado_em) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (id_operacao, grupo, tipo, json.dumps(dados), dados.get('cliente_id'),
+                         dados.get('pallet_id'), dados.get('quantidade'), agora))
+                    ids.append(id_operacao)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def registrar_movimentos(self, movimentos):
+        """Grava os movimentos [(cliente_id, pallet_id, quantidade, data)] de um formulário
+
+        ValueError se não couberem num único batch: o grupo nunca seria aceito.
+        """
+        saldos.checar_limite(len(movimentos))
+        return self.registrar_varias([
+            ('movimento', {'cliente_id': cliente_id, 'pallet_id': pallet_id,
+                           'quantidade': quantidade, 'data': data})
+            for cliente_id, pallet_id, quantidade, data in movimentos
+        ])
+
+    # --- Fila de envio ---
+    def grupos_pendentes(self, limite=100, ignorar=()):
+        """Operações ainda não enviadas de até 'limite' grupos inteiros, na ordem de gravação
+
+        ignorar: grupos a pular (ex.: os que já falharam na rodada atual).
+        """
+        ignorar = list(ignorar)
+        with self._lock:
+            linhas = self.conn.execute(
+                "SELECT id, grupo, tipo, dados FROM operacoes "
+                "WHERE enviado_em IS NULL AND falhou_em IS NULL AND grupo IN ("
+                "    SELECT grupo FROM operacoes WHERE enviado_em IS NULL AND falhou_em IS NULL "
+                f"   AND grupo NOT IN ({','.join('?' * len(ignorar))}) "
+                "    GROUP BY grupo ORDER BY MIN(seq) LIMIT ?) "
+                "ORDER BY seq", (*ignorar, limite)).fetchall()
+
+        grupos = {}
+        for linha in linhas:
+            grupos.setdefault(linha['grupo'], []).append({
+                'id': linha['id'],
+                'grupo': linha['grupo'],
+                'tipo': linha['tipo'],
+                'dados': json.loads(linha['dados'])
+            })
+        return list(grupos.values())
+
+    def redirecionar_cliente(self, cliente_id, novo_id, pallets=None):
+        """Passa as operações pendentes de um cliente para outro ID; retorna quantas
+
+        pallets: {nome: pallet_id} do cliente de destino. Um pallet criado
+        aqui com um desses nomes vira o que já existe lá: a criação sai da
+        fila e as outras operações (movimentos inclusive) passam ao ID dele.
+        """
+        pallets = pallets or {}
+        agora = datetime.now().isoformat()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                criados = self.conn.execute(
+                    "SELECT id, pallet, json_extract(dados, '$.nome') FROM operacoes "
+                    "WHERE enviado_em IS NULL AND tipo = 'adicionar_pallet' AND cliente = ?",
+                    (cliente_id,)).fetchall()
+                for id_operacao, pallet_id, nome in criados:
+                    if nome not in pallets:
+                        continue
+                    self.conn.execute("UPDATE operacoes SET enviado_em = ? WHERE id = ?", (agora, id_operacao))
+                    self.conn.execute(
+                        "UPDATE operacoes SET pallet = ?, dados = json_set(dados, '$.pallet_id', ?) "
+                        "WHERE enviado_em IS NULL AND cliente = ? AND pallet = ?",
+                        (pallets[nome], pallets[nome], cliente_id, pallet_id))
+                quantidade = self.conn.execute(
+                    "UPDATE operacoes SET cliente = ?, dados = json_set(dados, '$.cliente_id', ?) "
+                    "WHERE enviado_em IS NULL AND cliente = ?", (novo_id, novo_id, cliente_id)).rowcount
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return quantidade
+
+    def marcar_enviadas(self, ids):
+        agora = datetime.now().isoformat()
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE operacoes SET enviado_em = ? WHERE id = ?",
+                [(agora, id_operacao) for id_operacao in ids])
+
+    def quantidade_pendente(self):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM operacoes WHERE enviado_em IS NULL AND falhou_em IS NULL").fetchone()[0]
+
+    def tem_pendentes(self, cliente_id):
+        """Há operações não enviadas envolvendo o cliente?"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM operacoes WHERE enviado_em IS NULL AND falhou_em IS NULL AND cliente = ? LIMIT 1",
+                (cliente_id,)).fetchone() is not None
+
+    # --- Quarentena ---
+    def registrar_falha(self, grupo, erro, max_tentativas):
+        """Conta uma falha de envio do grupo; retorna True se ele entrou em quarentena"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE operacoes SET tentativas = tentativas + 1, erro = ? "
+                "WHERE grupo = ? AND enviado_em IS NULL", (erro, grupo))
+            return self.conn.execute(
+                "UPDATE operacoes SET falhou_em = ? "
+                "WHERE grupo = ? AND enviado_em IS NULL AND falhou_em IS NULL AND tentativas >= ?",
+                (datetime.now().isoformat(), grupo, max_tentativas)).rowcount > 0
+
+    def grupos_com_falha(self):
+        """[(grupo, operações, erro, falhou_em)] dos grupos em quarentena"""
+        with self._lock:
+            return [tuple(linha) for linha in self.conn.execute(
+                "SELECT grupo, COUNT(*), MAX(erro), MIN(falhou_em) FROM operacoes "
+                "WHERE enviado_em IS NULL AND falhou_em IS NOT NULL GROUP BY grupo ORDER BY MIN(seq)")]
+
+    def reenviar_falhas(self, grupo=None):
+        """Devolve à fila os grupos em quarentena (ou só um); retorna quantas operações"""
+        with self._lock:
+            return self.conn.execute(
+                "UPDATE operacoes SET falhou_em = NULL, tentativas = 0, erro = NULL "
+                "WHERE enviado_em IS NULL AND falhou_em IS NOT NULL AND (? IS NULL OR grupo = ?)",
+                (grupo, grupo)).rowcount
+
+    def limpar_enviadas(self, dias=30):
+        """Apaga do diário as operações enviadas há mais de 'dias' dias"""
+        limite = (datetime.now() - timedelta(days=dias)).isoformat()
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM operacoes WHERE enviado_em IS NOT NULL AND enviado_em < ?", (limite,))
+
+    # --- Visão local (servidor + pendentes) ---
+    def saldos_pendentes(self, cliente_id):
+        """{pallet_id: soma} dos movimentos do cliente ainda não enviados"""
+        with self._lock:
+            linhas = self.conn.execute(
+                "SELECT pallet, SUM(quantidade) FROM operacoes "
+                "WHERE enviado_em IS NULL AND falhou_em IS NULL AND tipo = 'movimento' AND cliente = ? "
+                "GROUP BY pallet", (cliente_id,)).fetchall()
+        return {pallet_id: soma for pallet_id, soma in linhas}
+
+    def salvar_saldos_conhecidos(self, cliente_id, saldos_cliente):
+        """Guarda a última leitura dos saldos do servidor para uso offline"""
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM saldos_conhecidos WHERE cliente = ?", (cliente_id,))
+            self.conn.executemany(
+                "INSERT INTO saldos_conhecidos (cliente, pallet, saldo) VALUES (?, ?, ?)",
+                [(cliente_id, pallet_id, saldo) for pallet_id, saldo in saldos_cliente.items()])
+            self.conn.execute("COMMIT")
+
+    def saldos_conhecidos(self, cliente_id):
+        with self._lock:
+            linhas = self.conn.execute(
+                "SELECT pallet, saldo FROM saldos_conhecidos WHERE cliente = ?", (cliente_id,)).fetchall()
+        return {pallet_id: saldo for pallet_id, saldo in linhas}
+
+    def sobrepor_clientes(self, clientes):
+        """Aplica sobre {cliente_id: dados} as edições de clientes ainda não enviadas"""
+        with self._lock:
+            linhas = self.conn.execute(
+                "SELECT tipo, dados FROM operacoes "
+                "WHERE enviado_em IS NULL AND falhou_em IS NULL AND tipo != 'movimento' "
+                "ORDER BY seq").fetchall()
+
+        for linha in linhas:
+            dados = json.loads(linha['dados'])
+            cliente_id = dados.get('cliente_id')
+            if linha['tipo'] == 'adicionar_cliente':
+                if cliente_id is not None:
+                    clientes.setdefault(cliente_id, catalogo.documento_cliente(dados['nome'], dados['criado_por']))
+                continue
+            if cliente_id not in clientes:
+                continue  # Cliente desconhecido ou operação gravada antes dos IDs
+
+            cliente = dict(clientes[cliente_id])
+            pallets = dict(cliente.get('pallets', {}))
+            arquivados = dict(cliente.get('arquivados', {}))
+            if linha['tipo'] == 'remover_cliente':
+                cliente['removido'] = True
+            elif linha['tipo'] == 'renomear_cliente':
+                cliente['nome'] = dados['nome']
+            elif linha['tipo'] in ('adicionar_pallet', 'renomear_pallet'):
+                pallets[dados['pallet_id']] = dados['nome']
+            elif linha['tipo'] == 'remover_pallet':
+                arquivados[dados['pallet_id']] = pallets.pop(dados['pallet_id'], dados['nome'])
+            clientes[cliente_id] = dict(cliente, pallets=pallets, arquivados=arquivados)
+        return clientes
+
+
+## ---> ENVIO PARA O FIRESTORE <--- ##
+def _converter_legado(db, operacao):
+    """Traduz para IDs uma operação gravada antes do catálogo (por nome)
+
+    Os IDs de cliente/pallet criados pela operação derivam do ID dela, então
+    um reenvio gera os mesmos documentos. Enquanto a base não for migrada a
+    operação fica na fila; cliente que não existe mais gera NotFound (o grupo
+    é recusado e acaba em quarentena).
+    """
+    dados = operacao['dados']
+    if 'cliente' not in dados or 'cliente_id' in dados:
+        return operacao
+
+    tipo = operacao['tipo']
+    if tipo == 'adicionar_cliente':
+        convertidos = {'cliente_id': 'c' + operacao['id'], 'nome': dados['cliente'],
+                       'criado_por': dados['criado_por']}
+        return dict(operacao, dados=convertidos)
+
+    clientes_ref = db.collection(catalogo.COLECAO_CLIENTES)
+    docs = list(clientes_ref.where(filter=FieldFilter('nome', '==', dados['cliente'])).limit(1).stream())
+    if not docs:
+        if clientes_ref.document(dados['cliente']).get().exists:
+            raise OperacaoAdiada(
+                f"Cliente '{dados['cliente']}' fora do catálogo: rode 'python catalogo.py migrar-ids'")
+        raise excecoes.NotFound(f"Cliente '{dados['cliente']}' não existe mais")
+
+    convertidos = {k: dados[k] for k in ('quantidade', 'data') if k in dados}
+    convertidos['cliente_id'] = docs[0].id
+    if 'pallet' in dados:
+        cliente = docs[0].to_dict()
+        nomes = dict(cliente.get('arquivados', {}), **cliente.get('pallets', {}))
+        ids = {nome: pallet_id for pallet_id, nome in nomes.items()}
+        convertidos['pallet_id'] = ids.get(dados['pallet']) or 'p' + operacao['id']
+        convertidos['nome'] = dados['pallet']
+    return dict(operacao, dados=convertidos)
+
+
+def aplicar_operacoes(db, operacoes):
+    """Envia operações do diário num único batch do Firestore
+
+    Criar, renomear ou remover um cliente também cria/troca/libera a reserva
+    do nome no mesmo batch; um nome reservado por outro cliente faz o batch
+    falhar com AlreadyExists (ver _nome_em_uso).
+    """
+    clientes_ref = db.collection(catalogo.COLECAO_CLIENTES)
+    batch = db.batch()
+    nomes = {}  # cliente_id -> nome no servidor, já com as operações anteriores deste batch
+
+    def nome_atual(cliente_id):
+        if cliente_id not in nomes:
+            doc = clientes_ref.document(cliente_id).get()
+            nomes[cliente_id] = doc.to_dict().get('nome') if doc.exists else None
+        return nomes[cliente_id]
+
+    def liberar(cliente_id, nome):
+        # Clientes anteriores às reservas podem não ter a sua
+        if catalogo.dono_do_nome(db, nome) in (cliente_id, None):
+            catalogo.liberar_nome(db, batch, nome)
+
+    for operacao in operacoes:
+        operacao = _converter_legado(db, operacao)
+        dados = operacao['dados']
+        tipo = operacao['tipo']
+        if tipo == 'movimento':
+            # O ID da operação vira o ID do registro: reenvios falham com AlreadyExists
+            saldos.adicionar_movimento(
+                db, batch, dados['cliente_id'], dados['pallet_id'], dados['quantidade'],
+                dados['data'], id_registro=operacao['id'])
+            continue
+
+        # Renomear ou mexer em pallets altera só o documento do cliente
+        cliente_ref = clientes_ref.document(dados['cliente_id'])
+        if tipo == 'adicionar_cliente':
+            batch.create(cliente_ref, catalogo.documento_cliente(dados['nome'], dados['criado_por']))
+            catalogo.reservar_nome(db, batch, dados['nome'], dados['cliente_id'])
+            nomes[dados['cliente_id']] = dados['nome']
+        elif tipo in ('adicionar_pallet', 'renomear_pallet'):
+            batch.update(cliente_ref, {f"pallets.{dados['pallet_id']}": dados['nome']})
+        elif tipo == 'remover_pallet':
+            # O nome fica arquivado para o histórico do pallet
+            batch.update(cliente_ref, {
+                f"pallets.{dados['pallet_id']}": firestore.DELETE_FIELD,
+                f"arquivados.{dados['pallet_id']}": dados['nome']
+            })
+        elif tipo == 'renomear_cliente':
+            antigo = nome_atual(dados['cliente_id'])
+            if antigo is not None and catalogo.chave_nome(antigo) != catalogo.chave_nome(dados['nome']):
+                catalogo.reservar_nome(db, batch, dados['nome'], dados['cliente_id'])
+                liberar(dados['cliente_id'], antigo)
+            nomes[dados['cliente_id']] = dados['nome']
+            batch.update(cliente_ref, {'nome': dados['nome']})
+        elif tipo == 'remover_cliente':
+            # O nome fica livre para um cliente novo; o removido o mantém no histórico
+            antigo = nome_atual(dados['cliente_id'])
+            if antigo is not None:
+                liberar(dados['cliente_id'], antigo)
+            batch.update(cliente_ref, {'removido': True})
+    batch.commit()
+
+
+def _nome_em_uso(db, grupo):
+    """(operação, ID do dono) se o grupo criou/renomeou um cliente para um nome de outro"""
+    for operacao in grupo:
+        dados = operacao['dados']
+        if operacao['tipo'] in ('adicionar_cliente', 'renomear_cliente') and 'cliente_id' in dados:
+            dono = catalogo.dono_do_nome(db, dados['nome'])
+            if dono not in (None, dados['cliente_id']):
+                return operacao, dono
+    return None
+
+
+def _grupo_aplicado(db, grupo):
+    """O grupo já está no servidor? (um envio anterior chegou, a resposta não)
+
+    Os documentos que o grupo cria têm IDs derivados das operações e o grupo
+    vai sempre inteiro num batch: se todos existem, ele foi aplicado.
+    """
+    refs = []
+    for operacao in grupo:
+        operacao = _converter_legado(db, operacao)
+        if operacao['tipo'] == 'movimento':
+            refs.append(db.collection(saldos.COLECAO_REGISTROS).document(operacao['id']))
+        elif operacao['tipo'] == 'adicionar_cliente':
+            refs.append(db.collection(catalogo.COLECAO_CLIENTES).document(operacao['dados']['cliente_id']))
+    return bool(refs) and all(ref.get().exists for ref in refs)
+
+
+def totais_cliente(db, cliente_id, pallet_ids, diario=None):
+    """{pallet_id: total} do cliente: saldos do servidor + movimentos pendentes
+
+    Lê os saldos mantidos no ledger (um documento por pallet); sem conexão,
+    usa a última leitura guardada no diário local.
+    """
+    diario = diario or DiarioLocal.get_instance()
+    try:
+        saldos_servidor = saldos.obter_saldos_cliente(db, cliente_id)
+        diario.salvar_saldos_conhecidos(cliente_id, saldos_servidor)
+    except Exception as e:
+        print(f"Sem conexão, usando saldos locais: {e}")
+        saldos_servidor = diario.saldos_conhecidos(cliente_id)
+
+    # Soma os movimentos ainda não enviados (lidos depois do servidor)
+    pendentes = diario.saldos_pendentes(cliente_id)
+    return {
+        pallet_id: saldos_servidor.get(pallet_id, 0) + pendentes.get(pallet_id, 0)
+        for pallet_id in pallet_ids
+    }
+
+
+class Sincronizador:
+    """Thread que reenvia o diário local ao Firestore quando há conexão"""
+    _instance = None
+    INTERVALO = 15  # Segundos entre tentativas quando não é acordado
+    MAX_ESCRITAS_BATCH = saldos.LIMITE_BATCH
+    MAX_TENTATIVAS = 3  # Recusas de um grupo até ele ir para a quarentena
+
+    def __init__(self, diario=None):
+        self.diario = diario or DiarioLocal.get_instance()
+        self._evento = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = Sincronizador()
+        return cls._instance
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._executar, name='sincronizador', daemon=True)
+            self._thread.start()
+
+    def acordar(self):
+        """Pede um envio imediato (ex.: logo após uma gravação local)"""
+        self._evento.set()
+
+    def parar(self):
+        self._parar.set()
+        self._evento.set()
+
+    def _executar(self):
+        self.diario.limpar_enviadas()
+        while not self._parar.is_set():
+            self.sincronizar()
+            self._evento.wait(self.INTERVALO)
+            self._evento.clear()
+
+    def sincronizar(self):
+        """Envia os grupos pendentes e retorna quantas operações foram enviadas
+
+        Um grupo recusado não trava a fila: ele é pulado nesta rodada e os
+        seguintes continuam. Só erros de conexão interrompem a rodada.
+        """
+        enviadas = 0
+        pulados = set()  # Grupos recusados ou adiados nesta rodada
+        while not self._parar.is_set():
+            grupos = self.diario.grupos_pendentes(ignorar=pulados)
+            if not grupos:
+                break
+
+            try:
+                db = FirebaseManager.get_instance().db
+                for lote in self._lotes(grupos):
+                    enviadas += self._enviar_lote(db, lote, pulados)
+            except FilaAlterada:
+                continue
+            except Exception as e:
+                print(f"Sem conexão para sincronizar ({self.diario.quantidade_pendente()} pendentes): {e}")
+                break
+        return enviadas
+
+    def _lotes(self, grupos):
+        """Junta grupos inteiros em lotes que cabem num batch"""
+        lote, escritas = [], 0
+        for grupo in grupos:
+            custo = sum(
+                saldos.ESCRITAS_POR_MOVIMENTO if operacao['tipo'] == 'movimento' else 1 for operacao in grupo)
+            if lote and escritas + custo > self.MAX_ESCRITAS_BATCH:
+                yield lote
+                lote, escritas = [], 0
+            lote.append(grupo)
+            escritas += custo
+        if lote:
+            yield lote
+
+    def _enviar_lote(self, db, lote, pulados):
+        """Envia o lote e retorna quantas operações saíram da fila (erros de conexão sobem)"""
+        try:
+            aplicar_operacoes(db, [operacao for grupo in lote for operacao in grupo])
+        except erros_de_conexao():
+            raise
+        except Exception as e:
+            # Algum grupo já foi enviado antes ou foi recusado (ex.: cliente
+            # ainda não criado): reenvia grupo a grupo para isolar qual foi
+            if len(lote) > 1:
+                return sum(self._enviar_lote(db, [grupo], pulados) for grupo in lote)
+            grupo = lote[0][0]['grupo']
+            if isinstance(e, excecoes.AlreadyExists):
+                self._resolver_nome_em_uso(db, lote[0])
+            # Só sai da fila sem ser aplicado o que comprovadamente já está no servidor
+            if not (isinstance(e, excecoes.AlreadyExists) and _grupo_aplicado(db, lote[0])):
+                pulados.add(grupo)
+                if not isinstance(e, OperacaoAdiada):
+                    self._registrar_falha(grupo, len(lote[0]), e)
+                return 0
+            print(f"Grupo já aplicado num envio anterior: {grupo}")
+
+        ids = [operacao['id'] for grupo in lote for operacao in grupo]
+        self.diario.marcar_enviadas(ids)
+        return len(ids)
+
+    def _resolver_nome_em_uso(self, db, grupo):
+        """Nome já reservado por outro cliente (criado em outro aparelho)
+
+        Um cliente novo com o nome de outro vira aquele cliente: as operações
+        pendentes passam para o ID dele, como quando os clientes eram
+        identificados pelo nome, e os pallets com nomes que ele já tem passam
+        aos pallets dele (um só saldo por nome). Uma renomeação para um nome ocupado é
+        descartada. Nos dois casos a fila é relida (FilaAlterada).
+        """
+        conflito = _nome_em_uso(db, grupo)
+        if conflito is None:
+            return
+        operacao, dono = conflito
+        dados = operacao['dados']
+        self.diario.marcar_enviadas([operacao['id']])
+        if operacao['tipo'] == 'adicionar_cliente':
+            doc = db.collection(catalogo.COLECAO_CLIENTES).document(dono).get()
+            existentes = doc.to_dict().get('pallets', {}) if doc.exists else {}
+            self.diario.redirecionar_cliente(
+                dados['cliente_id'], dono, {nome: pallet_id for pallet_id, nome in existentes.items()})
+            print(f"⚠️ O cliente '{dados['nome']}' já existe; as operações pendentes foram ligadas a ele.")
+        else:
+            print(f"❌ O nome '{dados['nome']}' já é de outro cliente; renomeação descartada.")
+        raise FilaAlterada(dados['nome'])
+
+    def _registrar_falha(self, grupo, operacoes, erro):
+        if self.diario.registrar_falha(grupo, str(erro), self.MAX_TENTATIVAS):
+            print(f"❌ Grupo {grupo} ({operacoes} operação(ões)) recusado {self.MAX_TENTATIVAS} vezes, "
+                  f"em quarentena: {erro}")
+        else:
+            print(f"⚠️ Grupo {grupo} recusado, será reenviado: {erro}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grupos do diário local em quarentena (recusados pelo servidor)")
+    parser.add_argument('comando', choices=['falhas', 'reenviar'],
+                        help="'reenviar' devolve os grupos à fila de envio")
+    parser.add_argument('--grupo', help="Só este grupo (padrão: todos)")
+    args = parser.parse_args()
+
+    diario = DiarioLocal.get_instance()
+    if args.comando == 'reenviar':
+        print(f"✅ {diario.reenviar_falhas(args.grupo)} operação(ões) de volta à fila.")
+        return
+
+    falhas = [falha for falha in diario.grupos_com_falha() if args.grupo in (None, falha[0])]
+    for grupo, operacoes, erro, falhou_em in falhas:
+        print(f"❌ {grupo}  {operacoes} operação(ões)  em {falhou_em}: {erro}")
+    if not falhas:
+        print("✅ Nenhum grupo em quarentena.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Standard Library
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+# Third-party
+from kivy.clock import Clock
+
+import instrumentacao
+
+
+class FilaCheia(RuntimeError):
+    """Há tarefas de I/O demais aguardando execução"""
+
+
+class ExecutorIO:
+    """Pool de threads compartilhado para todo I/O com o Firestore
+
+    As funções rodam fora da thread principal do Kivy e os callbacks
+    (ao_concluir/ao_falhar) voltam para ela via Clock.schedule_once. Tarefas
+    submetidas com um 'dono' (normalmente a tela) podem ser canceladas de uma
+    vez quando o dono sai de cena; o resultado delas é descartado.
+    """
+    _instance = None
+    MAX_TRABALHADORES = 4
+    MAX_PENDENTES = 64  # Tamanho máximo da fila (em execução + aguardando)
+
+    def __init__(self, max_trabalhadores=MAX_TRABALHADORES, max_pendentes=MAX_PENDENTES):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_trabalhadores, thread_name_prefix='io')
+        self._vagas = threading.BoundedSemaphore(max_pendentes)
+        self._lock = threading.Lock()
+        self._por_dono = {}  # dono -> set(futures)
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = ExecutorIO()
+        return cls._instance
+
+    def submeter(self, funcao, *args, ao_concluir=None, ao_falhar=None, dono=None, **kwargs):
+        """Agenda funcao(*args, **kwargs) no pool e retorna o Future (ou None se a fila estiver cheia)"""
+        if not self._vagas.acquire(blocking=False):
+            erro = FilaCheia("Fila de I/O cheia, tente novamente")
+            self._entregar(None, ao_falhar, erro, erro)
+            return None
+
+        if instrumentacao.ativa():
+            # As leituras feitas na thread do pool contam para quem submeteu
+            funcao = instrumentacao.com_origem(instrumentacao.descrever_chamador(), funcao)
+
+        try:
+            future = self._pool.submit(funcao, *args, **kwargs)
+        except RuntimeError as e:  # Pool já encerrado
+            self._vagas.release()
+            self._entregar(None, ao_falhar, e, e)
+            return None
+
+        future.cancelado = False
+        if dono is not None:
+            with self._lock:
+                self._por_dono.setdefault(dono, set()).add(future)
+
+        future.add_done_callback(
+            lambda f: self._finalizar(f, dono, ao_concluir, ao_falhar))
+        return future
+
+    def _finalizar(self, future, dono, ao_concluir, ao_falhar):
+        # Roda na thread do pool (ou na thread que cancelou)
+        self._vagas.release()
+        if dono is not None:
+            with self._lock:
+                futures = self._por_dono.get(dono)
+                if futures is not None:
+                    futures.discard(future)
+                    if not futures:
+                        del self._por_dono[dono]
+
+        if future.cancelled():
+            return
+
+        erro = future.exception()
+        if erro is not None:
+            self._entregar(future, ao_falhar, erro, erro)
+        elif ao_concluir is not None:
+            self._entregar(future, ao_concluir, future.result())
+
+    def _entregar(self, future, callback, valor, erro=None):
+        """Chama o callback na thread principal, se a tarefa não foi cancelada"""
+        if callback is None:
+            if erro is not None:
+                print(f"Erro em tarefa de I/O: {erro}")
+            return
+
+        def executar(dt):
+            if future is None or not future.cancelado:
+                callback(valor)
+
+        Clock.schedule_once(executar)
+
+    def cancelar(self, dono):
+        """Cancela as tarefas do dono; as que já estão rodando têm o resultado descartado"""
+        with self._lock:
+            futures = self._por_dono.pop(dono, set())
+        for future in futures:
+            future.cancelado = True
+            future.cancel()
+
+    def encerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,247 @@
+# Standard Library
+import argparse
+import csv
+import glob
+import json
+import os
+
+# Banco de Dados
+from firebase_manager import FirebaseManager
+from consultas import PaginadorRegistros
+import catalogo
+import saldos
+
+
+TAMANHO_PAGINA = 1000  # Registros lidos (e gravados) por vez
+LINHAS_POR_PARTE = 100000  # Parquet: linhas por arquivo de parte
+SEPARADOR_CSV = ';'  # Abre direto no Excel em português
+SUFIXO_CURSOR = '.cursor'
+COLUNAS = ('data', 'cliente', 'pallet', 'tipo', 'quantidade',
+           'cliente_id', 'pallet_id', 'id', 'data_registro', 'timestamp')
+
+
+class ErroExportacao(RuntimeError):
+    """Exportação que não pode começar ou continuar (formato, dependência, cursor...)"""
+
+
+def _linha(registro):
+    """Valores de COLUNAS de um registro de registro_de_documento()"""
+    linha = dict(registro)
+    for campo in ('data_registro', 'timestamp'):
+        valor = linha.get(campo)
+        linha[campo] = valor.isoformat() if valor is not None else ''
+    return [linha.get(coluna, '') for coluna in COLUNAS]
+
+
+## ---> ESCRITORES <--- ##
+class _EscritorCsv:
+    """Acrescenta as páginas ao .csv; a marca de retomada é o tamanho já gravado"""
+
+    def __init__(self, caminho, marca=None):
+        posicao = (marca or {}).get('posicao', 0)
+        if posicao:
+            # Descarta o que foi escrito depois da última marca salva
+            with open(caminho, 'r+b') as arquivo:
+                arquivo.truncate(posicao)
+        self._arquivo = open(caminho, 'a' if posicao else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._arquivo, delimiter=SEPARADOR_CSV)
+        if not posicao:
+            self._writer.writerow(COLUNAS)
+
+    def escrever(self, registros):
+        self._writer.writerows(_linha(registro) for registro in registros)
+
+    def confirmar(self, final=False):
+        """Grava em disco e devolve a marca para retomar deste ponto"""
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        return {'posicao': self._arquivo.tell()}
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+class _EscritorParquet:
+    """Grava uma pasta de partes .parquet (uma página por row group)
+
+    Um .parquet só fica legível depois de fechado, então a marca de retomada
+    só avança quando uma parte é concluída; ao retomar, a parte incompleta é
+    apagada e lida de novo.
+    """
+
+    def __init__(self, caminho, marca=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ErroExportacao("Para exportar .parquet instale o pyarrow (pip install pyarrow)") from None
+
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._esquema = pyarrow.schema(
+            [(coluna, pyarrow.int64() if coluna == 'quantidade' else pyarrow.string()) for coluna in COLUNAS])
+        self._caminho = caminho
+        self._partes = (marca or {}).get('partes', 0)
+        os.makedirs(caminho, exist_ok=True)
+        for parte in glob.glob(os.path.join(caminho, 'parte-*.parquet')):
+            if self._numero(parte) >= self._partes:
+                os.remove(parte)
+        self._writer = None
+        self._linhas_parte = 0
+
+    @staticmethod
+    def _numero(parte):
+        return int(os.path.basename(parte)[len('parte-'):-len('.parquet')])
+
+    def escrever(self, registros):
+        if not registros:
+            return
+        if self._writer is None:
+            parte = os.path.join(self._caminho, f'parte-{self._partes:05d}.parquet')
+            self._writer = self._pq.ParquetWriter(parte, self._esquema)
+        colunas = list(zip(*(_linha(registro) for registro in registros)))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(valores, tipo.type) for valores, tipo in zip(colunas, self._esquema)],
+            schema=self._esquema))
+        self._linhas_parte += len(registros)
+
+    def confirmar(self, final=False):
+        """Fecha a parte cheia (ou a última) e devolve a marca; None = nada a salvar"""
+        if self._writer is None or (not final and self._linhas_parte < LINHAS_POR_PARTE):
+            return {'partes': self._partes} if final else None
+        self._writer.close()
+        self._writer = None
+        self._linhas_parte = 0
+        self._partes += 1
+        return {'partes': self._partes}
+
+    def fechar(self):
+        if self._writer is not None:
+            self._writer.close()  # Parte incompleta: é refeita ao retomar
+
+
+ESCRITORES = {'.csv': _EscritorCsv, '.parquet': _EscritorParquet}
+
+
+## ---> CURSOR DE RETOMADA <--- ##
+def _ler_estado(caminho, filtros):
+    """Estado salvo por uma exportação interrompida com os mesmos filtros, ou None"""
+    try:
+        with open(caminho + SUFIXO_CURSOR, encoding='utf-8') as arquivo:
+            estado = json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+    return estado if estado.get('filtros') == filtros else None
+
+
+def _gravar_estado(caminho, estado):
+    # Troca atômica: uma interrupção no meio nunca deixa um cursor pela metade
+    temporario = caminho + SUFIXO_CURSOR + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(estado, arquivo)
+    os.replace(temporario, caminho + SUFIXO_CURSOR)
+
+
+## ---> EXPORTAÇÃO <--- ##
+def exportar(db, caminho, cliente_id=None, inicio=None, fim=None, nomes=None,
+             tamanho_pagina=TAMANHO_PAGINA, progresso=None):
+    """Grava os registros do filtro em .csv ou .parquet, página a página; retorna quantos
+
+    Usa a mesma consulta indexada da consulta por período, então só uma
+    página fica em memória. Depois de cada página confirmada o ponto de
+    parada vai para '<caminho>.cursor': rodar de novo com os mesmos filtros
+    continua de onde parou. nomes: ver registro_de_documento.
+    """
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in ESCRITORES:
+        raise ErroExportacao(f"Formato não suportado: '{extensao}' (use .csv ou .parquet)")
+
+    filtros = {
+        'cliente_id': cliente_id,
+        'inicio': inicio and saldos.data_registro(inicio).isoformat(),
+        'fim': fim and saldos.data_registro(fim).isoformat()
+    }
+    estado = _ler_estado(caminho, filtros) if os.path.exists(caminho) else None
+    paginador = PaginadorRegistros(
+        saldos.query_periodo(db, cliente_id, inicio, fim), tamanho_pagina, nomes)
+    if estado and estado['ultimo_id']:
+        ultimo = db.collection(saldos.COLECAO_REGISTROS).document(estado['ultimo_id']).get()
+        if not ultimo.exists:
+            raise ErroExportacao(
+                f"O último registro exportado foi excluído; apague {caminho + SUFIXO_CURSOR} e exporte de novo")
+        paginador.ultimo_doc = ultimo
+
+    escritor = ESCRITORES[extensao](caminho, estado)
+    linhas = estado['linhas'] if estado else 0
+    try:
+        while True:
+            registros = paginador.proxima_pagina()
+            escritor.escrever(registros)
+            linhas += len(registros)
+            marca = escritor.confirmar(final=paginador.esgotado)
+            if marca is not None:
+                _gravar_estado(caminho, dict(
+                    marca, filtros=filtros, linhas=linhas,
+                    ultimo_id=paginador.ultimo_doc.id if paginador.ultimo_doc else None))
+            if progresso:
+                progresso(linhas)
+            if paginador.esgotado:
+                break
+    finally:
+        escritor.fechar()
+
+    os.remove(caminho + SUFIXO_CURSOR)
+    return linhas
+
+
+def nomes_do_servidor(db):
+    """nomes(cliente_id, pallet_id) -> (cliente, pallet), como ClientManager.nomes, lido do servidor"""
+    clientes = {}
+    for doc in db.collection(catalogo.COLECAO_CLIENTES).stream():
+        dados = doc.to_dict()
+        if 'nome' in dados:
+            clientes[doc.id] = (dados['nome'], dict(dados.get('arquivados', {}), **dados.get('pallets', {})))
+
+    def nomes(cliente_id, pallet_id):
+        nome, pallets = clientes.get(cliente_id, (cliente_id, {}))
+        return nome, pallets.get(pallet_id, pallet_id)
+
+    return nomes, {nome: cliente_id for cliente_id, (nome, _) in clientes.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exporta o histórico de registros para .csv ou .parquet (retoma se interrompido)")
+    parser.add_argument('arquivo', help="Destino: .csv ou .parquet (pasta de partes)")
+    parser.add_argument('--cliente', help="Nome do cliente (padrão: todos)")
+    parser.add_argument('--de', help="Data inicial (dd/mm/aaaa)")
+    parser.add_argument('--ate', help="Data final (dd/mm/aaaa)")
+    parser.add_argument('--pagina', type=int, default=TAMANHO_PAGINA, help="Registros lidos por vez")
+    args = parser.parse_args()
+
+    db = FirebaseManager.get_instance().db
+    nomes, ids_clientes = nomes_do_servidor(db)
+
+    erros = []
+    if args.cliente and args.cliente not in ids_clientes:
+        erros.append(f"Cliente não encontrado: {args.cliente}")
+    for texto in (args.de, args.ate):
+        if texto and saldos.data_registro(texto) is None:
+            erros.append(f"Data inválida: {texto} (use dd/mm/aaaa)")
+    for erro in erros:
+        print(f"❌ {erro}")
+    if erros:
+        raise SystemExit(1)
+
+    try:
+        linhas = exportar(
+            db, args.arquivo, ids_clientes.get(args.cliente), args.de, args.ate, nomes, args.pagina,
+            progresso=lambda linhas: print(f"  {linhas} registro(s) exportado(s)..."))
+    except ErroExportacao as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    print(f"✅ {linhas} registro(s) exportado(s) para {args.arquivo}.")
+
+
+if __name__ == '__main__':
+    main()
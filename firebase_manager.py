@@ -0,0 +1,75 @@
+# Standard Library
+import os
+import threading
+
+# Banco de Dados
+from banco_local import BancoLocal
+import instrumentacao
+
+
+VARIAVEL_BANCO = 'PALLET_BANCO'  # firestore (padrão) | memoria | sqlite[:arquivo]
+CAMINHO_BANCO_LOCAL = 'banco_local.db'
+
+
+class FirebaseManager:
+    _instance = None
+    _lock = threading.Lock()  # O app conecta numa thread; outras threads que pedirem antes esperam
+
+    def __init__(self, db=None):
+        if not FirebaseManager._instance:
+            db = db if db is not None else self._criar_banco(
+                os.environ.get(VARIAVEL_BANCO, 'firestore'))
+            # Com PALLET_METRICAS=1 toda chamada ao banco é contabilizada
+            self.db = instrumentacao.instrumentar(db) if instrumentacao.ativa() else db
+            FirebaseManager._instance = self
+
+    def _criar_banco(self, config):
+        """Cria o cliente do banco; o BancoLocal tem a mesma interface do Firestore"""
+        tipo, _, caminho = config.partition(':')
+        if tipo == 'memoria':
+            print("✅ Banco local em memória inicializado.")
+            return BancoLocal()
+        if tipo == 'sqlite':
+            caminho = caminho or CAMINHO_BANCO_LOCAL
+            print(f"✅ Banco local inicializado em '{caminho}'.")
+            return BancoLocal(caminho)
+        if tipo != 'firestore':
+            raise ValueError(f"{VARIAVEL_BANCO} inválido: '{config}' (use firestore, memoria ou sqlite[:arquivo])")
+
+        # Só aqui (na thread de conexão) o SDK e a pilha gRPC são carregados
+        from firebase_admin import credentials, firestore, initialize_app
+
+        try:
+            self.cred = credentials.Certificate("serviceAccountKey.json")
+            self.app = initialize_app(self.cred, {
+                'databaseURL': 'https://registrados-de-pallets.firebaseio.com',  # Exemplo
+                'projectId': 'registrados-de-pallets'  # ID do seu projeto
+            })
+            db = firestore.client()
+            print("✅ Firebase inicializado com sucesso!")
+            return db
+        except FileNotFoundError:
+            print("❌ ERRO: Arquivo 'serviceAccountKey.json' não encontrado.")
+            raise
+        except Exception as e:
+            print(f"❌ Erro crítico no Firebase: {str(e)}")
+            raise
+
+    @classmethod
+    def get_instance(cls):
+        """Instância única; a primeira chamada conecta (a interface usa PalletApp.quando_conectado)"""
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = FirebaseManager()
+        return cls._instance
+
+    @classmethod
+    def usar_banco(cls, db):
+        """Troca o banco usado por todo o app (ex.: um BancoLocal em benchmarks)"""
+        cls._instance = None
+        return cls(db)
+
+    @classmethod
+    def get_user_id(cls):
+        return "user_id_temporario"
@@ -0,0 +1,35 @@
+# Standard Library
+import importlib
+import threading
+
+
+## ---> SDK DO FIRESTORE, IMPORTADO NO PRIMEIRO USO <--- ##
+# O firebase_admin/google.cloud.firestore carrega toda a pilha gRPC, a maior
+# parte do tempo de abertura do app. Os módulos usam estes nomes em vez de
+# importar o SDK no topo: ele só é carregado quando alguém de fato precisa
+# (em geral a thread que conecta ao banco), não antes do primeiro quadro.
+class _ModuloAdiado:
+    """Módulo importado no primeiro acesso a um dos seus atributos"""
+
+    def __init__(self, nome):
+        self._nome = nome
+        self._modulo = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, atributo):
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    self._modulo = importlib.import_module(self._nome)
+        return getattr(self._modulo, atributo)
+
+    def carregado(self):
+        return self._modulo is not None
+
+
+firestore = _ModuloAdiado('firebase_admin.firestore')
+excecoes = _ModuloAdiado('google.api_core.exceptions')  # AlreadyExists, NotFound...
+
+
+def FieldFilter(*args, **kwargs):
+    return firestore.FieldFilter(*args, **kwargs)
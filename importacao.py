@@ -0,0 +1,358 @@
+# Standard Library
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import csv
+from datetime import date
+import os
+import threading
+
+# Banco de Dados
+from firebase_manager import FirebaseManager
+import catalogo
+import saldos
+
+
+LOTES_PARALELOS = 4  # Batches gravados ao mesmo tempo
+MAX_ERROS = 100  # Erros de validação guardados (os demais só são contados)
+# Cabeçalhos aceitos para cada coluna (minúsculos, sem espaços nas pontas)
+COLUNAS = {
+    'cliente': ('cliente',),
+    'pallet': ('pallet',),
+    'saldo': ('saldo', 'saldo_inicial', 'saldo inicial', 'quantidade'),
+    'data': ('data',)
+}
+
+
+class ErroImportacao(ValueError):
+    """Arquivo que não pode ser importado (formato, cabeçalho, dependência...)"""
+
+
+## ---> LEITURA EM STREAMING <--- ##
+def _mapear_cabecalho(cabecalho):
+    """{coluna: posição} a partir da primeira linha do arquivo"""
+    nomes = [str(valor or '').strip().lower() for valor in cabecalho]
+    posicoes = {}
+    for coluna, aceitos in COLUNAS.items():
+        for aceito in aceitos:
+            if aceito in nomes:
+                posicoes[coluna] = nomes.index(aceito)
+                break
+    faltando = [coluna for coluna in ('cliente', 'pallet') if coluna not in posicoes]
+    if faltando:
+        raise ErroImportacao(f"Coluna(s) obrigatória(s) ausente(s): {', '.join(faltando)}")
+    return posicoes
+
+
+def _linhas_csv(caminho):
+    with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+        amostra = arquivo.read(4096)
+        arquivo.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t')
+        except csv.Error:
+            dialeto = csv.excel  # Uma coluna só ou amostra ambígua
+        yield from csv.reader(arquivo, dialeto)
+
+
+def _linhas_xlsx(caminho):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ErroImportacao("Para importar .xlsx instale o openpyxl (pip install openpyxl)") from None
+
+    # read_only lê a planilha aos poucos, sem carregar tudo na memória
+    pasta = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        yield from pasta.active.iter_rows(values_only=True)
+    finally:
+        pasta.close()
+
+
+def ler_linhas(caminho):
+    """Gera (número da linha, {coluna: texto}) de um .csv ou .xlsx, sem carregar o arquivo inteiro"""
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao == '.csv':
+        linhas = _linhas_csv(caminho)
+    elif extensao in ('.xlsx', '.xlsm'):
+        linhas = _linhas_xlsx(caminho)
+    else:
+        raise ErroImportacao(f"Formato não suportado: '{extensao}' (use .csv ou .xlsx)")
+
+    posicoes = None
+    for numero, linha in enumerate(linhas, 1):
+        if posicoes is None:
+            posicoes = _mapear_cabecalho(linha)
+            continue
+        if not any(str(valor or '').strip() for valor in linha):
+            continue  # Linha em branco
+        yield numero, {
+            coluna: _texto(linha[posicao]) if posicao < len(linha) else ''
+            for coluna, posicao in posicoes.items()
+        }
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)  # Números do Excel chegam como float
+    if isinstance(valor, date):
+        return valor.strftime(saldos.FORMATO_DATA)  # Datas do Excel (date ou datetime)
+    return str(valor).strip()
+
+
+## ---> IMPORTAÇÃO <--- ##
+class ResultadoImportacao:
+    """Contagens de uma importação (também passado ao callback de progresso)"""
+
+    def __init__(self):
+        self.linhas_lidas = 0
+        self.linhas_gravadas = 0
+        self.clientes_criados = 0
+        self.pallets_criados = 0
+        self.saldos_gravados = 0
+        self.duplicadas = 0  # Pallets que já existiam (no app ou antes no arquivo)
+        self.erros = []  # (número da linha, mensagem), até MAX_ERROS
+        self.total_erros = 0
+        self.lotes_falhos = 0
+
+    def __repr__(self):
+        return (f"ResultadoImportacao(lidas={self.linhas_lidas}, gravadas={self.linhas_gravadas}, "
+                f"clientes={self.clientes_criados}, pallets={self.pallets_criados}, "
+                f"saldos={self.saldos_gravados}, duplicadas={self.duplicadas}, "
+                f"erros={self.total_erros}, lotes_falhos={self.lotes_falhos})")
+
+    def erro(self, numero, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS:
+            self.erros.append((numero, mensagem))
+
+
+class _Lote:
+    """Escritas de um batch: pallets novos por cliente + saldos iniciais
+
+    Os clientes que aparecem pela primeira vez no lote ('novos') são criados
+    num batch próprio, enviado antes dele.
+    """
+    MAX_NOVOS = saldos.LIMITE_BATCH // catalogo.ESCRITAS_POR_CLIENTE
+
+    def __init__(self):
+        self.clientes = {}  # cliente_id -> {pallet_id: nome}
+        self.saldos = []  # (cliente_id, pallet_id, saldo, data)
+        self.novos = {}  # cliente_id provisório -> nome
+        self.linhas = 0
+        self.duplicadas = 0
+
+    @property
+    def operacoes(self):
+        # Um documento de cliente por cliente + registro, saldo e resumo por movimento
+        return len(self.clientes) + saldos.ESCRITAS_POR_MOVIMENTO * len(self.saldos)
+
+    def gravar(self, db, criacoes):
+        """Grava o lote; criacoes: {cliente_id provisório: futuro de _criar_clientes}"""
+        for cliente_id, criacao in criacoes.items():
+            # A criação foi submetida antes deste lote: já está em andamento ou pronta
+            final, existentes, _ = criacao.result()[cliente_id]
+            if final != cliente_id:
+                self._redirecionar(cliente_id, final, existentes)
+
+        clientes_ref = db.collection(catalogo.COLECAO_CLIENTES)
+        batch = db.batch()
+        for cliente_id, pallets in self.clientes.items():
+            if pallets:
+                batch.update(clientes_ref.document(cliente_id), {
+                    f"pallets.{pallet_id}": nome for pallet_id, nome in pallets.items()
+                })
+        for cliente_id, pallet_id, saldo, data in self.saldos:
+            saldos.adicionar_movimento(db, batch, cliente_id, pallet_id, saldo, data)
+        batch.commit()
+
+    def _redirecionar(self, cliente_id, final, existentes):
+        """Cliente cujo nome já tinha dono: os pallets vão para o dono, menos os que ele já tem"""
+        pallets = self.clientes.pop(cliente_id)
+        repetidos = {pallet_id for pallet_id, nome in pallets.items() if nome in existentes}
+        self.clientes[final] = {
+            pallet_id: nome for pallet_id, nome in pallets.items() if pallet_id not in repetidos}
+        self.saldos = [
+            (final if saldo_cliente == cliente_id else saldo_cliente, pallet_id, saldo, data)
+            for saldo_cliente, pallet_id, saldo, data in self.saldos if pallet_id not in repetidos
+        ]
+        self.linhas -= len(repetidos)
+        self.duplicadas += len(repetidos)
+
+
+def _criar_clientes(db, novos, user_id):
+    """{cliente_id provisório: (ID final, {nome do pallet: id} que o cliente já tem, criado)}"""
+    resultado = {}
+    for cliente_id, (final, criado) in catalogo.criar_clientes(db, novos, user_id).items():
+        pallets = {}
+        if not criado:  # Cliente criado em outro lugar depois da leitura de 'clientes'
+            doc = db.collection(catalogo.COLECAO_CLIENTES).document(final).get()
+            pallets = {nome: pallet_id for pallet_id, nome in doc.to_dict().get('pallets', {}).items()}
+        resultado[cliente_id] = (final, pallets, criado)
+    return resultado
+
+
+def importar(db, linhas, clientes, user_id, data_padrao=None, paralelos=LOTES_PARALELOS, progresso=None):
+    """Cria clientes, pallets e saldos iniciais a partir das linhas de um arquivo
+
+    linhas: (número, {'cliente', 'pallet', 'saldo', 'data'}), ex.: ler_linhas().
+    clientes: clientes já existentes no formato de ClientManager.clientes;
+    pallets já cadastrados (ou repetidos no arquivo) são ignorados, então
+    importar o mesmo arquivo de novo não duplica nada.
+
+    Cada batch leva os pallets novos junto com os seus saldos iniciais: um
+    pallet só passa a existir com o saldo gravado. Os clientes novos de um
+    batch são criados (reservando os nomes) num batch enviado antes dele;
+    se outro aparelho já criou um cliente com o nome, os pallets vão para
+    ele. Até 'paralelos' batches ficam em voo; um batch que falhar é contado
+    em lotes_falhos e as suas linhas podem ser reimportadas.
+    progresso(resultado) é chamado a cada batch concluído (na thread do
+    executor).
+    """
+    data_padrao = data_padrao or date.today().strftime(saldos.FORMATO_DATA)
+    resultado = ResultadoImportacao()
+    # chave_nome(nome) -> {'id', 'pallets': {nome do pallet: id}}, como na reserva de nomes
+    conhecidos = {
+        catalogo.chave_nome(nome): {'id': dados['id'], 'pallets': dict(dados['pallet_ids'])}
+        for nome, dados in clientes.items()
+    }
+    criacoes = {}  # cliente_id provisório -> futuro da criação dos clientes novos
+    lote = _Lote()
+    em_voo = set()
+    lock = threading.Lock()  # Os lotes terminam nas threads do executor
+
+    def concluir(futuro, lote):
+        try:
+            futuro.result()
+        except Exception as e:
+            print(f"❌ Erro ao gravar lote ({lote.linhas} linha(s)): {e}")
+            with lock:
+                resultado.lotes_falhos += 1
+            return
+        with lock:
+            resultado.linhas_gravadas += lote.linhas
+            resultado.pallets_criados += sum(len(pallets) for pallets in lote.clientes.values())
+            resultado.saldos_gravados += len(lote.saldos)
+            resultado.duplicadas += lote.duplicadas
+            if progresso:
+                progresso(resultado)
+
+    def contar_criados(futuro):
+        if futuro.exception() is None:
+            with lock:
+                resultado.clientes_criados += sum(criado for _, _, criado in futuro.result().values())
+
+    def enviar(executor, lote):
+        # Limita os batches em voo: a leitura do arquivo espera a gravação
+        while len(em_voo) >= paralelos:
+            prontos, _ = wait(em_voo, return_when=FIRST_COMPLETED)
+            em_voo.difference_update(prontos)
+        if lote.novos:
+            # Submetida antes do lote: numa fila FIFO, nenhum lote espera uma criação que não começou
+            criacao = executor.submit(_criar_clientes, db, lote.novos, user_id)
+            criacao.add_done_callback(contar_criados)
+            criacoes.update(dict.fromkeys(lote.novos, criacao))
+        dependencias = {cliente_id: criacoes[cliente_id] for cliente_id in lote.clientes if cliente_id in criacoes}
+        futuro = executor.submit(lote.gravar, db, dependencias)
+        futuro.add_done_callback(lambda f: concluir(f, lote))
+        em_voo.add(futuro)
+
+    with ThreadPoolExecutor(max_workers=paralelos, thread_name_prefix='importacao') as executor:
+        for numero, linha in linhas:
+            resultado.linhas_lidas += 1
+            nome_cliente, pallet = linha.get('cliente', ''), linha.get('pallet', '')
+            if not nome_cliente or not pallet:
+                resultado.erro(numero, "Cliente e pallet são obrigatórios")
+                continue
+
+            texto_saldo = linha.get('saldo', '')
+            if texto_saldo and not texto_saldo.isdigit():
+                resultado.erro(numero, f"Saldo inválido: '{texto_saldo}'")
+                continue
+            data = linha.get('data', '') or data_padrao
+            if saldos.data_registro(data) is None:
+                resultado.erro(numero, f"Data inválida: '{data}' (use dd/mm/aaaa)")
+                continue
+
+            chave = catalogo.chave_nome(nome_cliente)
+            cliente = conhecidos.get(chave)
+            novo = cliente is None
+            if novo:
+                # ID provisório: vira o do dono se outro aparelho já reservou o nome
+                cliente = conhecidos[chave] = {'id': catalogo.novo_id('c'), 'pallets': {}}
+            if pallet in cliente['pallets']:
+                resultado.duplicadas += 1
+                continue
+
+            pallet_id = cliente['pallets'][pallet] = catalogo.novo_id('p')
+            saldo = int(texto_saldo or 0)
+            custo = (0 if cliente['id'] in lote.clientes else 1) + (saldos.ESCRITAS_POR_MOVIMENTO if saldo else 0)
+            if lote.operacoes + custo > saldos.LIMITE_BATCH or (novo and len(lote.novos) >= _Lote.MAX_NOVOS):
+                enviar(executor, lote)
+                lote = _Lote()
+
+            if novo:
+                lote.novos[cliente['id']] = nome_cliente
+            lote.clientes.setdefault(cliente['id'], {})[pallet_id] = pallet
+            if saldo:
+                lote.saldos.append((cliente['id'], pallet_id, saldo, data))
+            lote.linhas += 1
+
+        if lote.linhas:
+            enviar(executor, lote)
+    return resultado
+
+
+def clientes_do_servidor(db):
+    """Clientes ativos no formato de ClientManager.clientes (para uso fora do app)"""
+    clientes = {}
+    for doc in db.collection(catalogo.COLECAO_CLIENTES).stream():
+        dados = doc.to_dict()
+        if 'nome' not in dados or dados.get('removido'):
+            continue
+        clientes[dados['nome']] = {
+            'id': doc.id,
+            'pallet_ids': {nome: pallet_id for pallet_id, nome in dados.get('pallets', {}).items()}
+        }
+    return clientes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Importa clientes, pallets e saldos iniciais de um .csv ou .xlsx "
+                    "(colunas: cliente, pallet, saldo, data)")
+    parser.add_argument('arquivo')
+    parser.add_argument('--data', help="Data dos saldos iniciais sem data (dd/mm/aaaa, padrão hoje)")
+    parser.add_argument('--paralelos', type=int, default=LOTES_PARALELOS,
+                        help="Batches gravados ao mesmo tempo")
+    args = parser.parse_args()
+
+    firebase = FirebaseManager.get_instance()
+    db = firebase.db
+
+    def mostrar_progresso(resultado):
+        print(f"  {resultado.linhas_gravadas}/{resultado.linhas_lidas} linha(s) gravada(s)...")
+
+    try:
+        resultado = importar(
+            db, ler_linhas(args.arquivo), clientes_do_servidor(db), firebase.get_user_id(),
+            args.data, args.paralelos, mostrar_progresso)
+    except ErroImportacao as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+    for numero, mensagem in resultado.erros:
+        print(f"⚠️ Linha {numero}: {mensagem}")
+    if resultado.total_erros > len(resultado.erros):
+        print(f"⚠️ ... e mais {resultado.total_erros - len(resultado.erros)} erro(s)")
+    print(f"✅ {resultado.clientes_criados} cliente(s), {resultado.pallets_criados} pallet(s) e "
+          f"{resultado.saldos_gravados} saldo(s) inicial(is) importados; "
+          f"{resultado.duplicadas} pallet(s) já existente(s) ignorado(s).")
+    if resultado.lotes_falhos:
+        print(f"❌ {resultado.lotes_falhos} lote(s) falharam: importe o arquivo de novo para concluí-los.")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+# Standard Library
+from datetime import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+
+VARIAVEL_METRICAS = 'PALLET_METRICAS'  # '1' liga a contabilidade de leituras/escritas
+CAMINHO_METRICAS = 'metricas_firestore.json'
+LIMITES_HISTOGRAMA = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)  # ms
+
+_DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+# Arquivos de infraestrutura: nunca são a "origem" de uma chamada
+_ARQUIVOS_INFRA = {
+    os.path.join(_DIRETORIO_APP, nome)
+    for nome in ('instrumentacao.py', 'banco_local.py', 'executor_io.py', 'firebase_manager.py')
+}
+_contexto = threading.local()
+_arquivos = {}  # co_filename -> nome do módulo do app (ou None se for de fora/infra)
+
+
+def ativa():
+    return os.environ.get(VARIAVEL_METRICAS, '') not in ('', '0')
+
+
+## ---> ORIGEM DAS CHAMADAS <--- ##
+def descrever_chamador():
+    """Método do app mais próximo na pilha (ex.: 'TelaSaida.obter_totais_cliente')
+
+    Em threads do ExecutorIO, sem método do app na pilha, usa a origem
+    registrada quando a tarefa foi submetida.
+    """
+    frame = sys._getframe(1)
+    primeira_funcao = None
+    while frame is not None:
+        codigo = frame.f_code
+        modulo = _modulo_do_app(codigo.co_filename)
+        if modulo is not None:
+            nome = getattr(codigo, 'co_qualname', codigo.co_name).split('.<locals>')[0]
+            if '.' in nome:
+                return nome
+            if primeira_funcao is None:
+                primeira_funcao = f"{modulo}.{nome}"
+        frame = frame.f_back
+
+    return getattr(_contexto, 'origem', None) or primeira_funcao or '?'
+
+
+def _modulo_do_app(arquivo):
+    if arquivo not in _arquivos:
+        caminho = os.path.abspath(arquivo)
+        do_app = os.path.dirname(caminho) == _DIRETORIO_APP and caminho not in _ARQUIVOS_INFRA
+        _arquivos[arquivo] = os.path.splitext(os.path.basename(caminho))[0] if do_app else None
+    return _arquivos[arquivo]
+
+
+def com_origem(origem, funcao):
+    """Envolve funcao para que as chamadas feitas por ela herdem a origem dada"""
+    def executar(*args, **kwargs):
+        anterior = getattr(_contexto, 'origem', None)
+        _contexto.origem = origem
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            _contexto.origem = anterior
+    return executar
+
+
+## ---> CONTADORES E HISTOGRAMAS <--- ##
+class Metricas:
+    """Contadores de leituras/escritas e histogramas de latência por chamada
+
+    Agrupa por (operação, coleção, origem). Pode ser exportado em JSON com
+    exportar() e resumido para o painel de depuração com resumo().
+    """
+    _instance = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.limpar()
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = Metricas()
+        return cls._instance
+
+    def limpar(self):
+        with self._lock:
+            self._grupos = {}
+            self.iniciado_em = datetime.now()
+
+    def registrar(self, operacao, colecao, origem, leituras=0, escritas=0, duracao=0.0):
+        duracao_ms = duracao * 1000
+        faixa = next((i for i, limite in enumerate(LIMITES_HISTOGRAMA) if duracao_ms <= limite),
+                     len(LIMITES_HISTOGRAMA))
+        with self._lock:
+            grupo = self._grupos.get((operacao, colecao, origem))
+            if grupo is None:
+                grupo = self._grupos[(operacao, colecao, origem)] = {
+                    'chamadas': 0, 'leituras': 0, 'escritas': 0,
+                    'latencia_total_ms': 0.0, 'latencia_max_ms': 0.0,
+                    'histograma': [0] * (len(LIMITES_HISTOGRAMA) + 1)
+                }
+            grupo['chamadas'] += 1
+            grupo['leituras'] += leituras
+            grupo['escritas'] += escritas
+            grupo['latencia_total_ms'] += duracao_ms
+            grupo['latencia_max_ms'] = max(grupo['latencia_max_ms'], duracao_ms)
+            grupo['histograma'][faixa] += 1
+
+    def _copia(self):
+        with self._lock:
+            return {chave: dict(grupo, histograma=list(grupo['histograma']))
+                    for chave, grupo in self._grupos.items()}
+
+    def totais(self):
+        grupos = self._copia().values()
+        return {
+            'chamadas': sum(grupo['chamadas'] for grupo in grupos),
+            'leituras': sum(grupo['leituras'] for grupo in grupos),
+            'escritas': sum(grupo['escritas'] for grupo in grupos)
+        }
+
+    def por_origem(self):
+        """{origem: {'leituras', 'escritas', 'chamadas'}} do mais caro ao mais barato"""
+        origens = {}
+        for (_, _, origem), grupo in self._copia().items():
+            soma = origens.setdefault(origem, {'chamadas': 0, 'leituras': 0, 'escritas': 0})
+            for campo in soma:
+                soma[campo] += grupo[campo]
+        return dict(sorted(origens.items(), key=lambda item: -item[1]['leituras']))
+
+    def resumo(self, limite=5):
+        """Texto curto para o painel de depuração"""
+        totais = self.totais()
+        linhas = [f"Firestore: {totais['leituras']} leituras, {totais['escritas']} escritas, "
+                  f"{totais['chamadas']} chamadas"]
+        for origem, soma in list(self.por_origem().items())[:limite]:
+            linhas.append(f"{soma['leituras']:>7} L {soma['escritas']:>5} E  {origem}")
+        return "\n".join(linhas)
+
+    def exportar(self, caminho=CAMINHO_METRICAS):
+        faixas = [f"<={limite}ms" for limite in LIMITES_HISTOGRAMA] + [f">{LIMITES_HISTOGRAMA[-1]}ms"]
+        operacoes = []
+        for (operacao, colecao, origem), grupo in sorted(
+                self._copia().items(), key=lambda item: -item[1]['leituras']):
+            operacoes.append({
+                'operacao': operacao,
+                'colecao': colecao,
+                'origem': origem,
+                'chamadas': grupo['chamadas'],
+                'leituras': grupo['leituras'],
+                'escritas': grupo['escritas'],
+                'latencia_media_ms': round(grupo['latencia_total_ms'] / grupo['chamadas'], 3),
+                'latencia_max_ms': round(grupo['latencia_max_ms'], 3),
+                'histograma': dict(zip(faixas, grupo['histograma']))
+            })
+
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'iniciado_em': self.iniciado_em.isoformat(timespec='seconds'),
+                'exportado_em': datetime.now().isoformat(timespec='seconds'),
+                'totais': self.totais(),
+                'operacoes': operacoes
+            }, arquivo, ensure_ascii=False, indent=2)
+        return caminho
+
+
+## ---> PROXIES DO CLIENTE DO FIRESTORE <--- ##
+def _desembrulhar(valor):
+    return valor._alvo if isinstance(valor, _Proxy) else valor
+
+
+class _Proxy:
+    __slots__ = ('_alvo', '_colecao')
+
+    def __init__(self, alvo, colecao):
+        self._alvo = alvo
+        self._colecao = colecao
+
+    def __getattr__(self, nome):
+        return getattr(self._alvo, nome)
+
+    def __eq__(self, outro):
+        return self._alvo == _desembrulhar(outro)
+
+    def __hash__(self):
+        return hash(self._alvo)
+
+
+class InstantaneoInstrumentado(_Proxy):
+    __slots__ = ()
+
+    @property
+    def reference(self):
+        return DocumentoInstrumentado(self._alvo.reference, self._colecao)
+
+
+class AlteracaoInstrumentada(_Proxy):
+    __slots__ = ()
+
+    @property
+    def document(self):
+        return InstantaneoInstrumentado(self._alvo.document, self._colecao)
+
+
+class DocumentoInstrumentado(_Proxy):
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        origem = descrever_chamador()
+        inicio = time.perf_counter()
+        doc = self._alvo.get(*args, **kwargs)
+        Metricas.get_instance().registrar(
+            'get', self._colecao, origem, leituras=1, duracao=time.perf_counter() - inicio)
+        return InstantaneoInstrumentado(doc, self._colecao)
+
+    def _escrever(self, operacao, *args, **kwargs):
+        origem = descrever_chamador()
+        inicio = time.perf_counter()
+        resultado = getattr(self._alvo, operacao)(*args, **kwargs)
+        Metricas.get_instance().registrar(
+            operacao, self._colecao, origem, escritas=1, duracao=time.perf_counter() - inicio)
+        return resultado
+
+    def set(self, *args, **kwargs):
+        return self._escrever('set', *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._escrever('create', *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._escrever('update', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._escrever('delete', *args, **kwargs)
+
+    def collection(self, nome):
+        return ConsultaInstrumentada(self._alvo.collection(nome), nome)
+
+
+class AgregacaoInstrumentada(_Proxy):
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        origem = descrever_chamador()
+        inicio = time.perf_counter()
+        resultado = self._alvo.get(*args, **kwargs)
+        # Cobrança mínima de uma leitura por agregação
+        Metricas.get_instance().registrar(
+            'agregacao', self._colecao, origem, leituras=1, duracao=time.perf_counter() - inicio)
+        return resultado
+
+
+class ConsultaInstrumentada(_Proxy):
+    """CollectionReference/Query: os métodos encadeados devolvem outro proxy"""
+    __slots__ = ()
+    ENCADEADOS = {
+        'where', 'order_by', 'limit', 'limit_to_last', 'offset', 'select',
+        'start_at', 'start_after', 'end_at', 'end_before'
+    }
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._alvo, nome)
+        if nome not in self.ENCADEADOS:
+            return atributo
+
+        def encadear(*args, **kwargs):
+            args = [_desembrulhar(valor) for valor in args]
+            return ConsultaInstrumentada(atributo(*args, **kwargs), self._colecao)
+        return encadear
+
+    def document(self, *args):
+        return DocumentoInstrumentado(self._alvo.document(*args), self._colecao)
+
+    def sum(self, *args, **kwargs):
+        return AgregacaoInstrumentada(self._alvo.sum(*args, **kwargs), self._colecao)
+
+    def count(self, *args, **kwargs):
+        return AgregacaoInstrumentada(self._alvo.count(*args, **kwargs), self._colecao)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+    def stream(self, *args, **kwargs):
+        # A origem é lida agora: o gerador só roda quando for consumido
+        return self._stream(descrever_chamador(), args, kwargs)
+
+    def _stream(self, origem, args, kwargs):
+        iterador = iter(self._alvo.stream(*args, **kwargs))
+        gasto, lidos = 0.0, 0
+        try:
+            while True:
+                # Só o tempo dentro do Firestore conta, não o de quem consome
+                inicio = time.perf_counter()
+                try:
+                    doc = next(iterador)
+                except StopIteration:
+                    break
+                finally:
+                    gasto += time.perf_counter() - inicio
+                lidos += 1
+                yield InstantaneoInstrumentado(doc, self._colecao)
+        finally:
+            # Consulta sem resultado também cobra uma leitura
+            Metricas.get_instance().registrar(
+                'consulta', self._colecao, origem, leituras=max(1, lidos), duracao=gasto)
+
+    def on_snapshot(self, callback):
+        origem = descrever_chamador()
+        primeiro = [True]
+
+        def ao_receber(docs, changes, read_time):
+            inicio = time.perf_counter()
+            try:
+                callback([InstantaneoInstrumentado(doc, self._colecao) for doc in docs],
+                         [AlteracaoInstrumentada(change, self._colecao) for change in changes],
+                         read_time)
+            finally:
+                leituras = max(1, len(changes)) if primeiro[0] else len(changes)
+                primeiro[0] = False
+                # Latência aqui é o tempo gasto no callback do app
+                Metricas.get_instance().registrar(
+                    'listener', self._colecao, origem, leituras=leituras,
+                    duracao=time.perf_counter() - inicio)
+
+        return self._alvo.on_snapshot(ao_receber)
+
+
+class BatchInstrumentado(_Proxy):
+    __slots__ = ('_colecoes',)
+
+    def __init__(self, alvo):
+        super().__init__(alvo, None)
+        self._colecoes = {}
+
+    def _anotar(self, referencia):
+        if isinstance(referencia, _Proxy):
+            colecao = referencia._colecao
+        else:
+            colecao = getattr(getattr(referencia, 'parent', None), 'id', '?')
+        self._colecoes[colecao] = self._colecoes.get(colecao, 0) + 1
+        return _desembrulhar(referencia)
+
+    def set(self, referencia, *args, **kwargs):
+        self._alvo.set(self._anotar(referencia), *args, **kwargs)
+        return self
+
+    def create(self, referencia, *args, **kwargs):
+        self._alvo.create(self._anotar(referencia), *args, **kwargs)
+        return self
+
+    def update(self, referencia, *args, **kwargs):
+        self._alvo.update(self._anotar(referencia), *args, **kwargs)
+        return self
+
+    def delete(self, referencia, *args, **kwargs):
+        self._alvo.delete(self._anotar(referencia), *args, **kwargs)
+        return self
+
+    def commit(self, *args, **kwargs):
+        origem = descrever_chamador()
+        colecoes, self._colecoes = self._colecoes, {}
+        inicio = time.perf_counter()
+        resultado = self._alvo.commit(*args, **kwargs)
+        duracao = time.perf_counter() - inicio
+        metricas = Metricas.get_instance()
+        for colecao, escritas in colecoes.items():
+            metricas.registrar('batch', colecao, origem, escritas=escritas, duracao=duracao)
+        return resultado
+
+
+class ClienteInstrumentado:
+    """Envolve o cliente do Firestore (ou o BancoLocal) contando cada chamada"""
+
+    def __init__(self, db):
+        self._alvo = db
+
+    def __getattr__(self, nome):
+        return getattr(self._alvo, nome)
+
+    def collection(self, nome):
+        return ConsultaInstrumentada(self._alvo.collection(nome), nome)
+
+    def batch(self):
+        return BatchInstrumentado(self._alvo.batch())
+
+
+def instrumentar(db):
+    return db if isinstance(db, ClienteInstrumentado) else ClienteInstrumentado(db)
@@ -1,19 +1,23 @@
 # Standard Library
+from bisect import bisect_left
 from datetime import datetime
+import os
 import threading
+import time
+
+INICIO = time.perf_counter()  # Antes dos imports pesados: o tempo até o primeiro quadro os inclui
 
 # Third-party
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.core.text import LabelBase
 from kivy.core.window import Window
-from kivy.event import EventDispatcher
 from kivy.factory import Factory
 from kivy.graphics import Rectangle, Color, Line
 from kivy.metrics import dp
 from kivy.properties import (
     ListProperty, StringProperty, ObjectProperty, ColorProperty,
-    NumericProperty, BooleanProperty, DictProperty
+    NumericProperty, BooleanProperty
 )
 from kivy.uix.anchorlayout import AnchorLayout
 from kivy.uix.boxlayout import BoxLayout
@@ -21,6 +25,7 @@ from kivy.uix.button import Button
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.label import Label
 from kivy.uix.popup import Popup
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.spinner import Spinner
@@ -29,14 +34,26 @@ from kivy.uix.widget import Widget
 from kivy.utils import get_color_from_hex
 
 # Banco de Dados
-from firebase_admin import credentials, firestore, initialize_app
-from firebase_admin.firestore import FieldFilter
+from client_manager import ClientManager
+from diario_local import DiarioLocal, Sincronizador, totais_cliente
+from executor_io import ExecutorIO
+from firebase_manager import FirebaseManager
+from firestore_adiado import firestore
+from instrumentacao import Metricas
+import instrumentacao
+from perfilador import Perfilador, perfilado
+import perfilador
+from reconciliacao import reconciliar_dados, reconciliar_widgets
+from consultas import (
+    ConjuntoRegistros, PaginadorRegistros, chave_ordem, registro_de_documento
+)
+import saldos
 
 
 # Registre a fonte dos ícones sólidos
 LabelBase.register(
     name="FontAwesome",  # Nome que você usará no KV
-    fn_regular="fonts/fa-solid-900.otf"  # Caminho correto
+    fn_regular=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "fa-solid-900.otf")
 )
 
 ## ---> CLASSES DE UI DE WIDGETS <--- ##
@@ -163,221 +180,101 @@ class RoundedSpinner(Spinner):
         return super().on_touch_down(touch)
 
 
-class FirebaseManager:
-    _instance = None
-
-    def __init__(self):
-        if not FirebaseManager._instance:
-            try:
-                self.cred = credentials.Certificate("serviceAccountKey.json")
-                self.app = initialize_app(self.cred, {
-                    'databaseURL': 'https://registrados-de-pallets.firebaseio.com',  # Exemplo
-                    'projectId': 'registrados-de-pallets'  # ID do seu projeto
-                })
-                self.db = firestore.client()
-                FirebaseManager._instance = self
-                print("✅ Firebase inicializado com sucesso!")
-            except FileNotFoundError:
-                print("❌ ERRO: Arquivo 'serviceAccountKey.json' não encontrado.")
-                raise
-            except Exception as e:
-                print(f"❌ Erro crítico no Firebase: {str(e)}")
-                raise
-
-    @classmethod
-    def get_instance(cls):
-        if not cls._instance:
-            cls._instance = FirebaseManager()
-        return cls._instance
-
-    def get_user_id(self):
-        return "user_id_temporario"
-
+class PainelMetricas(Label):
+    """Painel de depuração com leituras/escritas do Firestore (PALLET_METRICAS=1)
 
-class ClientManager(EventDispatcher):
-    clientes = DictProperty({})
-    __events__ = ('on_clientes',)
-
-    def __init__(self):
-        super().__init__()
-        try:
-            self.firebase = FirebaseManager.get_instance()
-            self.db = self.firebase.db
-            self.user_id = self.firebase.get_user_id()
-            self.clientes = self.carregar_clientes()  # Carrega clientes aqui
-
-        except Exception as e:
-            print(f"Falha ao criar ClientManager: {str(e)}")
-            raise
-
-    def carregar_clientes(self):
-        """Carrega todos os clientes (visíveis para todos)"""
-        try:
-            docs = self.db.collection('clientes').stream()
-            clientes_dict = {}
-            for doc in docs:
-                dados = doc.to_dict()
-                pallets = dados.get('pallets', [])
-                pallets_ordenados = sorted(pallets)  # Ordem alfabética
-                clientes_dict[doc.id] = {
-                    'pallets': pallets_ordenados,  # Lista ordenada
-                    'criado_por': dados.get('criado_por', '')
-                }
-            
-            return clientes_dict
-        except Exception as e:
-            print(f"Erro ao carregar clientes: {e}")
-            return {}
+    F12 mostra/esconde o painel; F11 exporta o arquivo de métricas.
+    """
+    INTERVALO = 1.0  # Segundos entre atualizações do texto
+    TECLA_ALTERNAR = 293  # F12
+    TECLA_EXPORTAR = 292  # F11
 
-    def adicionar_cliente(self, nome_cliente):
-        """Adiciona novo cliente visível para todos"""
-        try:
-            cliente_ref = self.db.collection('clientes').document(nome_cliente)
-            if not cliente_ref.get().exists:
-                cliente_ref.set({
-                    'pallets': [],
-                    'criado_por': self.user_id
-                })
-                
-                self.atualizar_lista_clientes()  # Atualiza a lista local
-                return True
-            return False
-
-        except Exception as e:
-            print(f"Erro ao adicionar cliente: {e}")
-            return False
-
-    def adicionar_pallet(self, cliente, pallet):
-        """Qualquer usuário pode adicionar pallet a cliente existente"""
-        try:
-            cliente_ref = self.db.collection('clientes').document(cliente)
-            if cliente_ref.get().exists:
-                cliente_ref.update({
-                    'pallets': firestore.ArrayUnion([pallet])
-                })
-                return True
-            return False
-        except Exception as e:
-            print(f"Erro ao adicionar pallet: {e}")
-            return False
-
-    def editar_cliente(self, cliente_antigo, cliente_novo):
-        """Edita nome do cliente e atualiza todos os registros relacionados"""
-        try:
-            # 1. Verifica permissão primeiro
-            cliente_ref = self.db.collection(
-                'clientes').document(cliente_antigo)
-            doc = cliente_ref.get()
-
-            if not doc.exists:
-                print("Cliente antigo não encontrado!")
-                return False
-
-            dados = doc.to_dict()
-
-            # 1. Verifica permissão primeiro
-            if dados.get('criado_por') != self.user_id:
-                print("Apenas o criador pode editar este cliente!")
-                return False
-
-            # 3. Verifica se o novo nome já existe
-            novo_ref = self.db.collection('clientes').document(cliente_novo)
-            if novo_ref.get().exists:
-                print("Já existe um cliente com este novo nome!")
-                return False
-
-            # 4. Atualiza registros relacionados usando a sintaxe correta
-            registros_ref = self.db.collection('registros')
-            query = registros_ref.where(filter=FieldFilter('cliente', '==', cliente_antigo))
-            docs = query.stream()
-
-            batch = self.db.batch()
-            registros_para_atualizar = []
-
-            for doc in docs:
-                doc_ref = registros_ref.document(doc.id)
-                batch.update(doc_ref, {'cliente': cliente_novo})
-                registros_para_atualizar.append(doc_ref)
-
-            # 5. Cria novo documento e deleta o antigo
-            novo_ref = self.db.collection('clientes').document(cliente_novo)
-            novo_ref.set(dados)
-            cliente_ref.delete()
-
-            # 6. Executa o batch se houver registros
-            if registros_para_atualizar:
-                batch.commit()
-
-            # 6. Atualiza a lista local e notifica a interface
-            self.atualizar_lista_clientes()
+    def __init__(self, **kwargs):
+        super().__init__(
+            size_hint=(None, None), halign='left', valign='top', font_size='12sp',
+            padding=(dp(6), dp(4)), color=get_color_from_hex('#FFFFFF'), **kwargs)
+        with self.canvas.before:
+            Color(0, 0, 0, 0.7)
+            self._fundo = Rectangle(pos=self.pos, size=self.size)
+        self.bind(texture_size=self._ajustar, pos=self._redesenhar_fundo, size=self._redesenhar_fundo)
+        Window.bind(size=self._posicionar, on_key_down=self._ao_teclar)
+        Clock.schedule_interval(self.atualizar, self.INTERVALO)
+
+    def _ajustar(self, instance, tamanho):
+        self.size = tamanho
+        self._posicionar()
+
+    def _posicionar(self, *args):
+        # Canto superior esquerdo da janela
+        self.pos = (dp(5), Window.height - self.height - dp(5))
+
+    def _redesenhar_fundo(self, *args):
+        self._fundo.pos = self.pos
+        self._fundo.size = self.size
+
+    def atualizar(self, dt=None):
+        self.text = Metricas.get_instance().resumo()
+
+    def _ao_teclar(self, window, tecla, scancode, codepoint, modificadores):
+        if tecla == self.TECLA_ALTERNAR:
+            self.opacity = 0 if self.opacity else 1
             return True
+        if tecla == self.TECLA_EXPORTAR:
+            caminho = Metricas.get_instance().exportar()
+            print(f"✅ Métricas exportadas em '{caminho}'.")
+            return True
+        return False
 
-        except Exception as e:
-            print(f"Erro ao editar cliente: {e}")
-            try:
-                # Rollback mais detalhado
-                if 'novo_ref' in locals():
-                    if novo_ref.get().exists:
-                        print("Revertendo criação do novo cliente...")
-                        novo_ref.delete()
-
-                if 'cliente_ref' in locals():
-                    if not cliente_ref.get().exists and 'dados' in locals():
-                        print("Restaurando cliente original...")
-                        cliente_ref.set(dados)
-
-            except Exception as rollback_error:
-                print(f"Erro durante rollback: {rollback_error}")
-            return False
-
-    def remover_cliente(self, cliente):
-        """Remove cliente (apenas criador pode remover)"""
-        try:
-            cliente_ref = self.db.collection('clientes').document(cliente)
-            dados = cliente_ref.get().to_dict()
 
-            if dados.get('criado_por') != self.user_id:
-                print("Apenas o criador pode remover este cliente!")
-                return False
+class LinhaPallet(RecycleDataViewBehavior, BoxLayout):
+    """Linha reciclada dos formulários de pallets
 
-            cliente_ref.delete()
-            self.atualizar_lista_clientes()
-            return True
+    O estado da linha (quantidade digitada e erro de validação) fica no
+    dicionário correspondente de rv.data, não no widget: o mesmo widget é
+    reaproveitado para outros pallets durante a rolagem.
+    """
+    pallet = StringProperty('')
+    quantidade = StringProperty('')
+    erro = StringProperty('')
 
-        except Exception as e:
-            print(f"Erro ao remover cliente: {e}")
-            return False
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rv = None
+        self.indice = None
 
-    def remover_pallet(self, cliente, pallet):
-        """Remove pallet (apenas criador do cliente pode remover)"""
-        try:
-            cliente_ref = self.db.collection('clientes').document(cliente)
-            dados = cliente_ref.get().to_dict()
+    def refresh_view_attrs(self, rv, index, data):
+        # O índice muda antes do texto: ao_digitar precisa apontar para a linha nova
+        self.rv, self.indice = rv, index
+        return super().refresh_view_attrs(rv, index, data)
 
-            if dados.get('criado_por') != self.user_id:
-                print("Apenas o criador pode remover pallets!")
-                return False
+    def ao_digitar(self, texto):
+        if self.rv is None or self.indice is None or self.indice >= len(self.rv.data):
+            return
+        linha = self.rv.data[self.indice]
+        if linha['quantidade'] == texto:
+            return  # Texto vindo do próprio modelo (linha reciclada)
+
+        # Altera o dicionário sem reatribuir rv.data: nada é redesenhado a cada tecla
+        linha['quantidade'] = texto
+        linha['erro'] = ''
+        self.quantidade = texto
+        self.erro = ''
+
+    @staticmethod
+    def renomear(linha, pallet):
+        """Atualiza o nome do pallet na linha; retorna True se ele mudou"""
+        if linha['pallet'] == pallet:
+            return False
+        linha['pallet'] = pallet
+        return True
 
-            cliente_ref.update({
-                'pallets': firestore.ArrayRemove([pallet])
-            })
-            return True
 
-        except Exception as e:
-            print(f"Erro ao remover pallet: {e}")
-            return False
+class LinhaPalletRegistro(LinhaPallet):
+    pass
 
-    def atualizar_lista_clientes(self):
-        """Recarrega os clientes do Firebase e notifica a interface"""
-        try:
-            self.clientes = self.carregar_clientes()
-            self.dispatch('on_clientes')
-        except Exception as e:
-            print(f"Erro ao atualizar clientes: {e}")
 
-    def on_clientes(self, *args):
-        """Handler para evento de atualização"""
-        pass
+class LinhaPalletSaida(LinhaPallet):
+    total = NumericProperty(0)
 
 
 class EditablePalletItem(BoxLayout):
@@ -389,12 +286,13 @@ class EditablePalletItem(BoxLayout):
     marcado_exclusao = BooleanProperty(False)
     excluido = BooleanProperty(False)
 
-    def __init__(self, client_manager, pallet, **kwargs):
+    def __init__(self, client_manager, pallet, pallet_id='', **kwargs):
         super().__init__(**kwargs)
         self.client_manager = client_manager
         self.orientation = 'horizontal'
         self.size_hint_y = None
         self.height = dp(50)
+        self.pallet_id = pallet_id  # Chave da reconciliação da lista: não muda ao renomear
         self.pallet_original = pallet
         self.pallet = pallet
         self.input_pallet = None
@@ -470,6 +368,15 @@ class EditablePalletItem(BoxLayout):
             except AttributeError:
                 pass
 
+    def renomear(self, pallet):
+        """Nome atual do pallet (renomeado em outro lugar); o texto em edição é mantido"""
+        if pallet == self.pallet_original:
+            return
+        self.pallet_original = pallet  # É o nome que a edição vai renomear
+        if not self.editando:
+            self.pallet = pallet
+            self.atualizar_visualizacao()
+
     def excluir_pallet(self, instance):
         # Alterar para marcar o nome original para exclusão
         self.marcado_exclusao = not self.marcado_exclusao
@@ -485,6 +392,7 @@ class Sidebar(FloatLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.popup_pai = None
+        self.cliente_edicao = None  # Cliente exibido no popup de edição
         self.client_manager = App.get_running_app().client_manager
         self.pallets_marcados = []  # Lista para guardar pallets marcados
 
@@ -569,9 +477,6 @@ class Sidebar(FloatLayout):
             size_hint=(0.55, 0.60)
         )
 
-        btn_salvar.bind(on_press=lambda x: self.salvar_registro(popup))
-        btn_cancelar.bind(on_press=popup.dismiss)
-
         popup.open()
 
     def adicionar_input_pallet(self):
@@ -591,39 +496,36 @@ class Sidebar(FloatLayout):
         ]
 
         if cliente and pallets:
-            try:
-                success = self.client_manager.adicionar_cliente(cliente)
-                if not success:
-                    return
-
-                    # Adiciona pallets de forma assíncrona
-                def adicionar_pallets(_):
-                    try:
-                        for pallet in pallets:
-                            self.client_manager.adicionar_pallet(cliente, pallet)
-                    
-                        Clock.schedule_once(lambda dt: self.finalizar_registro(popup))
-                
-                    except Exception as e:
-                        pass
+            # Cliente e pallets são gravados no executor de I/O
+            def adicionar_cliente_pallets():
+                # Cliente e pallets chegam à interface numa única notificação
+                with self.client_manager.transacao():
+                    if not self.client_manager.adicionar_cliente(cliente):
+                        return False
+                    for pallet in pallets:
+                        self.client_manager.adicionar_pallet(cliente, pallet)
+                return True
 
-                threading.Thread(target=adicionar_pallets, args=(None,)).start()
+            def concluir(sucesso):
+                if sucesso:
+                    self.finalizar_registro(popup)
 
-            except Exception as e:
-                pass
+            ExecutorIO.get_instance().submeter(
+                adicionar_cliente_pallets,
+                ao_concluir=concluir,
+                ao_falhar=lambda e: print(f"Erro ao registrar cliente: {e}"))
         else:
             pass
 
     def finalizar_registro(self, popup):
         try:
-            # Atualiza dados locais
-            self.client_manager.atualizar_lista_clientes()
-        
-            # Atualiza UI
-            self.atualizar_interface_pai()
-            Clock.schedule_once(lambda dt: self.atualizar_todos_spinners())
+            # Atualiza dados locais e, quando chegarem, a UI
+            def atualizar_ui():
+                self.atualizar_interface_pai()
+                self.atualizar_todos_spinners()
+
+            self.client_manager.atualizar_lista_clientes(ao_concluir=atualizar_ui)
 
-            # Fecha popup só depois de tudo atualizado
             popup.dismiss()
         
         except Exception as e:
@@ -632,22 +534,23 @@ class Sidebar(FloatLayout):
     def atualizar_todos_spinners(self):
         app = App.get_running_app()
     
-        # Atualiza Spinner na TelaRegistro
-        tela_registro = app.root.get_screen('registro')
-        tela_registro.ids.cliente_spinner.values = list(self.client_manager.clientes.keys())
+        # Atualiza Spinner na TelaRegistro (telas ainda não abertas leem a lista ao serem criadas)
+        tela_registro = app.root.tela_criada('registro')
+        if tela_registro is not None:
+            tela_registro.ids.cliente_spinner.values = list(self.client_manager.clientes.keys())
     
         # Atualiza Spinner na TelaSaida
-        tela_saida = app.root.get_screen('saida')
-        tela_saida.ids.cliente_spinner_saida.values = list(self.client_manager.clientes.keys())
+        tela_saida = app.root.tela_criada('saida')
+        if tela_saida is not None:
+            tela_saida.ids.cliente_spinner_saida.values = list(self.client_manager.clientes.keys())
     
     def atualizar_interface_pai(self):
         try:
-            # Atualiza dados locais primeiro
-            self.client_manager.atualizar_lista_clientes()
-        
-            # Atualiza a tela de registro
+            # Atualiza a tela de registro (dados locais já recarregados)
             app = App.get_running_app()
-            tela_registro = app.root.get_screen('registro')
+            tela_registro = app.root.tela_criada('registro')
+            if tela_registro is None:
+                return  # Ainda não aberta: já nasce com a lista atual
         
             # Força atualização dos componentes
             tela_registro.ids.cliente_spinner.values = list(self.client_manager.clientes.keys())
@@ -678,17 +581,8 @@ class Sidebar(FloatLayout):
         def carregar_pallets(instance, value):
             cliente = spinner_clientes.text
             if cliente in self.client_manager.clientes:
-                self.lista_pallets.clear_widgets()
-                pallets = sorted(self.client_manager.clientes[cliente]['pallets'])  # Ordena os pallets
-                for pallet in pallets:
-                    item = EditablePalletItem(
-                        client_manager=self.client_manager,
-                        pallet = pallet,
-                        cliente = cliente
-                    )
-                    # Adicione bind para atualização contínua
-                    item.marcado_exclusao = pallet in self.pallets_marcados
-                    self.lista_pallets.add_widget(item)
+                self.cliente_edicao = cliente
+                self._reconciliar_lista_pallets(cliente)
 
         has_clients = bool(self.client_manager.clientes)
         
@@ -887,66 +781,71 @@ class Sidebar(FloatLayout):
             cliente_antigo = spinner_clientes.text
             novo_nome_cliente = input_novo_nome.text.strip()
 
-            try:
-                # 2. Processar edição do nome do cliente
-                if novo_nome_cliente and novo_nome_cliente != cliente_antigo:
-                    if not client_manager.editar_cliente(cliente_antigo, novo_nome_cliente):
-                        return
-
-                # 3. Processar exclusões de pallets marcados
-                cliente_atual = novo_nome_cliente if novo_nome_cliente else cliente_antigo
-                
-                # 4. Processar edições de nomes de pallets
-                pallets_para_atualizar = []
-                for item in self.lista_pallets.children:
-                    if isinstance(item, EditablePalletItem) and item.editando:
-                        novo_nome = item.pallet.strip()  # Pega o valor atualizado
-                        if novo_nome and novo_nome != item.pallet_original:
-                            pallets_para_atualizar.append((
-                            item.pallet_original,  # Nome antigo
-                        novo_nome              # Nome novo
-                    ))
-                
-                # 5. Atualizar pallets no Firebase
-                for antigo, novo in pallets_para_atualizar:
-                    client_manager.remover_pallet(cliente_atual, antigo)
-                    client_manager.adicionar_pallet(cliente_atual, novo)
-
-                pallets_para_excluir = [
-                    item.pallet for item in self.lista_pallets.children 
-                    if isinstance(item, EditablePalletItem) and item.marcado_exclusao
-                ]
-                
-                for pallet in pallets_para_excluir:
-                    client_manager.remover_pallet(cliente_atual, pallet)
-
-                # 6. Adicionar novo pallet
-                novo_pallet = input_novo_pallet.text.strip()
-                if novo_pallet:
-                    client_manager.adicionar_pallet(cliente_atual, novo_pallet)
-
-                    # 7. Forçar atualização global
-                Clock.schedule_once(lambda dt: [
-                    client_manager.atualizar_lista_clientes(),
-                    self.atualizar_interface(),
-                    setattr(spinner_clientes, 'values', list(client_manager.clientes.keys()))
-                ])
-        
-                client_manager.atualizar_lista_clientes()
+            # 3. Processar exclusões de pallets marcados
+            cliente_atual = novo_nome_cliente if novo_nome_cliente else cliente_antigo
+
+            # 4. Processar edições de nomes de pallets
+            pallets_para_atualizar = []
+            for item in self.lista_pallets.children:
+                if isinstance(item, EditablePalletItem) and item.editando:
+                    novo_nome = item.pallet.strip()  # Pega o valor atualizado
+                    if novo_nome and novo_nome != item.pallet_original:
+                        pallets_para_atualizar.append((
+                        item.pallet_original,  # Nome antigo
+                    novo_nome              # Nome novo
+                ))
+
+            pallets_para_excluir = [
+                item.pallet for item in self.lista_pallets.children 
+                if isinstance(item, EditablePalletItem) and item.marcado_exclusao
+            ]
+
+            novo_pallet = input_novo_pallet.text.strip()
+
+            # Estado da tela já coletado: as gravações rodam no executor de I/O
+            def gravar_alteracoes():
+                # Todas as edições chegam às telas numa única notificação
+                with client_manager.transacao():
+                    # 2. Processar edição do nome do cliente
+                    if novo_nome_cliente and novo_nome_cliente != cliente_antigo:
+                        if not client_manager.editar_cliente(cliente_antigo, novo_nome_cliente):
+                            return False
+
+                    # 5. Atualizar pallets no Firebase (o ID e o histórico continuam)
+                    for antigo, novo in pallets_para_atualizar:
+                        client_manager.renomear_pallet(cliente_atual, antigo, novo)
+
+                    for pallet in pallets_para_excluir:
+                        client_manager.remover_pallet(cliente_atual, pallet)
+
+                    # 6. Adicionar novo pallet
+                    if novo_pallet:
+                        client_manager.adicionar_pallet(cliente_atual, novo_pallet)
+                return True
+
+            def concluir(sucesso):
+                if not sucesso:
+                    return
+
+                # 7. Forçar atualização global
                 input_novo_pallet.text = ''
                 self.pallets_marcados = []  # Limpa os marcadores
-                self.atualizar_interface()
+                self.atualizar_interface(
+                    ao_concluir=lambda: setattr(
+                        spinner_clientes, 'values', list(client_manager.clientes.keys())))
                 popup.dismiss()
 
-            except Exception as e:
-                print(f"Erro ao salvar alterações: {e}")
-                self.mostrar_erro("Erro ao salvar alterações!")
+            ExecutorIO.get_instance().submeter(
+                gravar_alteracoes,
+                ao_concluir=concluir,
+                ao_falhar=lambda e: print(f"Erro ao salvar alterações: {e}"))
 
         def excluir_registro(instance):
             cliente = spinner_clientes.text
-            self.client_manager.remover_cliente(cliente)
             popup.dismiss()
-            self.atualizar_interface()
+            ExecutorIO.get_instance().submeter(
+                self.client_manager.remover_cliente, cliente,
+                ao_concluir=lambda sucesso: self.atualizar_interface())
 
         # --- CONFIGURAÇÃO FINAL ---
         btn_salvar.bind(on_press=salvar_alteracoes)
@@ -963,44 +862,70 @@ class Sidebar(FloatLayout):
         elif not value and pallet in self.pallets_marcados:
             self.pallets_marcados.remove(pallet)
 
-    def atualizar_interface(self, instance=None, value=None):
+    def _reconciliar_lista_pallets(self, cliente):
+        """Ajusta a lista do popup de edição aos pallets atuais do cliente
+
+        Itens de pallets que continuam no cliente são mantidos como estão
+        (edição em andamento, marcação de exclusão); só os que entraram ou
+        saíram são criados ou removidos.
+        """
+        clientes = self.client_manager.clientes
+        pallet_ids = clientes[cliente]['pallet_ids'] if cliente in clientes else {}
+        nomes = {pallet_id: pallet for pallet, pallet_id in pallet_ids.items()}
+
+        def criar(pallet_id):
+            pallet = nomes[pallet_id]
+            item = EditablePalletItem(
+                client_manager=self.client_manager,
+                pallet=pallet,
+                pallet_id=pallet_id,
+                cliente=cliente
+            )
+            # Restaura o estado de marcação
+            item.marcado_exclusao = pallet in self.pallets_marcados
+            item.bind(marcado_exclusao=self.on_pallet_marcado)
+            return item
+
+        # Por ID: um pallet renomeado continua no mesmo item (ordem alfabética)
+        reconciliar_widgets(
+            self.lista_pallets, [(cliente, pallet_ids[pallet]) for pallet in sorted(pallet_ids)],
+            chave_de=lambda item: (item.cliente, item.pallet_id),
+            criar=lambda chave: criar(chave[1]),
+            atualizar=lambda item, chave: item.renomear(nomes[chave[1]]))
+
+    @perfilado
+    def atualizar_interface(self, instance=None, value=None, ao_concluir=None):
         """Força atualização completa da interface"""
+        def redesenhar():
+            self._redesenhar_interface()
+            if ao_concluir:
+                ao_concluir()
+
+        # Atualiza dados locais e Firebase; a UI é redesenhada quando chegarem
+        App.get_running_app().client_manager.atualizar_lista_clientes(ao_concluir=redesenhar)
+
+    @perfilado
+    def _redesenhar_interface(self):
         try:
             app = App.get_running_app()
-            # Atualiza dados locais e Firebase
-            app.client_manager.atualizar_lista_clientes()
-            
             telas = {
                 'registro': 'cliente_spinner', 
                 'saida': 'cliente_spinner_saida'
             }
 
             for screen_name, spinner_id in telas.items():
-                tela = app.root.get_screen(screen_name)
-                if hasattr(tela, 'ids') and spinner_id in tela.ids:
+                tela = app.root.tela_criada(screen_name)
+                if tela is not None and spinner_id in tela.ids:
                     spinner = tela.ids[spinner_id]
                     spinner.values = list(app.client_manager.clientes.keys())  # Convertemos para lista
         
             # Atualiza o próprio popup (se existir)
             if hasattr(self, 'lista_pallets'):
-                self.lista_pallets.clear_widgets()
-                if app.client_manager.clientes:
-                    clientes_lista = list(app.client_manager.clientes.keys())
-                    if clientes_lista:
-                        cliente = clientes_lista[0]
-                        # Ordenar os pallets
-                        pallets = sorted(app.client_manager.clientes[cliente]['pallets'])
-                        for pallet in pallets:
-                            item = EditablePalletItem(
-                                client_manager=app.client_manager,
-                                pallet=pallet,
-                                cliente=cliente
-                            )
-                            # Restaura o estado de marcação
-                            if pallet in self.pallets_marcados:
-                                item.marcado_exclusao = True
-                            item.bind(marcado_exclusao=self.on_pallet_marcado)
-                            self.lista_pallets.add_widget(item)
+                clientes = app.client_manager.clientes
+                # Continua no cliente escolhido no popup; se ele sumiu, usa o primeiro
+                cliente = self.cliente_edicao if self.cliente_edicao in clientes else next(iter(clientes), None)
+                self.cliente_edicao = cliente
+                self._reconciliar_lista_pallets(cliente)
 
         except Exception as e:
             print(f"Erro na atualização: {str(e)}")
@@ -1021,6 +946,10 @@ class BaseScreen(Screen):
         self.sidebar.popup_pai = self.popup
         self.popup.open()
 
+    def on_leave(self, *args):
+        # Descarta leituras pendentes desta tela
+        ExecutorIO.get_instance().cancelar(self)
+
 
 # ---> TELAS DO APLICATIVO <--- #
 class TelaInicial(Screen):
@@ -1033,9 +962,9 @@ class TelaRegistro(BaseScreen):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.cliente_linhas = None  # Cliente cujas linhas estão na lista de pallets
         self.client_manager = App.get_running_app().client_manager
-        self.client_manager.bind(clientes=self.atualizar_pallets)
-        self.client_manager.bind(clientes=lambda inst, val: self.atualizar_spinners())
+        self.client_manager.bind(on_clientes=self.ao_alterar_clientes)
         self.carregar_dados()
 
     def voltar_para_registro(self):
@@ -1044,50 +973,52 @@ class TelaRegistro(BaseScreen):
     
     def atualizar_interface(self):
         """Atualiza a lista de clientes e pallets"""
-        self.client_manager.atualizar_lista_clientes()
-        self.atualizar_pallets()
-        self.ids.cliente_spinner.values = list(self.client_manager.clientes.keys())
+        def atualizar_ui():
+            self.atualizar_pallets()
+            self.ids.cliente_spinner.values = list(self.client_manager.clientes.keys())
+
+        self.client_manager.atualizar_lista_clientes(ao_concluir=atualizar_ui)
     
     def atualizar_spinners(self):
         """Atualiza os valores do spinner dinamicamente"""
         self.ids.cliente_spinner.values = list(self.client_manager.clientes.keys())
 
+    @perfilado
+    def ao_alterar_clientes(self, client_manager, alteracoes):
+        """Uma atualização por publicação do ClientManager, só no que mudou"""
+        if alteracoes.nomes_alterados:
+            self.atualizar_spinners()
+
+        cliente = self.ids.cliente_spinner.text
+        novo_nome = alteracoes.renomeados.get(cliente)
+        if novo_nome:
+            self.cliente_linhas = novo_nome  # As quantidades digitadas seguem o novo nome
+            self.ids.cliente_spinner.text = novo_nome  # on_text chama atualizar_pallets
+        elif alteracoes.afeta(cliente):
+            self.atualizar_pallets()
+
+    @perfilado
     def atualizar_pallets(self, *args):
         cliente = self.ids.cliente_spinner.text
         if cliente not in self.client_manager.clientes:
             return
 
-        pallets = self.client_manager.clientes[cliente]['pallets']
-
-        # Limpa todos os pallets existentes
-        self.ids.pallets_container.clear_widgets()
-
-        # Adiciona uma linha para cada pallet do cliente
-        for pallet in pallets:
-            linha = BoxLayout(
-                orientation='horizontal',
-                size_hint=(1, None),
-                height=dp(70),
-                padding=dp(10),
-                spacing=dp(15))
-
-            # Label com nome do pallet
-            lbl_pallet = Label(
-                text = pallet,
-                size_hint_x = 0.4,
-                color = get_color_from_hex('#000000'),
-                font_size = '16sp')
-
-            # Input de quantidade
-            input_quantidade = RoundedTextInput(
-                hint_text = "Quantidade",
-                size_hint_x = 0.4,
-                size_hint_y = None,
-                height = dp(50))
-
-            linha.add_widget(lbl_pallet)
-            linha.add_widget(input_quantidade)
-            self.ids.pallets_container.add_widget(linha)
+        dados = self.client_manager.clientes[cliente]
+        pallet_ids = [dados['pallet_ids'][pallet] for pallet in dados['pallets']]
+        nomes = {pallet_id: pallet for pallet, pallet_id in dados['pallet_ids'].items()}
+
+        # Uma linha por pallet (pelo ID): pallets que continuam, mesmo
+        # renomeados, mantêm a quantidade digitada
+        rv = self.ids.rv_pallets
+        atuais = rv.data if cliente == self.cliente_linhas else []
+        self.cliente_linhas = cliente
+        linhas, alterado = reconciliar_dados(
+            atuais, pallet_ids, 'pallet_id',
+            criar=lambda pallet_id: {
+                'pallet_id': pallet_id, 'pallet': nomes[pallet_id], 'quantidade': '', 'erro': ''},
+            atualizar=lambda linha, pallet_id: LinhaPallet.renomear(linha, nomes[pallet_id]))
+        if alterado:
+            rv.data = linhas
 
     def carregar_dados(self):
         # Remova toda a lógica do Excel
@@ -1101,64 +1032,63 @@ class TelaRegistro(BaseScreen):
     def registrar_pallets(self):
         data = self.ids.data_input.text.strip()
         cliente = self.ids.cliente_spinner.text
+        cliente_id = self.client_manager.clientes.get(cliente, {}).get('id')
 
-        # Conexão com o Firebase
-        db = FirebaseManager.get_instance().db
-        registros_ref = db.collection('registros')
-
-        # Lista para armazenar erros
+        # Lista para armazenar erros e movimentos validados
         erros = []
+        movimentos = []
+
+        # A data precisa ser válida para entrar nas consultas por período
+        if saldos.data_registro(data) is None:
+            erros.append("Data inválida (use dd/mm/aaaa)")
+
+        # Valida todas as linhas antes de gravar qualquer coisa
+        rv = self.ids.rv_pallets
+        for linha in rv.data:
+            quantidade = linha['quantidade'].strip()
+
+            if not quantidade:
+                linha['erro'] = "Quantidade não informada"
+            elif not quantidade.isdigit():
+                linha['erro'] = "Quantidade inválida"
+            else:
+                linha['erro'] = ''
+                movimentos.append((cliente_id, linha['pallet_id'], int(quantidade), data))
+                continue
+
+            erros.append(f"{linha['erro']} para {linha['pallet']}")
+
+        rv.refresh_from_data()  # Destaca as linhas com erro
+
+        if movimentos and cliente_id is None:
+            erros.append("Cliente não encontrado (removido?)")
+
+        # A entrega é enviada num único batch: acima do limite ela nunca seria aceita
+        try:
+            saldos.checar_limite(len(movimentos))
+        except ValueError as e:
+            erros.append(str(e))
 
-        # Processa cada registro
-        for child in self.ids.pallets_container.children:
-            if isinstance(child, BoxLayout):
-                # Encontra os componentes na linha
-                lbl_pallet = None
-                input_quantidade = None
-
-                for widget in child.children:
-                    if isinstance(widget, Label):
-                        lbl_pallet = widget
-                    elif isinstance(widget, RoundedTextInput):
-                        input_quantidade = widget
-
-                # Valida e coleta os dados
-                if lbl_pallet and input_quantidade:
-                    quantidade = input_quantidade.text.strip()
-
-                    if not quantidade:
-                        erros.append(
-                            f"Quantidade não informada para {lbl_pallet.text}")
-                        continue
-
-                    if not quantidade.isdigit():
-                        erros.append(
-                            f"Quantidade inválida para {lbl_pallet.text}")
-                        continue
-
-                    try:
-                        # Adiciona registro no Firebase
-                        registros_ref.add({
-                            'cliente': cliente,
-                            'pallet': lbl_pallet.text,
-                            'quantidade': int(quantidade),
-                            'data': data,
-                            'timestamp': firestore.SERVER_TIMESTAMP
-                        })
-                    except Exception as e:
-                        erros.append(
-                            f"Erro ao salvar {lbl_pallet.text}: {str(e)}")
-
-        # Feedback ao usuário
         if erros:
             self.mostrar_popup("Erros", "\n".join(erros))
-        else:
-            self.mostrar_popup("Sucesso", "Registros salvos com sucesso!")
-            self.voltar_menu()
+            return
+
+        # Grava a entrega inteira no diário local (tudo ou nada); o envio ao
+        # Firestore acontece em segundo plano quando houver conexão
+        try:
+            DiarioLocal.get_instance().registrar_movimentos(movimentos)
+        except Exception as e:
+            self.mostrar_popup("Erros", f"Erro ao salvar registros: {str(e)}")
+            return
+
+        Sincronizador.get_instance().acordar()
+        self.mostrar_popup("Sucesso", "Registros salvos com sucesso!")
+        self.voltar_menu()
 
     def voltar_menu(self):
         self.ids.cliente_spinner.text = "Selecione um Cliente"
-        self.ids.pallets_container.clear_widgets()
+        self.ids.rv_pallets.data = []
+        self.cliente_linhas = None
         self.ids.data_input.text = ""
 
     def mostrar_popup(self, titulo, mensagem):
@@ -1215,9 +1145,9 @@ class TelaSaida(BaseScreen):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.cliente_linhas = None  # Cliente cujas linhas estão na lista de pallets
         self.client_manager = App.get_running_app().client_manager
-        self.client_manager.bind(clientes=self.atualizar_pallets)
-        self.client_manager.bind(clientes=lambda inst, val: self.atualizar_spinners())
+        self.client_manager.bind(on_clientes=self.ao_alterar_clientes)
         self.carregar_dados()
 
     def carregar_dados(self):
@@ -1227,6 +1157,21 @@ class TelaSaida(BaseScreen):
         """Atualiza os valores do spinner dinamicamente"""
         self.ids.cliente_spinner_saida.values = list(self.client_manager.clientes.keys())
 
+    @perfilado
+    def ao_alterar_clientes(self, client_manager, alteracoes):
+        """Uma atualização por publicação do ClientManager, só no que mudou"""
+        if alteracoes.nomes_alterados:
+            self.atualizar_spinners()
+
+        cliente = self.ids.cliente_spinner_saida.text
+        novo_nome = alteracoes.renomeados.get(cliente)
+        if novo_nome:
+            self.cliente_linhas = novo_nome  # As quantidades digitadas seguem o novo nome
+            self.ids.cliente_spinner_saida.text = novo_nome  # on_text chama atualizar_pallets
+        elif alteracoes.afeta(cliente):
+            self.atualizar_pallets()
+
+    @perfilado
     def atualizar_pallets(self, *args):
         cliente = self.ids.cliente_spinner_saida.text
 
@@ -1234,83 +1179,64 @@ class TelaSaida(BaseScreen):
             return  # Não faz nada se nenhum cliente estiver selecionado
         
         if cliente not in self.client_manager.clientes:
-            self.ids.pallets_container_saida.clear_widgets()
+            self.ids.rv_pallets_saida.data = []
+            self.cliente_linhas = None
             return
 
-        # Obtém a lista de pallets do cliente (igual à TelaRegistro)
-        pallets = self.client_manager.clientes[cliente].get('pallets', [])
+        # Obtém os pallets do cliente (igual à TelaRegistro)
+        dados = self.client_manager.clientes[cliente]
 
         # Agendando a atualização da UI para o próximo frame
-        Clock.schedule_once(lambda dt: self._atualizar_ui(pallets))
+        Clock.schedule_once(lambda dt: self._atualizar_ui(dados))
 
-    def _atualizar_ui(self, pallets):
-        self.ids.pallets_container_saida.clear_widgets()
+    @perfilado
+    def _atualizar_ui(self, dados):
         cliente = self.ids.cliente_spinner_saida.text
-        totais = self.obter_totais_cliente(cliente)
-
-        for pallet in pallets:
-            total = totais.get(pallet, 0)
-            # Criação da lista de pallets
-            linha = BoxLayout(
-                orientation='horizontal',
-                size_hint=(1, None),
-                height=dp(70),
-                spacing=dp(10)
-            )
-
-            lbl_pallet = Label(
-                text = pallet,
-                font_size = '16sp',
-                size_hint_x = 0.4,
-                halign = 'left',
-                color = get_color_from_hex('#000000'), 
-            )
 
-            lbl_total = Label(
-                text = f"Total: {total}",
-                font_size = '16sp',
-                size_hint_x = 0.4,
-                halign = 'left',
-                color = get_color_from_hex('#2E7D32'))  # Cor verde para destaque
-        
-            input_saida = RoundedTextInput(
-                hint_text = "Qtde. Saída",
-                size_hint_x = 0.4,
-                input_filter = 'int',
-                size_hint_y = None,
-                height = dp(50)
-            )
-
-            linha.add_widget(lbl_pallet)
-            linha.add_widget(lbl_total)
-            linha.add_widget(input_saida)
-            self.ids.pallets_container_saida.add_widget(linha)
+        # Os totais são lidos em segundo plano; descarta pedidos anteriores
+        executor = ExecutorIO.get_instance()
+        executor.cancelar(self)
+        executor.submeter(
+            self.obter_totais_cliente, cliente,
+            ao_concluir=lambda totais: self._preencher_pallets(cliente, dados, totais),
+            dono=self)
+
+    @perfilado
+    def _preencher_pallets(self, cliente, dados, totais):
+        if cliente != self.ids.cliente_spinner_saida.text:
+            return  # O cliente mudou enquanto os totais eram lidos
+
+        pallet_ids = [dados['pallet_ids'][pallet] for pallet in dados['pallets']]
+        nomes = {pallet_id: pallet for pallet, pallet_id in dados['pallet_ids'].items()}
+
+        def atualizar_linha(linha, pallet_id):
+            total = totais.get(pallet_id, 0)
+            alterado = LinhaPallet.renomear(linha, nomes[pallet_id])
+            if linha['total'] == total:
+                return alterado
+            linha['total'] = total
+            return True
 
-        # Atualizações necessárias para o Kivy renderizar corretamente
-        self.ids.pallets_container_saida.height = self.ids.pallets_container_saida.minimum_height
-        self.ids.pallets_container_saida.do_layout()
+        rv = self.ids.rv_pallets_saida
+        atuais = rv.data if cliente == self.cliente_linhas else []
+        self.cliente_linhas = cliente
+        linhas, alterado = reconciliar_dados(
+            atuais, pallet_ids, 'pallet_id',
+            criar=lambda pallet_id: {
+                'pallet_id': pallet_id, 'pallet': nomes[pallet_id],
+                'total': totais.get(pallet_id, 0), 'quantidade': '', 'erro': ''},
+            atualizar=atualizar_linha)
+        if alterado:
+            rv.data = linhas
 
     def obter_totais_cliente(self, cliente):
+        """{pallet_id: total} dos pallets ativos do cliente"""
         try:
-            cliente_info = self.client_manager.clientes.get(cliente, {})
-            pallets_cliente = cliente_info.get('pallets', [])
-
-            # Inicializa todos os pallets com total 0
-            totais = {pallet: 0 for pallet in pallets_cliente}
-
-            # Busca registros e soma as quantidades
+            cliente_info = self.client_manager.clientes.get(cliente)
+            if cliente_info is None:
+                return {}
             db = FirebaseManager.get_instance().db
-            registros_ref = db.collection('registros')
-            query = registros_ref.where(filter=FieldFilter('cliente', '==', cliente))
-            docs = query.stream()
-
-            for doc in docs:
-                data = doc.to_dict()
-                pallet = data.get('pallet', '')
-                quantidade = data.get('quantidade', 0)
-                if pallet in totais:
-                    totais[pallet] += quantidade
-            return totais
+            return totais_cliente(db, cliente_info['id'], list(cliente_info['pallet_ids'].values()))
 
         except Exception as e:
             print(f"Erro ao buscar totais: {e}")
@@ -1329,59 +1255,79 @@ class TelaSaida(BaseScreen):
             self.mostrar_popup("Erro", "Selecione um cliente!")
             return
 
+        cliente_id = self.client_manager.clientes.get(cliente, {}).get('id')
         erros = []
-        db = FirebaseManager.get_instance().db
-        totais = self.obter_totais_cliente(cliente)  # Busca os totais atuais
-
-        for child in self.ids.pallets_container_saida.children:
-            if isinstance(child, BoxLayout):
-                lbl_pallet = None
-                input_saida = None
-
-                for widget in child.children:
-                    if isinstance(widget, RoundedTextInput):
-                        input_saida = widget
-                    elif isinstance(widget, Label) and "Total:" not in widget.text:
-                        lbl_pallet = widget
-                    
-                if lbl_pallet and input_saida:
-                    pallet = lbl_pallet.text
-                    total = totais.get(pallet, 0)
-                    saida = input_saida.text.strip()
-                
-                    if not saida:
-                        continue
-                    
-                    if not saida.isdigit():
-                        erros.append(f"Quantidade inválida para {pallet}")
-                        continue
-                    
-                    saida = int(saida)
-                
-                    if saida > total:
-                        erros.append(f"Saída maior que o total ({pallet})")
-                        continue
-                    
-                    try:
-                        db.collection('registros').add({
-                            'cliente': cliente,
-                            'pallet': pallet,
-                            'quantidade': -saida,
-                            'data': data,
-                            'timestamp': firestore.SERVER_TIMESTAMP
-                        })
-                    except Exception as e:
-                        erros.append(f"Erro ao registrar {pallet}: {str(e)}")
+        saidas = {}  # {pallet_id: quantidade}
+        nomes = {}
+
+        if saldos.data_registro(data) is None:
+            erros.append("Data inválida (use dd/mm/aaaa)")
+
+        rv = self.ids.rv_pallets_saida
+        for linha in rv.data:
+            saida = linha['quantidade'].strip()
+            linha['erro'] = ''
+
+            if not saida:
+                continue
+
+            if not saida.isdigit():
+                linha['erro'] = "Quantidade inválida"
+                erros.append(f"Quantidade inválida para {linha['pallet']}")
+                continue
+
+            saidas[linha['pallet_id']] = int(saida)
+            nomes[linha['pallet_id']] = linha['pallet']
+
+        rv.refresh_from_data()  # Destaca as linhas com erro
+
+        if saidas and cliente_id is None:
+            erros.append("Cliente não encontrado (removido?)")
+
+        try:
+            saldos.checar_limite(len(saidas))
+        except ValueError as e:
+            erros.append(str(e))
 
         if erros:
             self.mostrar_popup("Erros", "\n".join(erros))
-        else:
+            return
+
+        def gravar(totais):
+            # Confere os saldos (servidor + pendentes) antes de gravar
+            excedidos = {
+                pallet_id for pallet_id, saida in saidas.items() if saida > totais.get(pallet_id, 0)
+            }
+            if excedidos:
+                if cliente == self.cliente_linhas:
+                    for linha in rv.data:
+                        if linha['pallet_id'] in excedidos:
+                            linha['erro'] = "Saída maior que o total"
+                    rv.refresh_from_data()
+                self.mostrar_popup("Erros", "\n".join(
+                    f"Saída maior que o total ({pallet})"
+                    for pallet in sorted(nomes[pallet_id] for pallet_id in excedidos)))
+                return
+
+            try:
+                DiarioLocal.get_instance().registrar_movimentos(
+                    [(cliente_id, pallet_id, -saida, data) for pallet_id, saida in saidas.items()])
+            except Exception as e:
+                self.mostrar_popup("Erros", f"Erro ao registrar saídas: {str(e)}")
+                return
+
+            Sincronizador.get_instance().acordar()
             self.mostrar_popup("Sucesso", "Saídas registradas com sucesso!")
             self.voltar_menu()
 
+        # Os saldos são lidos em segundo plano; a gravação local volta para a UI
+        ExecutorIO.get_instance().submeter(
+            self.obter_totais_cliente, cliente, ao_concluir=gravar)
+
     def voltar_menu(self):
         self.ids.cliente_spinner_saida.text = "Selecione um Cliente"
-        self.ids.pallets_container_saida.clear_widgets()
+        self.ids.rv_pallets_saida.data = []
+        self.cliente_linhas = None
         self.ids.data_input_saida.text = ""
 
     def mostrar_popup(self, titulo, mensagem):
@@ -1423,123 +1369,462 @@ class TelaSaida(BaseScreen):
 class TelaConsulta(Screen):
     registros = ListProperty([])
     totais = ListProperty([])
+    ATRASO_BUSCA = 0.25  # Segundos sem digitar antes de aplicar o filtro
+    LIMITE_DELTAS = 200  # Acima disso é mais barato redesenhar a lista inteira
+    ATRASO_TOTAIS = 1.0  # Agrupa várias gravações numa única atualização dos totais
+    TAMANHO_PAGINA = PaginadorRegistros.TAMANHO_PAGINA  # Registros lidos por página
+    LIMIAR_ROLAGEM = 0.1  # scroll_y abaixo disso (perto do fim) exibe a próxima página
+    TODOS_CLIENTES = "Todos os Clientes"
 
     # Adicionar inicialização do listener
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.listener = None
+        self.conjunto = ConjuntoRegistros()  # Registros residentes + totais + índice
+        self.paginador = None
+        self._pagina_pronta = None  # Próxima página já lida (prefetch), ainda não exibida
+        self._lendo_pagina = False
+        self._exibir_ao_ler = False
+        self._chaves_visiveis = []  # chave_ordem() de cada linha em self.registros
+        self._saldo_em = None  # (cliente_id ou None, data final) da consulta por período
+        # {(cliente_id, pallet_id): total} lido do servidor e mantido pelos deltas do listener
+        self._totais_ids = None
+        self._primeiro_snapshot = False
+        self._busca_trigger = Clock.create_trigger(
+            lambda dt: self.processar_dados(), self.ATRASO_BUSCA)
+        self._totais_trigger = Clock.create_trigger(
+            lambda dt: self.calcular_totais(), self.ATRASO_TOTAIS)
+        self.client_manager = App.get_running_app().client_manager
+        self.client_manager.bind(on_clientes=self.ao_alterar_clientes)
 
     def on_pre_enter(self):
+        clientes = self.client_manager.clientes
+        self.ids.cliente_periodo.values = [self.TODOS_CLIENTES] + sorted(clientes)
+        self.ids.cliente_periodo.text = self.TODOS_CLIENTES
+        self.ids.periodo_inicio.text = ""
+        self.ids.periodo_fim.text = ""
+        # O primeiro snapshot do listener traz a página mais recente
         self.iniciar_listener()
-        Clock.schedule_once(lambda dt: self.carregar_registros())
 
     def on_leave(self):
+        self._parar_listener()
+
+    def ao_alterar_clientes(self, client_manager, alteracoes):
+        """Os registros guardam IDs: nomes novos só exigem reler o que está na tela"""
+        if self.manager is None or self.manager.current != self.name:
+            return
+        if alteracoes.nomes_alterados:
+            self.ids.cliente_periodo.values = [self.TODOS_CLIENTES] + sorted(client_manager.clientes)
+            novo_nome = alteracoes.renomeados.get(self.ids.cliente_periodo.text)
+            if novo_nome:
+                self.ids.cliente_periodo.text = novo_nome
+        if (alteracoes.renomeados or alteracoes.pallets_renomeados) and self.listener:
+            self.carregar_registros()
+
+    def _parar_listener(self):
         if self.listener:
             self.listener.unsubscribe()
+            self.listener = None
+        ExecutorIO.get_instance().cancelar(self)
+
+    def _reiniciar_paginas(self, paginador):
+        # Recomeça do zero: a primeira página chega inteira como ADDED
+        self.conjunto = ConjuntoRegistros()
+        self.paginador = paginador
+        self._pagina_pronta = None
+        self._lendo_pagina = False
+        self._exibir_ao_ler = False
 
     def iniciar_listener(self):
-        db = FirebaseManager.get_instance().db
+        self._saldo_em = None
+        # Antes da conexão terminar, o listener só abre quando o banco ficar pronto
+        App.get_running_app().quando_conectado(self._abrir_listener)
+
+    def _abrir_listener(self, db):
+        if self.manager is None or self.manager.current != self.name:
+            return  # Saiu da tela antes da conexão
+        if self.listener:
+            self.listener.unsubscribe()
+        self._totais_ids = None
+        self._primeiro_snapshot = True
         # Ordena por timestamp decrescente (registros mais novos primeiro)
         registros_ref = db.collection('registros').order_by('timestamp', direction=firestore.Query.DESCENDING)
-        self.listener = registros_ref.on_snapshot(self.atualizar_registros)
+        self._reiniciar_paginas(
+            PaginadorRegistros(registros_ref, self.TAMANHO_PAGINA, self.client_manager.nomes))
+        # O listener acompanha só a página mais recente; as antigas vêm por cursor
+        self.listener = registros_ref.limit(self.TAMANHO_PAGINA).on_snapshot(self.atualizar_registros)
 
     def atualizar_registros(self, snapshot, changes, read_time):
-        registros_brutos = []
-        for doc in snapshot:
-            data = doc.to_dict()
-            quantidade = int(data.get('quantidade', 0))
-            tipo = "ENTRADA" if quantidade >= 0 else "SAÍDA"
-            registros_brutos.append({
-                'cliente': data.get('cliente', ''),
-                'pallet': data.get('pallet', ''),
-                'quantidade': quantidade,
-                'tipo': tipo,
-                'data': data.get('data', ''),
-                'viewclass': 'RegistroConsultaItem'  # Obrigatório para RecycleView
-            })
-
-        self.processar_dados(registros_brutos)
+        # Roda na thread do listener: converte apenas os documentos alterados
+        alteracoes = []
+        saidas = []
+        for change in changes:
+            if change.type.name == 'REMOVED':
+                # Com limit(), REMOVED também significa "empurrado para fora da
+                # janela" por um registro novo; só sai da tela se foi excluído
+                saidas.append(change.document.reference)
+            else:
+                alteracoes.append((change.type.name, registro_de_documento(
+                    change.document, self.client_manager.nomes)))
+
+        # A primeira página do listener é o ponto de partida do cursor
+        self.paginador.semear(snapshot)
+        # Só os snapshots seguintes trazem movimentos novos (fora dos totais já lidos)
+        movimentos, self._primeiro_snapshot = not self._primeiro_snapshot, False
+
+        def aplicar(dt):
+            self.aplicar_alteracoes(alteracoes, movimentos)
+            if saidas:
+                ExecutorIO.get_instance().submeter(
+                    self._confirmar_exclusoes, saidas,
+                    ao_concluir=self._aplicar_exclusoes,
+                    ao_falhar=lambda e: print(f"Erro ao conferir exclusões: {e}"),
+                    dono=self)
+            self.verificar_rolagem()
+
+        Clock.schedule_once(aplicar)
+
+    def _confirmar_exclusoes(self, referencias):
+        """IDs dos documentos que saíram da janela do listener por terem sido excluídos"""
+        return [ref.id for ref in referencias if not ref.get().exists]
+
+    def _aplicar_exclusoes(self, ids):
+        if ids:
+            # Exclusões são raras e trazem de volta à janela registros antigos
+            # como ADDED: os totais são relidos em vez de corrigidos
+            self._totais_ids = None
+        self.aplicar_alteracoes([('REMOVED', {'id': id_registro}) for id_registro in ids])
+
+    # --- Paginação do histórico ---
+    def verificar_rolagem(self, *args):
+        """Exibe a próxima página quando a lista chega perto do fim (ou não enche a tela)"""
+        if self.paginador is None or self.ids.tabs.current_tab.text != 'Histórico Completo':
+            return
+
+        rv = self.ids.rv_historico
+        sem_rolagem = rv.layout_manager is not None and rv.layout_manager.height <= rv.height
+        if sem_rolagem or rv.scroll_y <= self.LIMIAR_ROLAGEM:
+            self.carregar_proxima_pagina()
+        elif self._pagina_pronta is None:
+            self._ler_pagina()  # Prefetch enquanto o usuário ainda rola
+
+    def carregar_proxima_pagina(self):
+        if self._pagina_pronta is not None:
+            pagina, self._pagina_pronta = self._pagina_pronta, None
+            self._exibir_pagina(pagina)
+        else:
+            self._exibir_ao_ler = True
+            self._ler_pagina()
+
+    def _ler_pagina(self):
+        # Uma leitura por vez: o cursor do paginador avança a cada página
+        if self._lendo_pagina or self.paginador.esgotado:
+            return
+        self._lendo_pagina = True
+        paginador = self.paginador
+
+        def concluir(pagina):
+            if paginador is not self.paginador:
+                return  # Listener reiniciado enquanto a página era lida
+            self._lendo_pagina = False
+            if self._exibir_ao_ler:
+                self._exibir_ao_ler = False
+                self._exibir_pagina(pagina)
+            else:
+                self._pagina_pronta = pagina
+
+        def falhar(erro):
+            self._lendo_pagina = False
+            print(f"Erro ao carregar página do histórico: {erro}")
+
+        ExecutorIO.get_instance().submeter(
+            paginador.proxima_pagina, ao_concluir=concluir, ao_falhar=falhar, dono=self)
+
+    def _exibir_pagina(self, pagina):
+        if pagina:
+            self.aplicar_alteracoes([('ADDED', registro) for registro in pagina])
+        # Já deixa a página seguinte lida e confere se a tela encheu
+        Clock.schedule_once(self.verificar_rolagem)
+
+    @perfilado
+    def aplicar_alteracoes(self, alteracoes, movimentos=False):
+        """Aplica os deltas do listener aos registros residentes e à tela
+
+        Com movimentos=True as alterações são gravações novas e também
+        entram nos totais residentes.
+        """
+        aplicadas = self.conjunto.aplicar(alteracoes)
+        if not aplicadas:
+            return
+        if movimentos and self._totais_ids is not None:
+            self._somar_deltas(aplicadas)
+
+        if len(aplicadas) > self.LIMITE_DELTAS:
+            self.processar_dados()
+            return
+
+        if self.ids.tabs.current_tab.text == 'Histórico Completo':
+            filtro = self.ids.busca_input.text.strip().lower()
+            for antigo, novo in aplicadas:
+                self._atualizar_linha(antigo, novo, filtro)
+
+        elif self.ids.tabs.current_tab.text == 'Totais por Cliente':
+            self._totais_trigger()
+
+    def _somar_deltas(self, aplicadas):
+        """Acumula nos totais residentes a diferença de cada registro alterado"""
+        for antigo, novo in aplicadas:
+            for registro, sinal in ((antigo, -1), (novo, 1)):
+                if registro is not None:
+                    par = (registro['cliente_id'], registro['pallet_id'])
+                    self._totais_ids[par] = self._totais_ids.get(par, 0) + sinal * registro['quantidade']
+
+    def _atualizar_linha(self, antigo, novo, filtro):
+        """Remove/insere uma única linha do histórico na posição ordenada"""
+        if antigo is not None:
+            chave = chave_ordem(antigo)
+            posicao = bisect_left(self._chaves_visiveis, chave)
+            if posicao < len(self._chaves_visiveis) and self._chaves_visiveis[posicao] == chave:
+                del self._chaves_visiveis[posicao]
+                del self.registros[posicao]
+
+        if novo is not None and self.conjunto.corresponde(novo, filtro):
+            chave = chave_ordem(novo)
+            posicao = bisect_left(self._chaves_visiveis, chave)
+            self._chaves_visiveis.insert(posicao, chave)
+            self.registros.insert(posicao, self._linha_historico(novo))
+
+    def definir_registros(self, registros_brutos):
+        """Substitui os registros residentes (carga completa)"""
+        self.conjunto.carregar(registros_brutos)
+        self.processar_dados()
+
+    def agendar_busca(self, texto):
+        """Reinicia a espera a cada tecla; o filtro roda só quando parar de digitar"""
+        self._busca_trigger.cancel()
+        self._busca_trigger()
+
+    def _linha_historico(self, item):
+        return {
+            'cliente': item['cliente'],
+            'pallet': item['pallet'],
+            'quantidade': str(item['quantidade']),
+            'tipo': item['tipo'],
+            'data': item['data'],
+            'viewclass': 'RegistroConsultaItem'
+        }
 
     # Novo método unificado de processamento
-    def processar_dados(self, registros_brutos):
+    @perfilado
+    def processar_dados(self, registros_brutos=None):
         filtro = self.ids.busca_input.text.strip().lower()
 
         if self.ids.tabs.current_tab.text == 'Histórico Completo':
-            registros_filtrados = self._filtrar_historico(registros_brutos, filtro)
-            self.registros = [{
-                'cliente': item['cliente'],
-                'pallet': item['pallet'],
-                'quantidade': str(item['quantidade']),
-                'tipo': item['tipo'],
-                'data': item['data'],
-                'viewclass': 'RegistroConsultaItem'
-            } for item in registros_filtrados]
-            self.ids.rv_historico.data = self.registros
+            if registros_brutos is None:
+                registros_filtrados = self.conjunto.filtrar(filtro)
+            else:
+                registros_filtrados = self._filtrar_historico(registros_brutos, filtro)
+            self._chaves_visiveis = [chave_ordem(item) for item in registros_filtrados]
+            self.registros = [self._linha_historico(item) for item in registros_filtrados]
 
         elif self.ids.tabs.current_tab.text == 'Totais por Cliente':
             self.calcular_totais(registros_brutos, filtro)
 
-    # Método simplificado de carregamento
+    # Recarrega o histórico a partir da primeira página
     def carregar_registros(self, filtro=""):
-        try:
-            db = FirebaseManager.get_instance().db
-            registros_ref = db.collection('registros').order_by('timestamp', direction=firestore.Query.DESCENDING)
-            docs = registros_ref.stream()
-
-            registros_brutos = []
-            for doc in docs:
-                data = doc.to_dict()
-                quantidade = int(data.get('quantidade', 0))
-                tipo = "ENTRADA" if quantidade >= 0 else "SAÍDA"
-                registros_brutos.append({
-                    'cliente': data.get('cliente', ''),
-                    'pallet': data.get('pallet', ''),
-                    'quantidade': quantidade,
-                    'tipo': tipo,
-                    'data': data.get('data', '')
-                })
-
-            self.processar_dados(registros_brutos)  # Reutiliza o processamento
+        self._parar_listener()
+        self.iniciar_listener()
 
-        except Exception as e:
-            print(f"Erro na consulta: {e}")
+    # --- Consulta por cliente e período ---
+    def consultar_periodo(self, cliente=None, inicio=None, fim=None):
+        """Troca o histórico ao vivo pelos registros do cliente entre as datas
+
+        Só os documentos do intervalo são lidos, página a página, pela
+        consulta indexada em 'data_registro'. Com data final, a aba de totais
+        mostra os saldos naquela data.
+        """
+        self._parar_listener()
+        cliente_id = self.client_manager.clientes.get(cliente, {}).get('id', cliente) if cliente else None
+        self._saldo_em = (cliente_id, fim) if fim is not None else None
+
+        def consultar(db):
+            query = saldos.query_periodo(db, cliente_id, inicio, fim)
+            self._reiniciar_paginas(
+                PaginadorRegistros(query, self.TAMANHO_PAGINA, self.client_manager.nomes))
+            self.processar_dados()
+            self.carregar_proxima_pagina()
+
+        App.get_running_app().quando_conectado(consultar)
+
+    def _ler_periodo(self):
+        """(cliente ou None, inicio, fim) dos campos do período; None se houver erro"""
+        cliente = self.ids.cliente_periodo.text
+        texto_inicio = self.ids.periodo_inicio.text.strip()
+        texto_fim = self.ids.periodo_fim.text.strip()
+
+        erros = []
+        inicio = saldos.data_registro(texto_inicio) if texto_inicio else None
+        fim = saldos.data_registro(texto_fim) if texto_fim else None
+        if texto_inicio and inicio is None:
+            erros.append("Data inicial inválida (use dd/mm/aaaa)")
+        if texto_fim and fim is None:
+            erros.append("Data final inválida (use dd/mm/aaaa)")
+        if inicio and fim and inicio > fim:
+            erros.append("A data inicial é depois da data final")
+
+        if erros:
+            self.mostrar_popup("Erros", "\n".join(erros))
+            return None
+        return None if cliente == self.TODOS_CLIENTES else cliente, inicio, fim
+
+    def aplicar_periodo(self):
+        periodo = self._ler_periodo()
+        if periodo is None:
+            return
+
+        if periodo == (None, None, None):
+            self.carregar_registros()  # Sem filtro: volta ao histórico ao vivo
+            return
+
+        self.consultar_periodo(*periodo)
+
+    def exportar(self):
+        """Exporta para .csv os registros do cliente/período escolhidos
 
-    # Filtro unificado
+        Roda em segundo plano, página a página; exportar de novo o mesmo
+        filtro continua uma exportação interrompida.
+        """
+        periodo = self._ler_periodo()
+        if periodo is None:
+            return
+        cliente, inicio, fim = periodo
+        cliente_id = self.client_manager.clientes.get(cliente, {}).get('id', cliente) if cliente else None
+        partes = ['registros', cliente or 'todos'] + [data.strftime('%Y%m%d') for data in (inicio, fim) if data]
+        caminho = '_'.join(partes).replace(os.sep, '-') + '.csv'
+
+        import exportacao  # Só carregado quando alguém exporta (não pesa na abertura do app)
+
+        self.mostrar_popup("Exportação", f"Exportando para {caminho}...")
+        App.get_running_app().quando_conectado(lambda db: ExecutorIO.get_instance().submeter(
+            exportacao.exportar, db, caminho,
+            cliente_id, inicio, fim, self.client_manager.nomes,
+            ao_concluir=lambda linhas: self.mostrar_popup(
+                "Exportação", f"{linhas} registro(s) exportado(s) para {caminho}"),
+            ao_falhar=lambda e: self.mostrar_popup("Erro", f"Falha ao exportar: {e}")))
+
+    def limpar_filtros(self):
+        self.ids.busca_input.text = ""
+        if self.listener is None:
+            self.ids.cliente_periodo.text = self.TODOS_CLIENTES
+            self.ids.periodo_inicio.text = ""
+            self.ids.periodo_fim.text = ""
+            self.carregar_registros()
+
+    # Filtro unificado: a mesma busca colunar dos registros residentes
     def _filtrar_historico(self, registros, filtro):
-        if not filtro:
-            return registros
-
-        filtro_lower = filtro.lower()
-        return [r for r in registros if
-                filtro_lower in r['cliente'].lower() or
-                filtro_lower in r['pallet'].lower() or
-                filtro_lower in r['data'].lower() or
-                filtro_lower in str(r['quantidade']).lower() or
-                filtro_lower in r['tipo'].lower()
-            ]
+        conjunto = ConjuntoRegistros()
+        conjunto.carregar(registros)
+        return conjunto.filtrar(filtro)
+
+    def calcular_totais(self, registros_brutos=None, filtro=""):
+        if registros_brutos is not None:
+            # Soma de uma lista já carregada, agrupada sobre as colunas
+            conjunto = ConjuntoRegistros()
+            conjunto.carregar(registros_brutos)
+            self._exibir_totais(conjunto.somar(filtro))
+            return
 
-    def calcular_totais(self, registros_brutos, filtro=""):
-        try:
-            totais_dict = {}
-        
-            # Processamento manual
-            for registro in registros_brutos:
-                quantidade = int(registro['quantidade'])
-                chave = (registro['cliente'], registro['pallet'])
-                totais_dict[chave] = totais_dict.get(chave, 0) + registro['quantidade']
-        
-            # Formatação dos resultados
-            self.totais = [{
-                'cliente': cliente,
-                'pallet': pallet,
-                'total': str(total),
-                'viewclass': 'TotalItem'
-            } for (cliente, pallet), total in totais_dict.items()]
+        saldo_em = self._saldo_em
+        if self._totais_ids is not None and not saldo_em:
+            # Já lidos: o listener mantém os totais em dia, sem nova leitura
+            self._exibir_totais_ids(self._totais_ids)
+            return
+
+        # Totais lidos do servidor: custo proporcional aos pares (cliente, pallet)
+        pares = [
+            (dados['id'], pallet_id)
+            for dados in self.client_manager.clientes.values()
+            for pallet_id in dados['pallet_ids'].values()
+        ]
+        paginador = self.paginador
+
+        def exibir(resultado):
+            if not saldo_em and self.listener and paginador is self.paginador:
+                # Base para os deltas; gravações chegadas durante a leitura podem
+                # ficar de fora até a próxima releitura (reabrir a tela)
+                self._totais_ids = dict(resultado[0])
+            self._exibir_totais_ids(resultado[0])
+
+        def calcular(db):
+            if saldo_em:
+                # Saldos na data final: último fechamento + movimentos posteriores
+                cliente_id, fim = saldo_em
+                clientes = [cliente_id] if cliente_id else {ids[0] for ids in pares}
+                tarefa = lambda: (saldos.saldos_em(db, fim, clientes), 'fechamentos')
+            else:
+                tarefa = lambda: saldos.calcular_totais(db, pares)
 
-            self.ids.rv_totais.data = self.totais
+            ExecutorIO.get_instance().submeter(
+                tarefa,
+                ao_concluir=exibir,
+                ao_falhar=lambda e: print(f"Erro ao calcular totais: {e}"),
+                dono=self)
 
-        except Exception as e:
-            print(f"Erro ao calcular totais: {e}")
+        App.get_running_app().quando_conectado(calcular)
+
+    # --- Relatórios por período (resumos mensais) ---
+    AGRUPAMENTOS_RELATORIO = {"Diário": 'diario', "Semanal": 'semanal', "Mensal": 'mensal'}
+
+    def gerar_relatorio(self):
+        """Entradas, saídas e pallet-dias do cliente/período escolhidos (padrão: últimos 12 meses)"""
+        periodo = self._ler_periodo()
+        if periodo is None:
+            return
+        cliente, inicio, fim = periodo
+        fim = fim or datetime.now()
+        if inicio is None:
+            mes = fim.year * 12 + fim.month - 12  # Primeiro dia do mês, 11 meses antes do final
+            inicio = fim.replace(year=mes // 12, month=mes % 12 + 1, day=1)
+        cliente_id = self.client_manager.clientes.get(cliente, {}).get('id', cliente) if cliente else None
+        agrupamento = self.AGRUPAMENTOS_RELATORIO[self.ids.agrupamento_relatorio.text]
+        import relatorios  # Só carregado na primeira visita à aba
+
+        def exibir(linhas):
+            self.ids.rv_relatorio.data = [{
+                'cliente': self.client_manager.nomes(linha['cliente_id'], '')[0],
+                'periodo': linha['periodo'],
+                'entrada': str(linha['entrada']),
+                'saida': str(linha['saida']),
+                'liquido': str(linha['liquido']),
+                'pallet_dias': str(linha['pallet_dias']),
+                'viewclass': 'RelatorioItem'
+            } for linha in linhas]
+
+        App.get_running_app().quando_conectado(lambda db: ExecutorIO.get_instance().submeter(
+            relatorios.relatorio, db, inicio, fim, agrupamento, cliente_id,
+            ao_concluir=exibir,
+            ao_falhar=lambda e: self.mostrar_popup("Erro", f"Falha ao gerar o relatório: {e}"),
+            dono=self))
+
+    def _exibir_totais_ids(self, totais_ids):
+        # Totais vêm por IDs; os nomes são os atuais (inclusive de pallets removidos)
+        totais_dict = {}
+        for ids, total in totais_ids.items():
+            chave = self.client_manager.nomes(*ids)
+            totais_dict[chave] = totais_dict.get(chave, 0) + total
+        self._exibir_totais(totais_dict)
+
+    @perfilado
+    def _exibir_totais(self, totais_dict):
+        # Formatação dos resultados
+        self.totais = [{
+            'cliente': cliente,
+            'pallet': pallet,
+            'total': str(total),
+            'viewclass': 'TotalItem'
+        } for (cliente, pallet), total in sorted(totais_dict.items())]
+
+        self.ids.rv_totais.data = self.totais
 
     # Filtro específico para totais
     def _filtro_totais(self, item, filtro):
@@ -1554,25 +1839,137 @@ class TelaConsulta(Screen):
     # Método de mudança de aba atualizado
     def on_tab_change(self, instance, value):
         if value and value.text in ['Histórico Completo', 'Totais por Cliente']:
-            self.carregar_registros()
+            self.processar_dados()  # Usa os registros já carregados em memória
+            Clock.schedule_once(self.verificar_rolagem)
+        elif value and value.text == 'Relatórios' and not self.ids.rv_relatorio.data:
+            self.gerar_relatorio()
+
+    def mostrar_popup(self, titulo, mensagem):
+        content = BoxLayout(orientation='vertical', padding=10)
+
+        lbl_mensagem = Label(
+            text=mensagem,
+            font_size=24,
+            color=get_color_from_hex('#000000'),
+            halign='center'
+        )
+
+        btn_ok = Button(
+            text="OK",
+            size_hint=(None, None),
+            size=(dp(120), dp(40)),
+            background_color=get_color_from_hex('#2E7D32'),
+            color=get_color_from_hex('#FFFFFF'),
+            pos_hint={'center_x': 0.5}
+        )
+
+        content.add_widget(lbl_mensagem)
+        content.add_widget(btn_ok)
+
+        popup = Popup(
+            title=titulo,
+            content=content,
+            size_hint=(0.7, 0.4),
+            separator_height=0,
+            background_color=get_color_from_hex('#FFFFFF'),
+            title_color=get_color_from_hex('#000000'),
+            title_size='26sp'
+        )
+
+        btn_ok.bind(on_press=popup.dismiss)
+        popup.open()
+
+
+class GerenciadorTelas(ScreenManager):
+    """ScreenManager que só constrói cada tela na primeira navegação até ela"""
+
+    def __init__(self, fabricas, **kwargs):
+        super().__init__(**kwargs)
+        self._fabricas = dict(fabricas)  # {nome: classe} das telas ainda não criadas
+
+    def tela_criada(self, nome):
+        """A tela, se já foi construída (None caso contrário); nunca a constrói"""
+        return next((tela for tela in self.screens if tela.name == nome), None)
+
+    def has_screen(self, name):
+        return name in self._fabricas or super().has_screen(name)
+
+    def get_screen(self, name):
+        # Chamado também ao trocar 'current': é aqui que a tela nasce
+        if name in self._fabricas:
+            self.add_widget(self._fabricas.pop(name)(name=name))
+        return super().get_screen(name)
 
 
 class PalletApp(App):
 
     def build(self):
-        FirebaseManager.get_instance()
+        if perfilador.ativo():
+            Perfilador.get_instance().iniciar()  # Antes das telas: a construção também é medida
+
+        # O banco conecta em segundo plano; a lista de clientes vem do cache até lá
+        self.client_manager = ClientManager(conectar=False)
+        self.db = None
+        self._ao_conectar = []  # Pedidos da interface feitos antes da conexão
+        threading.Thread(target=self._conectar, name='conexao-banco', daemon=True).start()
 
-        self.client_manager = ClientManager()
-        sm = ScreenManager()
+        sm = GerenciadorTelas({'registro': TelaRegistro, 'consulta': TelaConsulta, 'saida': TelaSaida})
         sm.add_widget(TelaInicial(name='inicio'))
-        sm.add_widget(TelaRegistro(name='registro'))
-        sm.add_widget(TelaConsulta(name='consulta'))
-        sm.add_widget(TelaSaida(name='saida'))
+
+        if instrumentacao.ativa():
+            Window.add_widget(PainelMetricas())
         return sm
 
+    def _conectar(self):
+        try:
+            FirebaseManager.get_instance()
+        except Exception as e:
+            Clock.schedule_once(lambda dt, erro=e: self._falha_conexao(erro))
+            return
+        Clock.schedule_once(self._conectado)
+
+    def _conectado(self, dt):
+        self.db = FirebaseManager.get_instance().db  # Já criado: não bloqueia
+        self.client_manager.conectar()
+        Sincronizador.get_instance().iniciar()  # Envia o diário local ao Firestore
+        pendentes, self._ao_conectar = self._ao_conectar, []
+        for funcao in pendentes:
+            funcao(self.db)
+
+    def quando_conectado(self, funcao):
+        """Chama funcao(db) na thread principal assim que o banco estiver pronto
+
+        A interface nunca chama FirebaseManager.get_instance() antes disso:
+        esperaria a conexão inteira com o loop do Kivy parado.
+        """
+        if self.db is not None:
+            funcao(self.db)
+        else:
+            self._ao_conectar.append(funcao)
+
+    def _falha_conexao(self, erro):
+        # Sem banco o app não funciona (antes a falha acontecia no build)
+        print(f"❌ Sem conexão com o banco: {erro}")
+        self.stop()
+
     def on_start(self):
-        # Garanta que o client_manager está vinculado
-        self.root.get_screen('registro').client_manager = self.client_manager
+        if os.environ.get(perfilador.VARIAVEL_PRIMEIRO_QUADRO, '') not in ('', '0'):
+            Window.bind(on_flip=self._primeiro_quadro)
+
+    def _primeiro_quadro(self, *args):
+        """Imprime o tempo do início do processo até o primeiro quadro e fecha o app (benchmark)"""
+        Window.unbind(on_flip=self._primeiro_quadro)
+        print(f"{perfilador.MARCA_PRIMEIRO_QUADRO}{(time.perf_counter() - INICIO) * 1000:.1f}", flush=True)
+        Clock.schedule_once(lambda dt: self.stop())
+
+    def on_stop(self):
+        self.client_manager.encerrar()
+        Sincronizador.get_instance().parar()
+        ExecutorIO.get_instance().encerrar()
+        if instrumentacao.ativa():
+            Metricas.get_instance().exportar()
+        if perfilador.ativo():
+            Perfilador.get_instance().exportar()
 
 
 if __name__ == '__main__':
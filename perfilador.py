@@ -0,0 +1,246 @@
+# Standard Library
+import argparse
+from collections import deque
+from datetime import datetime
+import functools
+import json
+import os
+import threading
+import time
+
+# Third-party
+from kivy.clock import Clock
+from kivy.uix.widget import Widget
+
+
+VARIAVEL_PERFIL = 'PALLET_PERFIL'  # '1' liga o perfilador de quadros/handlers
+VARIAVEL_ORCAMENTO = 'PALLET_PERFIL_ORCAMENTO_MS'
+ORCAMENTO_PADRAO_MS = 1000 / 60  # Um quadro a 60 FPS
+CAMINHO_PERFIL = 'perfil_ui.json'
+MAX_EVENTOS = 200_000  # Quadros e execuções guardados (os mais antigos são descartados)
+TECLA_EXPORTAR = 291  # F10
+VARIAVEL_PRIMEIRO_QUADRO = 'PALLET_PRIMEIRO_QUADRO'  # '1' mede a abertura até o primeiro quadro e fecha o app
+MARCA_PRIMEIRO_QUADRO = 'PRIMEIRO_QUADRO_MS='  # Prefixo da linha impressa (lida pelo benchmark)
+
+
+def ativo():
+    return os.environ.get(VARIAVEL_PERFIL, '') not in ('', '0')
+
+
+def _percentil(valores, p):
+    """Percentil pelo posto mais próximo (valores já ordenados)"""
+    if not valores:
+        return 0.0
+    posicao = max(0, min(len(valores) - 1, round(p / 100 * len(valores) + 0.5) - 1))
+    return valores[posicao]
+
+
+## ---> PERFILADOR DE QUADROS E HANDLERS <--- ##
+class Perfilador:
+    """Tempo de cada quadro e custo de cada handler de interface
+
+    Handlers marcados com @perfilado têm a duração medida e contam quantos
+    widgets foram criados e quantos clear_widgets() foram chamados durante a
+    execução. Handlers acima do orçamento de um quadro são avisados no
+    console. exportar() grava um trace no formato do Chrome (chrome://tracing
+    ou Perfetto) com um resumo que pode ser comparado entre builds.
+    """
+    _instance = None
+
+    def __init__(self, orcamento_ms=None):
+        self.orcamento_ms = orcamento_ms or float(
+            os.environ.get(VARIAVEL_ORCAMENTO, ORCAMENTO_PADRAO_MS))
+        self._inicio = time.perf_counter()
+        self._quadros = deque(maxlen=MAX_EVENTOS)     # (início em s, duração em ms)
+        self._execucoes = deque(maxlen=MAX_EVENTOS)   # Uma entrada por chamada de handler
+        self._pilha = []  # Contadores dos handlers em execução na thread principal
+        self._ultimo_quadro = None
+        self._iniciado = False
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = Perfilador()
+        return cls._instance
+
+    def iniciar(self):
+        if self._iniciado:
+            return
+        self._iniciado = True
+        self._instalar_contadores()
+        Clock.schedule_interval(self._ao_quadro, 0)
+
+        from kivy.core.window import Window
+        Window.bind(on_key_down=self._ao_teclar)
+
+    def _ao_teclar(self, window, tecla, *args):
+        if tecla == TECLA_EXPORTAR:
+            print(f"✅ Perfil exportado em '{self.exportar()}'.")
+            return True
+        return False
+
+    def _ao_quadro(self, dt):
+        agora = time.perf_counter()
+        if self._ultimo_quadro is not None:
+            self._quadros.append(
+                (self._ultimo_quadro - self._inicio, (agora - self._ultimo_quadro) * 1000))
+        self._ultimo_quadro = agora
+
+    def _instalar_contadores(self):
+        # Todo widget passa por Widget.__init__ e Widget.clear_widgets (via super)
+        perfilador = self
+        init_original = Widget.__init__
+        clear_original = Widget.clear_widgets
+
+        def __init__(widget, *args, **kwargs):
+            perfilador._contar('widgets_criados')
+            init_original(widget, *args, **kwargs)
+
+        def clear_widgets(widget, *args, **kwargs):
+            perfilador._contar('clear_widgets')
+            return clear_original(widget, *args, **kwargs)
+
+        Widget.__init__ = __init__
+        Widget.clear_widgets = clear_widgets
+
+    def _contar(self, campo):
+        if self._pilha and threading.current_thread() is threading.main_thread():
+            # Handlers aninhados: o custo conta para todos os que estão rodando
+            for contadores in self._pilha:
+                contadores[campo] += 1
+
+    def medir(self, nome, funcao, *args, **kwargs):
+        if threading.current_thread() is not threading.main_thread():
+            return funcao(*args, **kwargs)
+
+        contadores = {'widgets_criados': 0, 'clear_widgets': 0}
+        self._pilha.append(contadores)
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            self._pilha.pop()
+            excedeu = duracao_ms > self.orcamento_ms
+            self._execucoes.append(dict(
+                contadores, handler=nome, inicio=inicio - self._inicio,
+                duracao_ms=duracao_ms, excedeu=excedeu))
+            if excedeu:
+                print(f"⚠️ {nome} levou {duracao_ms:.1f}ms (orçamento {self.orcamento_ms:.1f}ms): "
+                      f"{contadores['widgets_criados']} widgets criados, "
+                      f"{contadores['clear_widgets']} clear_widgets")
+
+    # --- Resumo e exportação ---
+    def resumo(self):
+        duracoes = sorted(duracao for _, duracao in self._quadros)
+        handlers = {}
+        for execucao in self._execucoes:
+            handlers.setdefault(execucao['handler'], []).append(execucao)
+
+        por_handler = {}
+        for nome, execucoes in sorted(handlers.items()):
+            tempos = sorted(execucao['duracao_ms'] for execucao in execucoes)
+            por_handler[nome] = {
+                'chamadas': len(execucoes),
+                'p50_ms': round(_percentil(tempos, 50), 3),
+                'p95_ms': round(_percentil(tempos, 95), 3),
+                'max_ms': round(tempos[-1], 3),
+                'widgets_criados': sum(execucao['widgets_criados'] for execucao in execucoes),
+                'clear_widgets': sum(execucao['clear_widgets'] for execucao in execucoes),
+                'acima_do_orcamento': sum(execucao['excedeu'] for execucao in execucoes)
+            }
+
+        return {
+            'orcamento_ms': round(self.orcamento_ms, 3),
+            'quadros': {
+                'total': len(duracoes),
+                'p50_ms': round(_percentil(duracoes, 50), 3),
+                'p95_ms': round(_percentil(duracoes, 95), 3),
+                'p99_ms': round(_percentil(duracoes, 99), 3),
+                'max_ms': round(duracoes[-1], 3) if duracoes else 0.0,
+                'acima_do_orcamento': sum(duracao > self.orcamento_ms for duracao in duracoes)
+            },
+            'handlers': por_handler
+        }
+
+    def exportar(self, caminho=CAMINHO_PERFIL):
+        eventos = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': 'handlers'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 2, 'args': {'name': 'quadros'}},
+        ]
+        for execucao in self._execucoes:
+            eventos.append({
+                'name': execucao['handler'], 'cat': 'handler', 'ph': 'X', 'pid': 1, 'tid': 1,
+                'ts': round(execucao['inicio'] * 1e6), 'dur': round(execucao['duracao_ms'] * 1e3),
+                'args': {
+                    'widgets_criados': execucao['widgets_criados'],
+                    'clear_widgets': execucao['clear_widgets'],
+                    'acima_do_orcamento': execucao['excedeu']
+                }
+            })
+        for inicio, duracao in self._quadros:
+            eventos.append({
+                'name': 'quadro', 'cat': 'quadro', 'ph': 'X', 'pid': 1, 'tid': 2,
+                'ts': round(inicio * 1e6), 'dur': round(duracao * 1e3)
+            })
+
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'gerado_em': datetime.now().isoformat(timespec='seconds'),
+                'resumo': self.resumo(),
+                'traceEvents': eventos
+            }, arquivo, ensure_ascii=False)
+        return caminho
+
+
+def perfilado(funcao):
+    """Mede o handler quando PALLET_PERFIL está ligado; caso contrário não muda nada"""
+    if not ativo():
+        return funcao
+
+    nome = funcao.__qualname__
+
+    @functools.wraps(funcao)
+    def medido(*args, **kwargs):
+        return Perfilador.get_instance().medir(nome, funcao, *args, **kwargs)
+    return medido
+
+
+## ---> COMPARAÇÃO ENTRE BUILDS <--- ##
+def comparar(anterior, atual):
+    """Imprime, lado a lado, o resumo de dois arquivos de perfil"""
+    def linha(nome, antes, depois, campo):
+        valor_antes, valor_depois = antes.get(campo, 0), depois.get(campo, 0)
+        variacao = f"({(valor_depois - valor_antes) / valor_antes * 100:+.1f}%)" if valor_antes else ""
+        print(f"  {nome:<45} {campo:<20} {valor_antes:>10} -> {valor_depois:>10} {variacao}")
+
+    print("Quadros:")
+    for campo in ('p50_ms', 'p95_ms', 'p99_ms', 'acima_do_orcamento'):
+        linha('quadro', anterior['quadros'], atual['quadros'], campo)
+
+    print("Handlers (p95 e widgets criados por chamada):")
+    for nome in sorted(set(anterior['handlers']) | set(atual['handlers'])):
+        antes = dict(anterior['handlers'].get(nome, {}))
+        depois = dict(atual['handlers'].get(nome, {}))
+        for resumo in (antes, depois):
+            if resumo.get('chamadas'):
+                resumo['widgets_por_chamada'] = round(resumo['widgets_criados'] / resumo['chamadas'], 1)
+        linha(nome, antes, depois, 'p95_ms')
+        linha(nome, antes, depois, 'widgets_por_chamada')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dois arquivos de perfil da interface")
+    parser.add_argument('anterior', help="perfil_ui.json do build anterior")
+    parser.add_argument('atual', help="perfil_ui.json do build atual")
+    args = parser.parse_args()
+
+    with open(args.anterior, encoding='utf-8') as arquivo:
+        anterior = json.load(arquivo)['resumo']
+    with open(args.atual, encoding='utf-8') as arquivo:
+        atual = json.load(arquivo)['resumo']
+    comparar(anterior, atual)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+def reconciliar_dados(atuais, chaves, campo, criar, atualizar=None):
+    """Reconcilia a lista de dicionários de um RecycleView pela chave 'campo'
+
+    Linhas que continuam na lista são reaproveitadas com o estado que tinham
+    (quantidade digitada, erro...); só as chaves novas chamam criar().
+
+    atuais: rv.data atual; chaves: valores de 'campo' na ordem desejada;
+    criar(chave) monta o dicionário de uma linha nova; atualizar(linha, chave),
+    se informado, ajusta uma linha existente e retorna True se ela mudou.
+
+    Retorna (linhas, alterado). Com alterado False a lista atual pode ser
+    mantida: reatribuir rv.data redesenharia as linhas visíveis à toa.
+    """
+    existentes = {linha[campo]: linha for linha in atuais}
+    linhas = []
+    alterado = len(existentes) != len(chaves)
+
+    for posicao, chave in enumerate(chaves):
+        linha = existentes.get(chave)
+        if linha is None:
+            linha = criar(chave)
+            alterado = True
+        else:
+            if atualizar and atualizar(linha, chave):
+                alterado = True
+            if not alterado and atuais[posicao] is not linha:
+                alterado = True  # Mesmas chaves em outra ordem
+        linhas.append(linha)
+
+    return linhas, alterado
+
+
+def reconciliar_widgets(container, chaves, chave_de, criar, atualizar=None):
+    """Reconcilia os filhos de um layout com a lista de chaves
+
+    chave_de(widget) identifica um filho; criar(chave) cria o widget de uma
+    chave nova; atualizar(widget, chave), se informado, ajusta um existente.
+    Só os widgets removidos, criados ou fora de posição são mexidos.
+    Retorna o número de alterações feitas no layout.
+    """
+    desejadas = set(chaves)
+    existentes = {}
+    alteracoes = 0
+
+    for widget in list(container.children):
+        chave = chave_de(widget)
+        if chave in desejadas and chave not in existentes:
+            existentes[chave] = widget
+        else:
+            container.remove_widget(widget)
+            alteracoes += 1
+
+    # Kivy guarda os filhos em ordem inversa: children[-1] é o primeiro na tela
+    for posicao, chave in enumerate(chaves):
+        widget = existentes.get(chave)
+        if widget is None:
+            widget = criar(chave)
+        else:
+            if atualizar:
+                atualizar(widget, chave)
+            filhos = container.children
+            if filhos[len(filhos) - 1 - posicao] is widget:
+                continue
+            container.remove_widget(widget)
+
+        container.add_widget(widget, index=len(container.children) - posicao)
+        alteracoes += 1
+
+    return alteracoes
@@ -0,0 +1,206 @@
+# Standard Library
+import argparse
+from datetime import date, timedelta
+
+# Banco de Dados
+from firebase_manager import FirebaseManager
+from firestore_adiado import FieldFilter
+from exportacao import nomes_do_servidor
+import saldos
+
+
+# Início do período de cada dia, por agrupamento
+AGRUPAMENTOS = {
+    'diario': lambda dia: dia,
+    'semanal': lambda dia: dia - timedelta(days=dia.weekday()),  # Semanas começam na segunda
+    'mensal': lambda dia: dia.replace(day=1)
+}
+FORMATOS_PERIODO = {'diario': "%d/%m/%Y", 'semanal': "Semana de %d/%m/%Y", 'mensal': "%m/%Y"}
+
+
+def rotulo_periodo(inicio, agrupamento):
+    return inicio.strftime(FORMATOS_PERIODO[agrupamento])
+
+
+def fim_periodo(inicio, agrupamento):
+    """Último dia do período que começa em 'inicio'"""
+    if agrupamento == 'semanal':
+        return inicio + timedelta(days=6)
+    if agrupamento == 'mensal':
+        return (inicio + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    return inicio
+
+
+def _dia(data):
+    """date de 'dd/mm/aaaa', date ou datetime (None se inválida)"""
+    valor = saldos.data_registro(data)
+    return valor.date() if valor is not None else None
+
+
+## ---> RESUMOS MENSAIS <--- ##
+def _resumos(db, cliente_id, desde):
+    """Resumos do cliente (ou de todos) do mês de 'desde' em diante"""
+    query = db.collection(saldos.COLECAO_RESUMOS).where(filter=FieldFilter('mes', '>=', f"{desde:%Y-%m}"))
+    if cliente_id:
+        query = query.where(filter=FieldFilter('cliente_id', '==', cliente_id))
+    return query.stream()
+
+
+def _movimentos_por_dia(db, cliente_id, inicio):
+    """Percorre os resumos a partir de 'inicio' e gera (dia, cliente_id, pallet_id, entrada, saida)"""
+    for doc in _resumos(db, cliente_id, inicio):
+        dados = doc.to_dict()
+        ano, mes = map(int, dados['mes'].split('-'))
+        for texto_dia, pallets in dados.get('dias', {}).items():
+            dia = date(ano, mes, int(texto_dia))
+            if dia < inicio:
+                continue
+            for pallet_id, valores in pallets.items():
+                yield dia, dados['cliente_id'], pallet_id, valores.get('entrada', 0), valores.get('saida', 0)
+
+
+def reconstruir_resumos(db):
+    """Regrava todos os resumos a partir dos registros; retorna quantos documentos gravou
+
+    Necessário uma vez nas bases que já tinham registros antes dos resumos
+    (e sempre que registros forem apagados direto no console). Rode com o
+    app parado: movimentos gravados durante a reconstrução podem se perder.
+    """
+    resumos = {}
+    campos = ['cliente_id', 'pallet_id', 'quantidade', 'data_registro']
+    for doc in db.collection(saldos.COLECAO_REGISTROS).select(campos).stream():
+        dados = doc.to_dict()
+        valor_data = dados.get('data_registro')
+        if valor_data is None:
+            continue
+        cliente_id, quantidade = dados.get('cliente_id', ''), int(dados.get('quantidade', 0))
+        resumo = resumos.setdefault(saldos.id_resumo(cliente_id, valor_data), {
+            'cliente_id': cliente_id, 'mes': f"{valor_data:%Y-%m}", 'dias': {}})
+        valores = resumo['dias'].setdefault(f"{valor_data:%d}", {}).setdefault(dados.get('pallet_id', ''), {})
+        campo = 'entrada' if quantidade >= 0 else 'saida'
+        valores[campo] = valores.get(campo, 0) + abs(quantidade)
+
+    resumos_ref = db.collection(saldos.COLECAO_RESUMOS)
+    obsoletos = [doc.reference for doc in resumos_ref.select([]).stream() if doc.id not in resumos]
+    escritas = [('set', resumos_ref.document(id_resumo), dados) for id_resumo, dados in resumos.items()]
+    escritas += [('delete', referencia, None) for referencia in obsoletos]
+    for inicio in range(0, len(escritas), saldos.LIMITE_BATCH):
+        batch = db.batch()
+        for operacao, referencia, dados in escritas[inicio:inicio + saldos.LIMITE_BATCH]:
+            if operacao == 'set':
+                batch.set(referencia, dados)
+            else:
+                batch.delete(referencia)
+        batch.commit()
+    return len(resumos)
+
+
+## ---> RELATÓRIO POR PERÍODO <--- ##
+def relatorio(db, inicio, fim, agrupamento='mensal', cliente_id=None):
+    """Entradas, saídas, líquido e pallet-dias por cliente e período entre as datas (inclusivas)
+
+    Lê só os resumos mensais (um documento por cliente e mês) de 'inicio'
+    em diante e os saldos atuais do ledger. O saldo no começo do período é o
+    atual menos o líquido dos resumos daí para frente; pallet-dias soma, a
+    cada dia, o saldo de cada pallet no fim do dia (saldos negativos não
+    contam). Retorna uma lista de dicionários ordenada por cliente e período.
+    """
+    inicio, fim = _dia(inicio), _dia(fim)
+    if inicio is None or fim is None or inicio > fim:
+        raise ValueError("Período inválido (use dd/mm/aaaa, com a data inicial antes da final)")
+    inicio_periodo = AGRUPAMENTOS[agrupamento]
+
+    movimentos = {}  # dia -> [(par, entrada, saida)]
+    liquido_desde_inicio = {}
+    for dia, id_cliente, pallet_id, entrada, saida in _movimentos_por_dia(db, cliente_id, inicio):
+        par = (id_cliente, pallet_id)
+        liquido_desde_inicio[par] = liquido_desde_inicio.get(par, 0) + entrada - saida
+        if dia <= fim:
+            movimentos.setdefault(dia, []).append((par, entrada, saida))
+
+    if cliente_id:
+        atuais = {
+            (cliente_id, pallet_id): saldo
+            for pallet_id, saldo in saldos.obter_saldos_cliente(db, cliente_id).items()
+        }
+    else:
+        atuais = saldos.obter_todos_saldos(db)
+    saldo_pares = {
+        par: atuais.get(par, 0) - liquido_desde_inicio.get(par, 0)
+        for par in set(atuais) | set(liquido_desde_inicio)
+    }
+    ocupacao = {}  # cliente_id -> soma dos saldos positivos dos seus pallets
+    for (id_cliente, _), saldo in saldo_pares.items():
+        ocupacao[id_cliente] = ocupacao.get(id_cliente, 0) + max(saldo, 0)
+
+    linhas = {}
+
+    def linha(id_cliente, periodo):
+        chave = (id_cliente, periodo)
+        if chave not in linhas:
+            linhas[chave] = {
+                'cliente_id': id_cliente,
+                'inicio': max(periodo, inicio),
+                'fim': min(fim_periodo(periodo, agrupamento), fim),
+                'periodo': rotulo_periodo(periodo, agrupamento),
+                'entrada': 0, 'saida': 0, 'liquido': 0, 'pallet_dias': 0
+            }
+        return linhas[chave]
+
+    dia = inicio
+    while dia <= fim:
+        periodo = inicio_periodo(dia)
+        for par, entrada, saida in movimentos.get(dia, ()):
+            atual = linha(par[0], periodo)
+            atual['entrada'] += entrada
+            atual['saida'] += saida
+            atual['liquido'] += entrada - saida
+            antes = saldo_pares.get(par, 0)
+            saldo_pares[par] = antes + entrada - saida
+            ocupacao[par[0]] = ocupacao.get(par[0], 0) + max(saldo_pares[par], 0) - max(antes, 0)
+        for id_cliente, pallets in ocupacao.items():
+            if pallets:
+                linha(id_cliente, periodo)['pallet_dias'] += pallets
+        dia += timedelta(days=1)
+
+    return [linhas[chave] for chave in sorted(linhas)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Relatório de entradas, saídas e pallet-dias por período, a partir dos resumos mensais")
+    parser.add_argument('comando', choices=['gerar', 'reconstruir'],
+                        help="'reconstruir' regrava os resumos a partir dos registros (bases antigas)")
+    parser.add_argument('--de', help="Data inicial (dd/mm/aaaa)")
+    parser.add_argument('--ate', help="Data final (dd/mm/aaaa; padrão: hoje)")
+    parser.add_argument('--agrupamento', choices=list(AGRUPAMENTOS), default='mensal')
+    parser.add_argument('--cliente', help="Nome do cliente (padrão: todos)")
+    args = parser.parse_args()
+
+    db = FirebaseManager.get_instance().db
+
+    if args.comando == 'reconstruir':
+        print(f"✅ {reconstruir_resumos(db)} resumo(s) mensal(is) gravado(s).")
+        return
+
+    nomes, ids_clientes = nomes_do_servidor(db)
+    if args.cliente and args.cliente not in ids_clientes:
+        print(f"❌ Cliente não encontrado: {args.cliente}")
+        raise SystemExit(1)
+
+    try:
+        linhas = relatorio(
+            db, args.de, args.ate or date.today(), args.agrupamento, ids_clientes.get(args.cliente))
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+    print(f"{'Cliente':<30} {'Período':<22} {'Entradas':>9} {'Saídas':>9} {'Líquido':>9} {'Pallet-dias':>12}")
+    for item in linhas:
+        cliente = nomes(item['cliente_id'], '')[0]
+        print(f"{cliente:<30} {item['periodo']:<22} {item['entrada']:>9} {item['saida']:>9} "
+              f"{item['liquido']:>9} {item['pallet_dias']:>12}")
+
+
+if __name__ == '__main__':
+    main()
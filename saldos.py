@@ -0,0 +1,438 @@
+# Standard Library
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import quote
+
+# Banco de Dados
+from firebase_manager import FirebaseManager
+from firestore_adiado import FieldFilter, firestore
+
+
+COLECAO_REGISTROS = 'registros'
+COLECAO_SALDOS = 'saldos'
+COLECAO_FECHAMENTOS = 'fechamentos'
+COLECAO_RESUMOS = 'resumos'
+LIMITE_BATCH = 500  # Máximo de operações por batch no Firestore
+ESCRITAS_POR_MOVIMENTO = 3  # Registro + saldo + resumo do mês
+FORMATO_DATA = "%d/%m/%Y"  # Formato do campo 'data' digitado nos formulários
+MARGEM_RELOGIO = timedelta(minutes=5)  # Gravações mais novas ficam para o próximo fechamento
+FECHAMENTOS_PARALELOS = 8  # Clientes processados ao mesmo tempo
+
+
+## ---> DATA CONSULTÁVEL DOS REGISTROS <--- ##
+def data_registro(data):
+    """Converte 'dd/mm/aaaa' (ou date) no timestamp gravado em 'data_registro'
+
+    Retorna None se a data não for válida. O horário é meia-noite UTC, para
+    que o mesmo dia gere sempre o mesmo valor em qualquer aparelho.
+    """
+    if isinstance(data, datetime):
+        data = data.date()
+    if not isinstance(data, date):
+        try:
+            data = datetime.strptime(str(data).strip(), FORMATO_DATA).date()
+        except ValueError:
+            return None
+    return datetime(data.year, data.month, data.day, tzinfo=timezone.utc)
+
+
+def query_periodo(db, cliente_id=None, inicio=None, fim=None, pallet_id=None):
+    """Consulta de 'registros' por cliente/pallet (IDs) e intervalo de datas (inclusivo)
+
+    A consulta sai ordenada por data_registro decrescente e usa os índices
+    compostos de firestore.indexes.json. Registros ainda sem 'data_registro'
+    não aparecem: rode 'python saldos.py migrar-datas' nas bases antigas.
+    """
+    query = db.collection(COLECAO_REGISTROS)
+    if cliente_id:
+        query = query.where(filter=FieldFilter('cliente_id', '==', cliente_id))
+    if pallet_id:
+        query = query.where(filter=FieldFilter('pallet_id', '==', pallet_id))
+    if inicio is not None:
+        query = query.where(filter=FieldFilter('data_registro', '>=', data_registro(inicio)))
+    if fim is not None:
+        query = query.where(filter=FieldFilter('data_registro', '<=', data_registro(fim)))
+    return query.order_by('data_registro', direction=firestore.Query.DESCENDING) \
+                .order_by('timestamp', direction=firestore.Query.DESCENDING)
+
+
+def migrar_datas(db):
+    """Preenche 'data_registro' nos registros que ainda não têm o campo
+
+    Pode ser interrompida e rodada de novo: registros já migrados são
+    pulados. Retorna (atualizados, ids_com_data_invalida).
+    """
+    registros_ref = db.collection(COLECAO_REGISTROS)
+    atualizados, invalidos = 0, []
+    batch, operacoes = db.batch(), 0
+    for doc in registros_ref.select(['data', 'data_registro']).stream():
+        dados = doc.to_dict()
+        if dados.get('data_registro') is not None:
+            continue
+
+        valor = data_registro(dados.get('data', ''))
+        if valor is None:
+            invalidos.append(doc.id)
+            continue
+
+        batch.update(doc.reference, {'data_registro': valor})
+        operacoes += 1
+        if operacoes == LIMITE_BATCH:
+            batch.commit()
+            atualizados += operacoes
+            batch, operacoes = db.batch(), 0
+
+    if operacoes:
+        batch.commit()
+        atualizados += operacoes
+    return atualizados, invalidos
+
+
+## ---> LEDGER DE SALDOS POR (CLIENTE, PALLET) <--- ##
+# Registros e saldos referenciam clientes e pallets pelos IDs do catálogo
+# (catalogo.py): os nomes ficam só no documento do cliente.
+def id_saldo(cliente_id, pallet_id):
+    """ID determinístico do documento de saldo de um par (cliente_id, pallet_id)"""
+    # Os IDs do Firestore não aceitam '/', então o par é codificado
+    return quote(f"{cliente_id}|{pallet_id}", safe='')
+
+
+def id_resumo(cliente_id, data):
+    """ID do resumo mensal de um cliente (data: qualquer dia do mês)"""
+    return quote(f"{cliente_id}|{data:%Y-%m}", safe='')
+
+
+def adicionar_movimento(db, batch, cliente_id, pallet_id, quantidade, data, id_registro=None):
+    """Inclui no batch o registro do movimento, o incremento do saldo e o do resumo do mês
+
+    Com id_registro o registro é criado com esse ID e o batch inteiro falha
+    (AlreadyExists) se ele já existir, o que evita aplicar o saldo duas vezes.
+    """
+    dados = {
+        'cliente_id': cliente_id,
+        'pallet_id': pallet_id,
+        'quantidade': quantidade,
+        'data': data,
+        'timestamp': firestore.SERVER_TIMESTAMP
+    }
+    valor_data = data_registro(data)
+    if valor_data is not None:
+        dados['data_registro'] = valor_data
+    if id_registro is None:
+        registro_ref = db.collection(COLECAO_REGISTROS).document()
+        batch.set(registro_ref, dados)
+    else:
+        registro_ref = db.collection(COLECAO_REGISTROS).document(id_registro)
+        batch.create(registro_ref, dados)
+
+    # O saldo é atualizado na mesma escrita do registro
+    saldo_ref = db.collection(COLECAO_SALDOS).document(id_saldo(cliente_id, pallet_id))
+    batch.set(saldo_ref, {
+        'cliente_id': cliente_id,
+        'pallet_id': pallet_id,
+        'saldo': firestore.Increment(quantidade),
+        'atualizado_em': firestore.SERVER_TIMESTAMP
+    }, merge=True)
+
+    if valor_data is not None:
+        # resumos/{id_resumo} = {'cliente_id', 'mes', 'dias': {'dd': {pallet_id: {'entrada', 'saida'}}}}
+        batch.set(db.collection(COLECAO_RESUMOS).document(id_resumo(cliente_id, valor_data)), {
+            'cliente_id': cliente_id,
+            'mes': f"{valor_data:%Y-%m}",
+            'dias': {f"{valor_data:%d}": {pallet_id: {
+                'entrada' if quantidade >= 0 else 'saida': firestore.Increment(abs(quantidade))
+            }}}
+        }, merge=True)
+    return registro_ref
+
+
+def registrar_movimento(db, cliente_id, pallet_id, quantidade, data):
+    """Grava um movimento (entrada > 0, saída < 0) junto com o seu saldo"""
+    batch = db.batch()
+    registro_ref = adicionar_movimento(db, batch, cliente_id, pallet_id, quantidade, data)
+    batch.commit()
+    return registro_ref
+
+
+def checar_limite(quantidade_movimentos):
+    """ValueError se os movimentos de um formulário não cabem num único batch"""
+    if quantidade_movimentos * ESCRITAS_POR_MOVIMENTO > LIMITE_BATCH:
+        raise ValueError(
+            f"Máximo de {LIMITE_BATCH // ESCRITAS_POR_MOVIMENTO} pallets por registro "
+            f"({quantidade_movimentos} informados)")
+
+
+def registrar_movimentos(db, movimentos):
+    """Grava todos os movimentos de um formulário num único commit atômico
+
+    movimentos: lista de tuplas (cliente_id, pallet_id, quantidade, data).
+    """
+    checar_limite(len(movimentos))
+    batch = db.batch()
+    registros_refs = [adicionar_movimento(db, batch, *movimento) for movimento in movimentos]
+    if registros_refs:
+        batch.commit()
+    return registros_refs
+
+
+def obter_saldos_cliente(db, cliente_id):
+    """Retorna {pallet_id: saldo} lendo apenas os documentos de saldo do cliente"""
+    query = db.collection(COLECAO_SALDOS).where(filter=FieldFilter('cliente_id', '==', cliente_id))
+    saldos_cliente = {}
+    for doc in query.stream():
+        dados = doc.to_dict()
+        saldos_cliente[dados.get('pallet_id', '')] = dados.get('saldo', 0)
+    return saldos_cliente
+
+
+def obter_todos_saldos(db):
+    """Retorna {(cliente_id, pallet_id): saldo} lendo um documento por par"""
+    totais = {}
+    for doc in db.collection(COLECAO_SALDOS).stream():
+        dados = doc.to_dict()
+        totais[(dados.get('cliente_id', ''), dados.get('pallet_id', ''))] = dados.get('saldo', 0)
+    return totais
+
+
+def somar_por_agregacao(db, pares):
+    """Soma 'quantidade' no servidor (aggregation query) para cada (cliente_id, pallet_id)
+
+    Cada par custa uma consulta de agregação, sem trazer os registros.
+    """
+    registros_ref = db.collection(COLECAO_REGISTROS)
+    totais = {}
+    for cliente_id, pallet_id in pares:
+        query = registros_ref.where(filter=FieldFilter('cliente_id', '==', cliente_id)) \
+                             .where(filter=FieldFilter('pallet_id', '==', pallet_id))
+        resultado = query.sum('quantidade', alias='total').get()
+        totais[(cliente_id, pallet_id)] = int(resultado[0][0].value or 0)
+    return totais
+
+
+def calcular_totais(db, pares=None):
+    """Totais por (cliente_id, pallet_id) pelo caminho mais barato disponível
+
+    Usa os documentos de saldo; se o ledger estiver vazio ou inacessível,
+    agrega no servidor os pares informados; por último soma os registros
+    no próprio aparelho. Com fechamentos gravados, antes da agregação tenta
+    o último fechamento + movimentos posteriores. Retorna (totais, modo_usado).
+    """
+    try:
+        totais = obter_todos_saldos(db)
+        if totais:
+            return totais, 'saldos'
+    except Exception as e:
+        print(f"Saldos indisponíveis: {e}")
+
+    if pares:
+        try:
+            # Último fechamento + movimentos posteriores, se já houver fechamentos
+            if db.collection(COLECAO_FECHAMENTOS).limit(1).get():
+                return saldos_em(db, clientes={cliente_id for cliente_id, _ in pares}), 'fechamentos'
+        except Exception as e:
+            print(f"Fechamentos indisponíveis: {e}")
+
+    if pares:
+        try:
+            return somar_por_agregacao(db, pares), 'agregacao'
+        except Exception as e:
+            print(f"Agregação no servidor indisponível: {e}")
+
+    return somar_registros(db), 'local'
+
+
+## ---> FECHAMENTOS: SALDOS POR DATA <--- ##
+# fechamentos/{id_fechamento} = {'cliente_id', 'data', 'corte', 'saldos': {pallet_id: saldo}}
+# O fechamento soma os movimentos com data_registro <= data gravados até
+# 'corte'. O saldo em qualquer data parte do último fechamento até ela e lê
+# só os movimentos posteriores, então o custo não cresce com o histórico.
+def id_fechamento(cliente_id, data):
+    return quote(f"{cliente_id}|{data_registro(data):%Y-%m-%d}", safe='')
+
+
+def _ultimo_fechamento(db, cliente_id, data=None):
+    """Fechamento mais recente do cliente até a data (inclusive), ou None"""
+    query = db.collection(COLECAO_FECHAMENTOS).where(filter=FieldFilter('cliente_id', '==', cliente_id))
+    if data is not None:
+        query = query.where(filter=FieldFilter('data', '<=', data_registro(data)))
+    docs = list(query.order_by('data', direction=firestore.Query.DESCENDING).limit(1).stream())
+    return docs[0].to_dict() if docs else None
+
+
+def saldo_cliente_em(db, cliente_id, data=None, corte=None):
+    """{pallet_id: saldo} do cliente com os movimentos até a data (None = todos)
+
+    Soma ao último fechamento até a data os movimentos com data posterior a
+    ele e os gravados depois dele com data já coberta (lançamentos
+    retroativos). Com 'corte' só entram movimentos gravados até esse instante.
+    """
+    fechamento = _ultimo_fechamento(db, cliente_id, data)
+    saldos_cliente = dict(fechamento['saldos']) if fechamento else {}
+    campos = ['pallet_id', 'quantidade', 'timestamp', 'data_registro']
+
+    def somar(docs, aceitar):
+        for doc in docs:
+            dados = doc.to_dict()
+            if corte is not None and (dados.get('timestamp') is None or dados['timestamp'] > corte):
+                continue
+            if aceitar(dados):
+                pallet_id = dados.get('pallet_id', '')
+                saldos_cliente[pallet_id] = saldos_cliente.get(pallet_id, 0) + int(dados.get('quantidade', 0))
+
+    inicio = fechamento['data'] + timedelta(days=1) if fechamento else None
+    somar(query_periodo(db, cliente_id, inicio, data).select(campos).stream(), lambda dados: True)
+    if fechamento:
+        retroativos = db.collection(COLECAO_REGISTROS) \
+            .where(filter=FieldFilter('cliente_id', '==', cliente_id)) \
+            .where(filter=FieldFilter('timestamp', '>', fechamento['corte']))
+        somar(retroativos.select(campos).stream(),
+              lambda dados: dados.get('data_registro') is not None
+              and dados['data_registro'] <= fechamento['data'])
+    return saldos_cliente
+
+
+def _clientes_com_saldo(db):
+    return {
+        doc.to_dict().get('cliente_id', '')
+        for doc in db.collection(COLECAO_SALDOS).select(['cliente_id']).stream()
+    }
+
+
+def saldos_em(db, data=None, clientes=None, paralelos=FECHAMENTOS_PARALELOS):
+    """{(cliente_id, pallet_id): saldo} na data (None = todos os movimentos)
+
+    clientes: IDs a consultar; sem eles, todos os clientes do ledger.
+    """
+    clientes = sorted(_clientes_com_saldo(db) if clientes is None else clientes)
+    with ThreadPoolExecutor(max_workers=paralelos, thread_name_prefix='fechamento') as executor:
+        por_cliente = executor.map(lambda cliente_id: saldo_cliente_em(db, cliente_id, data), clientes)
+        return {
+            (cliente_id, pallet_id): saldo
+            for cliente_id, saldos_cliente in zip(clientes, por_cliente)
+            for pallet_id, saldo in saldos_cliente.items()
+        }
+
+
+def fechar_saldos(db, data=None, paralelos=FECHAMENTOS_PARALELOS, margem=MARGEM_RELOGIO):
+    """Grava o fechamento de cada cliente na data (padrão: ontem); retorna quantos gravou
+
+    Cada fechamento parte do anterior. Movimentos gravados nos últimos
+    'margem' minutos (ainda em trânsito) ficam para as consultas somarem como
+    retroativos. Rodar de novo na mesma data apenas atualiza os fechamentos.
+    """
+    data = data_registro(data or date.today() - timedelta(days=1))
+    if data is None:
+        raise ValueError("Data inválida (use dd/mm/aaaa)")
+    corte = datetime.now(timezone.utc) - margem
+    fechamentos_ref = db.collection(COLECAO_FECHAMENTOS)
+
+    def fechar(cliente_id):
+        fechamentos_ref.document(id_fechamento(cliente_id, data)).set({
+            'cliente_id': cliente_id,
+            'data': data,
+            'corte': corte,
+            'saldos': saldo_cliente_em(db, cliente_id, data, corte),
+            'criado_em': firestore.SERVER_TIMESTAMP
+        })
+
+    clientes = sorted(_clientes_com_saldo(db))
+    with ThreadPoolExecutor(max_workers=paralelos, thread_name_prefix='fechamento') as executor:
+        list(executor.map(fechar, clientes))  # Propaga o erro de qualquer cliente
+    return len(clientes)
+
+
+## ---> RECONSTRUÇÃO E VERIFICAÇÃO <--- ##
+def somar_registros(db):
+    """Recalcula {(cliente_id, pallet_id): saldo} somando toda a coleção de registros"""
+    totais = {}
+    for doc in db.collection(COLECAO_REGISTROS).stream():
+        dados = doc.to_dict()
+        chave = (dados.get('cliente_id', ''), dados.get('pallet_id', ''))
+        totais[chave] = totais.get(chave, 0) + int(dados.get('quantidade', 0))
+    return totais
+
+
+def verificar_saldos(db, corrigir=False):
+    """Compara o ledger com os registros e retorna a lista de divergências
+
+    Cada divergência é uma tupla (cliente_id, pallet_id, saldo_gravado, saldo_real).
+    Com corrigir=True os saldos divergentes são regravados com o valor real.
+    """
+    esperados = somar_registros(db)
+
+    gravados = {}
+    for doc in db.collection(COLECAO_SALDOS).stream():
+        dados = doc.to_dict()
+        chave = (dados.get('cliente_id', ''), dados.get('pallet_id', ''))
+        gravados[chave] = dados.get('saldo', 0)
+
+    divergencias = [
+        (cliente_id, pallet_id, gravados.get((cliente_id, pallet_id), 0), esperados.get((cliente_id, pallet_id), 0))
+        for cliente_id, pallet_id in sorted(set(esperados) | set(gravados))
+        if gravados.get((cliente_id, pallet_id), 0) != esperados.get((cliente_id, pallet_id), 0)
+    ]
+
+    if corrigir and divergencias:
+        saldos_ref = db.collection(COLECAO_SALDOS)
+        for inicio in range(0, len(divergencias), LIMITE_BATCH):
+            batch = db.batch()
+            for cliente_id, pallet_id, _, real in divergencias[inicio:inicio + LIMITE_BATCH]:
+                batch.set(saldos_ref.document(id_saldo(cliente_id, pallet_id)), {
+                    'cliente_id': cliente_id,
+                    'pallet_id': pallet_id,
+                    'saldo': real,
+                    'atualizado_em': firestore.SERVER_TIMESTAMP
+                })
+            batch.commit()
+
+    return divergencias
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Verifica ou reconstrói os saldos de pallets a partir dos registros")
+    parser.add_argument(
+        'comando', choices=['verificar', 'reconstruir', 'migrar-datas', 'fechar'],
+        help="'verificar' apenas relata divergências; 'reconstruir' também corrige; "
+             "'migrar-datas' preenche data_registro nos registros antigos; "
+             "'fechar' grava os saldos de cada cliente numa data")
+    parser.add_argument('--data', help="Data do fechamento (dd/mm/aaaa; padrão: ontem)")
+    args = parser.parse_args()
+
+    db = FirebaseManager.get_instance().db
+
+    if args.comando == 'fechar':
+        try:
+            clientes = fechar_saldos(db, args.data)
+        except ValueError as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+        print(f"✅ Fechamento gravado para {clientes} cliente(s).")
+        return
+
+    if args.comando == 'migrar-datas':
+        atualizados, invalidos = migrar_datas(db)
+        print(f"✅ {atualizados} registro(s) atualizado(s).")
+        for id_registro in invalidos:
+            print(f"⚠️ Data inválida no registro {id_registro}")
+        if invalidos:
+            raise SystemExit(1)
+        return
+
+    divergencias = verificar_saldos(db, corrigir=args.comando == 'reconstruir')
+
+    for cliente, pallet, gravado, real in divergencias:
+        print(f"⚠️ {cliente} / {pallet}: gravado={gravado} real={real}")
+
+    if not divergencias:
+        print("✅ Nenhuma divergência encontrada.")
+    elif args.comando == 'reconstruir':
+        print(f"✅ {len(divergencias)} saldo(s) corrigido(s).")
+    else:
+        print(f"❌ {len(divergencias)} divergência(s) encontrada(s).")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
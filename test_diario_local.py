@@ -0,0 +1,61 @@
+# Standard Library
+import os
+import tempfile
+import unittest
+
+# Banco de Dados
+from banco_local import BancoLocal
+from diario_local import DiarioLocal, Sincronizador
+from firebase_manager import FirebaseManager
+import catalogo
+import saldos
+
+
+class TestClienteCriadoEmDoisAparelhos(unittest.TestCase):
+    """Dois aparelhos criam offline o mesmo cliente, com o mesmo pallet"""
+
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.db = BancoLocal()
+        FirebaseManager.usar_banco(self.db)
+
+    def tearDown(self):
+        FirebaseManager._instance = None
+        self.pasta.cleanup()
+
+    def _aparelho(self, nome, cliente_id, pallet_id):
+        diario = DiarioLocal(os.path.join(self.pasta.name, f'{nome}.db'))
+        diario.registrar('adicionar_cliente', {'cliente_id': cliente_id, 'nome': 'Acme', 'criado_por': nome})
+        diario.registrar('adicionar_pallet', {'cliente_id': cliente_id, 'pallet_id': pallet_id, 'nome': 'PBR'})
+        diario.registrar_movimentos([(cliente_id, pallet_id, 10, '01/01/2025')])
+        return diario
+
+    def test_pallets_com_o_mesmo_nome_viram_um_so(self):
+        primeiro = self._aparelho('a', 'ca', 'pa')
+        segundo = self._aparelho('b', 'cb', 'pb')
+
+        Sincronizador(primeiro).sincronizar()
+        Sincronizador(segundo).sincronizar()
+
+        self.assertEqual(segundo.quantidade_pendente(), 0)
+        cliente = self.db.collection(catalogo.COLECAO_CLIENTES).document('ca').get().to_dict()
+        self.assertEqual(cliente['pallets'], {'pa': 'PBR'})
+        self.assertFalse(self.db.collection(catalogo.COLECAO_CLIENTES).document('cb').get().exists)
+        self.assertEqual(saldos.obter_saldos_cliente(self.db, 'ca'), {'pa': 20})
+
+    def test_pallet_de_nome_novo_continua_no_cliente_existente(self):
+        primeiro = self._aparelho('a', 'ca', 'pa')
+        segundo = self._aparelho('b', 'cb', 'pb')
+        segundo.registrar('adicionar_pallet', {'cliente_id': 'cb', 'pallet_id': 'pc', 'nome': 'Chep'})
+        segundo.registrar_movimentos([('cb', 'pc', 5, '01/01/2025')])
+
+        Sincronizador(primeiro).sincronizar()
+        Sincronizador(segundo).sincronizar()
+
+        cliente = self.db.collection(catalogo.COLECAO_CLIENTES).document('ca').get().to_dict()
+        self.assertEqual(cliente['pallets'], {'pa': 'PBR', 'pc': 'Chep'})
+        self.assertEqual(saldos.obter_saldos_cliente(self.db, 'ca'), {'pa': 20, 'pc': 5})
+
+
+if __name__ == '__main__':
+    unittest.main()